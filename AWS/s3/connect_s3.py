@@ -4,6 +4,8 @@ from botocore.exceptions import ClientError
 import json
 import logging
 
+from monitoring.spans import span
+
 # Configure logging
 logger = logging.getLogger("AWS.S3Manager")
 logger.setLevel(logging.WARNING)  # Set logging level to WARNING to reduce noise
@@ -15,7 +17,17 @@ class S3Manager:
     def __init__(self):
         """
         Initialize S3 client using environment variables.
+
+        When S3_LOCAL_ROOT is set, objects are read from and written to that
+        local directory instead of AWS (used by tests and load tests).
         """
+        local_root = os.getenv('S3_LOCAL_ROOT')
+        if local_root:
+            from AWS.s3.local_s3 import LocalS3Client
+            self.bucket_name = os.getenv('S3_BUCKET_NAME', 'local')
+            self.s3_client = LocalS3Client(local_root)
+            return
+
         # Load AWS credentials from environment variables
         self.aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
         self.aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
@@ -90,30 +102,40 @@ class S3Manager:
             bool: True if the file was downloaded successfully, False otherwise.
         """
         try:
-            self.s3_client.download_file(self.bucket_name, s3_key, local_path)
+            with span("s3.download", key=s3_key) as download:
+                self.s3_client.download_file(self.bucket_name, s3_key, local_path)
+                download.add_bytes(os.path.getsize(local_path))
             logger.info(f"Downloaded {s3_key} from S3 to {local_path}")
             return True
         except ClientError as e:
             logger.error(f"Error downloading file from S3: {e}")
             return False
 
-    def list_files(self, prefix=""):
+    def list_files(self, prefix="", start_after=None):
         """
         List files in the S3 bucket with a specific prefix.
 
         Args:
             prefix (str): Only list objects starting with this prefix.
+            start_after (str, optional): Only list keys sorting after this one,
+                without S3 returning the earlier ones.
 
         Returns:
-            list: A list of object keys in the bucket.
+            list: A list of object keys in the bucket, in key order.
         """
         try:
-            response = self.s3_client.list_objects_v2(Bucket=self.bucket_name, Prefix=prefix)
-            if 'Contents' in response:
-                keys = [obj['Key'] for obj in response['Contents']]
-                logger.info(f"Listed {len(keys)} files in bucket {self.bucket_name} with prefix '{prefix}'")
-                return keys
-            return []
+            # Pagination : list_objects_v2 renvoie au plus 1000 clés par appel
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            params = {'Bucket': self.bucket_name, 'Prefix': prefix}
+            if start_after:
+                params['StartAfter'] = start_after
+            keys = [
+                obj['Key']
+                for page in paginator.paginate(**params)
+                for obj in page.get('Contents', [])
+            ]
+            logger.info(f"Listed {len(keys)} files in bucket {self.bucket_name} with prefix '{prefix}'")
+            return keys
         except ClientError as e:
             logger.error(f"Error listing files in S3: {e}")
             return []
@@ -155,6 +177,26 @@ class S3Manager:
             logger.error(f"Error checking existence of {s3_key}: {e}")
             return False
 
+    def object_version(self, s3_key):
+        """
+        Get the version of a file in the S3 bucket, without downloading it.
+
+        Args:
+            s3_key (str): The key of the file.
+
+        Returns:
+            dict: 'etag' and 'last_modified' (datetime) of the file, or None
+                if it does not exist or cannot be reached.
+        """
+        try:
+            with span("s3.head_object", key=s3_key):
+                response = self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)
+            return {'etag': response['ETag'].strip('"'), 'last_modified': response['LastModified']}
+        except ClientError as e:
+            if e.response['Error']['Code'] != '404':
+                logger.error(f"Error reading the version of {s3_key}: {e}")
+            return None
+
     def upload_json(self, data, s3_key):
         """
         Upload JSON data directly to the S3 bucket.
@@ -0,0 +1,132 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+
+def _error(code, operation, message=""):
+    return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+
+class LocalS3Client:
+    """
+    Directory-backed stand-in for the subset of the boto3 S3 client used by the app.
+
+    Objects are files under root/<key>. Writes go through a temporary file and
+    an atomic rename, so concurrent readers never see partial objects. Missing
+    keys raise the same ClientError codes as S3 ('NoSuchKey', '404').
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root (str): Directory holding the objects.
+        """
+        self.root = os.path.abspath(root)
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, *key.split('/')))
+        if not path.startswith(self.root + os.sep):
+            raise _error('InvalidObjectName', 'Key', key)
+        return path
+
+    def _write(self, key, source, if_none_match=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            if isinstance(source, (bytes, bytearray)):
+                f.write(source)
+            else:
+                shutil.copyfileobj(source, f)
+        if if_none_match == '*':
+            # Écriture conditionnelle : échoue si l'objet existe déjà
+            with self._lock:
+                if os.path.exists(path):
+                    os.remove(temp_path)
+                    raise _error('PreconditionFailed', 'PutObject', key)
+                os.replace(temp_path, path)
+        else:
+            os.replace(temp_path, path)
+
+    def _metadata(self, key):
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return {
+            'ContentLength': stat.st_size,
+            'LastModified': datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+            'ETag': '"' + hashlib.md5(f"{stat.st_size}-{stat.st_mtime_ns}".encode()).hexdigest() + '"'
+        }
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        with open(Filename, 'rb') as f:
+            self._write(Key, f)
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        path = self._path(Key)
+        if not os.path.exists(path):
+            raise _error('404', 'HeadObject', Key)
+        shutil.copyfile(path, Filename)
+
+    def put_object(self, Bucket, Key, Body, IfNoneMatch=None, **kwargs):
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        self._write(Key, Body, IfNoneMatch)
+        return {'ETag': self._metadata(Key)['ETag']}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        metadata = self._metadata(Key)
+        if metadata is None:
+            raise _error('NoSuchKey', 'GetObject', Key)
+        with open(self._path(Key), 'rb') as f:
+            body = f.read()
+        return {'Body': io.BytesIO(body), **metadata}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        metadata = self._metadata(Key)
+        if metadata is None:
+            raise _error('404', 'HeadObject', Key)
+        return metadata
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        path = self._path(Key)
+        if os.path.exists(path):
+            os.remove(path)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix='', StartAfter='', **kwargs):
+        contents = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith('.part'):
+                    continue
+                key = os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, '/')
+                if key.startswith(Prefix) and key > StartAfter:
+                    contents.append({'Key': key, 'Size': os.path.getsize(os.path.join(directory, name)),
+                                     'LastModified': self._metadata(key)['LastModified']})
+        contents.sort(key=lambda obj: obj['Key'])
+        response = {'KeyCount': len(contents), 'IsTruncated': False}
+        if contents:
+            response['Contents'] = contents
+        return response
+
+    def get_paginator(self, operation_name):
+        if operation_name != 'list_objects_v2':
+            raise NotImplementedError(operation_name)
+        client = self
+
+        class _Paginator:
+            def paginate(self, **kwargs):
+                yield client.list_objects_v2(**kwargs)
+
+        return _Paginator()
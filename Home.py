@@ -1,10 +1,18 @@
 import streamlit as st
+import pandas as pd
+
+from loading import warmup
+from monitoring import spans
 
 st.set_page_config(
     page_title="Food Analytics Dashboard",
     page_icon="🏠",
     layout="wide"
 )
+spans.start_rerun(__file__)
+
+# Préchargement des jeux de données en arrière-plan, au premier affichage après un déploiement
+warmup.start()
 
 st.title("🏠 Tableau de Bord d'Analyse Alimentaire")
 
@@ -37,3 +45,37 @@ st.markdown("""
 """)
 
 st.sidebar.success("Sélectionnez une page ci-dessus.")
+
+def display_warmup():
+    """Affiche l'avancement du préchargement des données"""
+    tasks = warmup.status()
+    if not tasks:
+        return
+    finished = [task for task in tasks if task['state'] in (warmup.DONE, warmup.FAILED)]
+    if len(finished) < len(tasks):
+        st.progress(len(finished) / len(tasks), text=f"Préchargement des données : {len(finished)}/{len(tasks)}")
+    else:
+        failed = [task for task in tasks if task['state'] == warmup.FAILED]
+        if failed:
+            st.warning(f"Préchargement terminé, {len(failed)} jeu(x) de données indisponible(s).")
+        else:
+            st.success("Toutes les données sont préchargées.")
+    with st.expander("Détail du préchargement"):
+        labels = {warmup.PENDING: "⏳ En attente", warmup.RUNNING: "🔄 En cours", warmup.DONE: "✅ Prêt", warmup.FAILED: "❌ Échec"}
+        st.dataframe(pd.DataFrame({
+            "Jeu de données": [task['name'] for task in tasks],
+            "État": [labels[task['state']] for task in tasks],
+            "Durée (s)": [task['seconds'] for task in tasks]
+        }), hide_index=True, use_container_width=True)
+    # Fin du préchargement : relancer la page pour arrêter le rafraîchissement
+    if not warmup.is_running() and st.session_state.get('_warmup_refreshing'):
+        st.session_state['_warmup_refreshing'] = False
+        st.rerun()
+
+# Rafraîchir l'avancement chaque seconde tant que le préchargement tourne (Streamlit >= 1.37)
+if hasattr(st, "fragment") and warmup.is_running():
+    st.session_state['_warmup_refreshing'] = True
+    display_warmup = st.fragment(run_every=1)(display_warmup)
+display_warmup()
+
+spans.finish_rerun()
@@ -0,0 +1,192 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from analytics.time_parsing import add_time_columns
+
+SCORE_COLUMN = 'anomaly_score'
+
+RESULTS_KEY = "AI/anomaly_detection/results/anomalies_detected.xlsx"
+INDEX_KEY = "AI/anomaly_detection/results/anomaly_index.parquet"
+
+
+class AnomalyIndex:
+    """
+    Score-sorted index over the anomalies of one anomaly-detection model output.
+
+    Anomalies are stored once, sorted by ascending anomaly score, so that a row
+    position is also a score rank. Per-user and per-date permutations with
+    offset tables make threshold, top-k, user and date-range queries a
+    searchsorted plus slice instead of a filter and sort of the whole table.
+    """
+
+    def __init__(self, anomaly_data):
+        """
+        Build the index from the raw detection results.
+
+        Args:
+            anomaly_data (pd.DataFrame): Model output with 'is_anomaly' and
+                'anomaly_score' columns, and optionally 'user_id' and 'date'.
+        """
+        if 'is_anomaly' in anomaly_data.columns:
+            anomaly_data = anomaly_data[anomaly_data['is_anomaly'].astype(bool)]
+        self.frame = anomaly_data.sort_values(SCORE_COLUMN, kind='stable').reset_index(drop=True)
+        self._build_offsets()
+
+    @classmethod
+    def from_sorted(cls, frame):
+        """
+        Rebuild an index from a frame already sorted by score (see to_parquet).
+
+        Args:
+            frame (pd.DataFrame): Anomalies sorted by ascending 'anomaly_score'.
+
+        Returns:
+            AnomalyIndex: The index, without re-sorting the frame.
+        """
+        index = cls.__new__(cls)
+        index.frame = frame.reset_index(drop=True)
+        index._build_offsets()
+        return index
+
+    def _build_offsets(self):
+        self.scores = self.frame[SCORE_COLUMN].to_numpy(dtype=np.float64)
+
+        # Permutation (utilisateur, score) et bornes de chaque utilisateur
+        self.user_keys = None
+        if 'user_id' in self.frame.columns:
+            users = self.frame['user_id'].to_numpy()
+            self._by_user = np.argsort(users, kind='stable')
+            self.user_keys, self._user_offsets = np.unique(users[self._by_user], return_index=True)
+            self._user_offsets = np.append(self._user_offsets, len(users))
+
+        # Permutation par date pour les requêtes sur une période
+        self._days = self._dates = None
+        if 'date' in self.frame.columns:
+            self._days = pd.to_datetime(self.frame['date']).to_numpy(dtype='datetime64[D]')
+            self._by_date = np.argsort(self._days, kind='stable')
+            self._dates = self._days[self._by_date]
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def min_score(self):
+        return float(self.scores[0]) if len(self.scores) else 0.0
+
+    @property
+    def max_score(self):
+        return float(self.scores[-1]) if len(self.scores) else 0.0
+
+    @property
+    def date_bounds(self):
+        """(first, last) anomaly dates as datetime.date, or None without dates."""
+        if self._dates is None or len(self._dates) == 0:
+            return None
+        return self._dates[0].item(), self._dates[-1].item()
+
+    def _user_positions(self, user_id):
+        pos = np.searchsorted(self.user_keys, user_id)
+        if pos >= len(self.user_keys) or self.user_keys[pos] != user_id:
+            return np.empty(0, dtype=np.int64)
+        return self._by_user[self._user_offsets[pos]:self._user_offsets[pos + 1]]
+
+    def _date_positions(self, start_date, end_date):
+        lo = 0 if start_date is None else np.searchsorted(
+            self._dates, np.datetime64(start_date, 'D'), side='left')
+        hi = len(self._dates) if end_date is None else np.searchsorted(
+            self._dates, np.datetime64(end_date, 'D'), side='right')
+        # Trier les positions revient à trier par score
+        return np.sort(self._by_date[lo:hi])
+
+    def query(self, min_score=None, max_items=None, user_id=None, start_date=None, end_date=None):
+        """
+        Return the anomalies with score >= min_score, lowest scores first.
+
+        Args:
+            min_score (float, optional): Minimum anomaly score.
+            max_items (int, optional): Maximum number of rows returned.
+            user_id (optional): Restrict to one user.
+            start_date (date, optional): First day included.
+            end_date (date, optional): Last day included.
+
+        Returns:
+            pd.DataFrame: Matching anomalies sorted by ascending score.
+        """
+        by_date = (start_date is not None or end_date is not None) and self._dates is not None
+        if user_id is not None and self.user_keys is not None:
+            positions = self._user_positions(user_id)
+            if by_date:
+                days = self._days[positions]
+                mask = np.ones(len(positions), dtype=bool)
+                if start_date is not None:
+                    mask &= days >= np.datetime64(start_date, 'D')
+                if end_date is not None:
+                    mask &= days <= np.datetime64(end_date, 'D')
+                positions = positions[mask]
+        elif by_date:
+            positions = self._date_positions(start_date, end_date)
+        else:
+            positions = None
+
+        scores = self.scores if positions is None else self.scores[positions]
+        start = 0 if min_score is None else np.searchsorted(scores, min_score, side='left')
+        stop = len(scores) if max_items is None else min(len(scores), start + max_items)
+
+        if positions is None:
+            return self.frame.iloc[start:stop]
+        return self.frame.iloc[positions[start:stop]]
+
+    def to_parquet(self, path):
+        """
+        Save the score-sorted anomalies so the index can be reloaded without Excel.
+
+        Args:
+            path (str): Local path of the Parquet file.
+        """
+        self.frame.to_parquet(path, index=False)
+
+    @classmethod
+    def from_parquet(cls, path):
+        """
+        Load an index saved with to_parquet.
+
+        Args:
+            path (str): Local path of the Parquet file.
+
+        Returns:
+            AnomalyIndex: The loaded index.
+        """
+        return cls.from_sorted(pd.read_parquet(path))
+
+
+def publish_anomaly_index(s3, results_key=RESULTS_KEY, index_key=INDEX_KEY):
+    """
+    Compile the anomaly workbook into a Parquet index and upload it next to it.
+
+    Run once after each model output so that the dashboard never has to parse
+    the Excel workbook on a cold start.
+
+    Args:
+        s3 (S3Manager): Connected S3 manager.
+        results_key (str): Key of the raw anomaly workbook.
+        index_key (str): Key of the Parquet index to publish.
+
+    Returns:
+        bool: True if the index was uploaded successfully, False otherwise.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_results = os.path.join(temp_dir, os.path.basename(results_key))
+        temp_index = os.path.join(temp_dir, os.path.basename(index_key))
+        if not s3.download_file(results_key, temp_results):
+            return False
+        AnomalyIndex(add_time_columns(pd.read_excel(temp_results))).to_parquet(temp_index)
+        return s3.upload_with_overwrite(temp_index, index_key)
+
+
+if __name__ == "__main__":
+    from AWS.s3.connect_s3 import S3Manager
+
+    publish_anomaly_index(S3Manager())
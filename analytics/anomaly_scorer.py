@@ -0,0 +1,335 @@
+"""
+Streaming per-user anomaly scoring against online nutrient baselines.
+
+Meal micro-batches are dropped under ingest/meals with keys that sort in
+arrival order (e.g. prefixed with a timestamp): the scorer only keeps the
+last key it processed and lists the keys after it.
+
+Usage:
+    python -m analytics.anomaly_scorer --poll-seconds 5
+"""
+import argparse
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from analytics.time_parsing import HOUR_COLUMN, add_time_columns
+
+logger = logging.getLogger("analytics.anomaly_scorer")
+
+NUTRIENT_COLUMNS = ['total_calories', 'total_lipids', 'total_carbs', 'total_protein']
+
+INCOMING_PREFIX = "ingest/meals"
+STREAM_PREFIX = "AI/anomaly_detection/stream"
+STATE_KEY = f"{STREAM_PREFIX}/scorer_state.npz"
+RESULTS_PREFIX = f"{STREAM_PREFIX}/results"
+RECENT_ROWS = 5000
+
+
+class StreamingAnomalyScorer:
+    """
+    Scores meals against each user's own exponentially decayed baselines.
+
+    For every user the store keeps, per nutrient, a decayed weight, mean and
+    sum of squared deviations (weighted Welford updates) for the whole day and
+    for each hour bucket. A meal is scored against the baseline of its hour
+    bucket when that bucket has enough history, otherwise against the user's
+    daily baseline, and only then folded into the baselines.
+    """
+
+    def __init__(self, nutrients=NUTRIENT_COLUMNS, n_buckets=6, decay=0.98,
+                 min_weight=5.0, threshold=3.0):
+        """
+        Args:
+            nutrients (list): Meal columns tracked.
+            n_buckets (int): Number of hour buckets in a day (must divide 24).
+            decay (float): Weight kept by past meals at each new meal (0-1].
+            min_weight (float): Decayed number of meals needed before scoring.
+            threshold (float): Anomaly score above which a meal is flagged.
+        """
+        if 24 % n_buckets:
+            raise ValueError("n_buckets must divide 24")
+        self.nutrients = list(nutrients)
+        self.n_buckets = n_buckets
+        self.decay = decay
+        self.min_weight = min_weight
+        self.threshold = threshold
+        # Dernier fichier traité : les clés arrivent dans l'ordre, l'état reste borné
+        self.last_key = None
+
+        self.user_ids = []
+        self._user_rows = {}
+        # Emplacement 0 : baseline journalière, 1..n : tranches horaires
+        shape = (0, n_buckets + 1, len(self.nutrients))
+        self.weight = np.zeros(shape[:2], dtype=np.float32)
+        self.mean = np.zeros(shape, dtype=np.float32)
+        self.m2 = np.zeros(shape, dtype=np.float32)
+
+    def _rows(self, user_ids):
+        for user_id in pd.unique(user_ids):
+            if user_id not in self._user_rows:
+                self._user_rows[user_id] = len(self.user_ids)
+                self.user_ids.append(user_id)
+        n_users = len(self.user_ids)
+        if n_users > len(self.weight):
+            # Croissance géométrique pour amortir les réallocations
+            capacity = max(n_users, 2 * len(self.weight), 64)
+            grow = capacity - len(self.weight)
+            self.weight = np.concatenate([self.weight, np.zeros((grow,) + self.weight.shape[1:], np.float32)])
+            self.mean = np.concatenate([self.mean, np.zeros((grow,) + self.mean.shape[1:], np.float32)])
+            self.m2 = np.concatenate([self.m2, np.zeros((grow,) + self.m2.shape[1:], np.float32)])
+        return np.array([self._user_rows[user_id] for user_id in user_ids], dtype=np.int64)
+
+    def _z_scores(self, rows, slots, values):
+        weight = self.weight[rows, slots]
+        mean = self.mean[rows, slots]
+        variance = self.m2[rows, slots] / np.where(weight > 0, weight, 1)[:, None]
+        std = np.sqrt(np.maximum(variance, 0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = np.where(std > 0, (values - mean) / std, 0.0)
+        return z, weight
+
+    def _update(self, rows, slots, values):
+        weight = self.decay * self.weight[rows, slots] + 1
+        delta = values - self.mean[rows, slots]
+        mean = self.mean[rows, slots] + delta / weight[:, None]
+        self.m2[rows, slots] = self.decay * self.m2[rows, slots] + delta * (values - mean)
+        self.mean[rows, slots] = mean
+        self.weight[rows, slots] = weight
+
+    def score_batch(self, meals):
+        """
+        Score a micro-batch of meals, then fold them into the baselines.
+
+        Meals of different users are processed together; the meals of one
+        user are applied in chronological order, one vectorized round per
+        rank, so results match a record-by-record stream.
+
+        Args:
+            meals (pd.DataFrame): Meal-level rows with 'user_id', 'date',
+                'heure' (or 'hour') and the nutrient columns.
+
+        Returns:
+            pd.DataFrame: The meals with 'anomaly_score', 'is_anomaly' and
+                'baseline' ('hour', 'day' or 'none') columns.
+        """
+        meals = meals.copy()
+        if HOUR_COLUMN not in meals.columns:
+            add_time_columns(meals)
+        order_columns = ['date', 'seconds_of_day'] if 'seconds_of_day' in meals.columns else ['date']
+        meals = meals.sort_values(order_columns, kind='stable').reset_index(drop=True)
+
+        rows = self._rows(meals['user_id'].to_numpy())
+        hours = meals[HOUR_COLUMN].to_numpy(dtype=np.int64)
+        buckets = np.where(hours >= 0, hours * self.n_buckets // 24 + 1, 0)
+        values = meals[self.nutrients].to_numpy(dtype=np.float32)
+        ranks = meals.groupby('user_id', sort=False).cumcount().to_numpy()
+
+        scores = np.full(len(meals), np.nan, dtype=np.float32)
+        baseline = np.full(len(meals), 'none', dtype=object)
+        for rank in range(ranks.max() + 1 if len(ranks) else 0):
+            idx = np.flatnonzero(ranks == rank)
+            r, b, v = rows[idx], buckets[idx], values[idx]
+            z_hour, w_hour = self._z_scores(r, b, v)
+            z_day, w_day = self._z_scores(r, np.zeros_like(b), v)
+            use_hour = (b > 0) & (w_hour >= self.min_weight)
+            use_day = ~use_hour & (w_day >= self.min_weight)
+            z = np.where(use_hour[:, None], z_hour, z_day)
+            # Score : norme RMS des écarts réduits
+            scores[idx] = np.where(use_hour | use_day, np.sqrt((z ** 2).mean(axis=1)), np.nan)
+            baseline[idx] = np.where(use_hour, 'hour', np.where(use_day, 'day', 'none'))
+
+            self._update(r, np.zeros_like(b), v)
+            timed = b > 0
+            self._update(r[timed], b[timed], v[timed])
+
+        meals['anomaly_score'] = scores
+        meals['is_anomaly'] = np.nan_to_num(scores, nan=0.0) >= self.threshold
+        meals['baseline'] = baseline
+        return meals
+
+    def save(self, file):
+        """
+        Write the state store as a compressed .npz archive.
+
+        Args:
+            file (str or file-like): Destination.
+        """
+        n_users = len(self.user_ids)
+        np.savez_compressed(
+            file,
+            user_ids=np.array(self.user_ids),
+            weight=self.weight[:n_users],
+            mean=self.mean[:n_users],
+            m2=self.m2[:n_users],
+            last_key=np.array([self.last_key] if self.last_key else [], dtype=str),
+            config=np.array([self.n_buckets, self.decay, self.min_weight, self.threshold], dtype=np.float64),
+            nutrients=np.array(self.nutrients)
+        )
+
+    @classmethod
+    def load(cls, file):
+        """
+        Restore a scorer written by save.
+
+        Args:
+            file (str or file-like): Source.
+
+        Returns:
+            StreamingAnomalyScorer: The restored scorer.
+        """
+        with np.load(file, allow_pickle=False) as data:
+            n_buckets, decay, min_weight, threshold = data['config']
+            scorer = cls(data['nutrients'].tolist(), int(n_buckets), float(decay), float(min_weight), float(threshold))
+            scorer.user_ids = data['user_ids'].tolist()
+            scorer._user_rows = {user_id: row for row, user_id in enumerate(scorer.user_ids)}
+            scorer.weight = data['weight'].copy()
+            scorer.mean = data['mean'].copy()
+            scorer.m2 = data['m2'].copy()
+            # Anciens états : liste complète des fichiers traités
+            processed = data['last_key'] if 'last_key' in data.files else data['processed_keys']
+            scorer.last_key = max(processed.tolist()) if len(processed) else None
+        return scorer
+
+
+def _read_result(s3, key):
+    response = s3.s3_client.get_object(Bucket=s3.bucket_name, Key=key)
+    return pd.read_parquet(io.BytesIO(response['Body'].read()))
+
+
+def load_streamed_results(s3, prefix=RESULTS_PREFIX, since_key=None):
+    """
+    Read the scored micro-batches appended by the streaming scorer.
+
+    Args:
+        s3 (S3Manager): Connected S3 manager.
+        prefix (str): S3 prefix of the scored batches.
+        since_key (str, optional): Only list and read batches whose key sorts after it.
+
+    Returns:
+        pd.DataFrame: The scored meals, empty if none was published.
+    """
+    frames = [
+        _read_result(s3, key)
+        for key in s3.list_files(prefix, start_after=since_key)
+        if key.endswith('.parquet')
+    ]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+class RecentScoredMeals:
+    """
+    Bounded window of the latest meals scored by the streaming scorer.
+
+    Each refresh lists and downloads only the batches appended since the last
+    one it read, and keeps the max_rows most recent meals, so its cost does
+    not grow with the history of the stream.
+    """
+
+    def __init__(self, prefix=RESULTS_PREFIX, max_rows=RECENT_ROWS):
+        """
+        Args:
+            prefix (str): S3 prefix of the scored batches.
+            max_rows (int): Number of meals kept in the window.
+        """
+        self.prefix = prefix
+        self.max_rows = max_rows
+        self.last_key = None
+        self.frame = pd.DataFrame()
+        self._lock = threading.Lock()
+
+    def refresh(self, s3):
+        """
+        Read the batches appended since the last refresh into the window.
+
+        Args:
+            s3 (S3Manager): Connected S3 manager.
+
+        Returns:
+            pd.DataFrame: The meals of the window, oldest first.
+        """
+        with self._lock:
+            keys = [key for key in s3.list_files(self.prefix, start_after=self.last_key) if key.endswith('.parquet')]
+            # Au premier chargement, seuls les derniers lots remplissent la fenêtre
+            frames, rows = [], 0
+            for key in reversed(keys):
+                if rows >= self.max_rows:
+                    break
+                frames.append(_read_result(s3, key))
+                rows += len(frames[-1])
+            if frames:
+                previous = [self.frame] if not self.frame.empty else []
+                self.frame = pd.concat(previous + frames[::-1], ignore_index=True).tail(self.max_rows)
+                self.frame = self.frame.reset_index(drop=True)
+                self.last_key = keys[-1]
+            return self.frame
+
+
+def _read_meals(s3, key):
+    response = s3.s3_client.get_object(Bucket=s3.bucket_name, Key=key)
+    body = io.BytesIO(response['Body'].read())
+    return pd.read_csv(body) if key.endswith('.csv') else pd.read_parquet(body)
+
+
+def run_stream(s3, poll_seconds=5.0, incoming_prefix=INCOMING_PREFIX, once=False):
+    """
+    Poll an S3 prefix for new meal files, score them and append the results.
+
+    The scorer state and the last processed file are saved after every
+    micro-batch, so the loop can be restarted without rescoring.
+
+    Args:
+        s3 (S3Manager): Connected S3 manager.
+        poll_seconds (float): Delay between polls.
+        incoming_prefix (str): Prefix where meal micro-batches (Parquet or CSV)
+            are dropped.
+        once (bool): Process the pending files once and return.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        state_path = os.path.join(temp_dir, "scorer_state.npz")
+        if s3.file_exists(STATE_KEY) and s3.download_file(STATE_KEY, state_path):
+            scorer = StreamingAnomalyScorer.load(state_path)
+        else:
+            scorer = StreamingAnomalyScorer()
+
+        while True:
+            pending = [
+                key for key in s3.list_files(incoming_prefix, start_after=scorer.last_key)
+                if key.endswith(('.parquet', '.csv'))
+            ]
+            for key in pending:
+                start = time.perf_counter()
+                scored = scorer.score_batch(_read_meals(s3, key))
+                result_path = os.path.join(temp_dir, "scored.parquet")
+                scored.to_parquet(result_path, index=False)
+                result_key = f"{RESULTS_PREFIX}/{time.strftime('%Y%m%d_%H%M%S')}_{os.path.basename(key).rsplit('.', 1)[0]}.parquet"
+                if not s3.upload_file(result_path, result_key):
+                    raise RuntimeError(f"Upload of {result_key} failed")
+
+                scorer.last_key = key
+                scorer.save(state_path)
+                s3.upload_with_overwrite(state_path, STATE_KEY)
+                logger.info(
+                    f"{key}: {len(scored)} meals, {int(scored['is_anomaly'].sum())} anomalies "
+                    f"in {time.perf_counter() - start:.2f} s"
+                )
+            if once:
+                return
+            time.sleep(poll_seconds)
+
+
+if __name__ == "__main__":
+    from AWS.s3.connect_s3 import S3Manager
+
+    parser = argparse.ArgumentParser(description="Streaming per-user anomaly scoring")
+    parser.add_argument('--poll-seconds', type=float, default=5.0)
+    parser.add_argument('--once', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    run_stream(S3Manager(), args.poll_seconds, once=args.once)
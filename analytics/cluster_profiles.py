@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+from analytics.time_parsing import HOUR_COLUMN, parse_heure
+
+PROPORTION_COLUMNS = [
+    'proportion_total_calories',
+    'proportion_total_lipids',
+    'proportion_total_protein',
+    'proportion_total_carbs'
+]
+
+HOURS_PER_DAY = 24
+
+
+def _meal_hours(df):
+    """
+    Return the hour of day of each row, or None if the frame carries no time.
+
+    Uses the 'hour' column added at load time when present and only falls back
+    to parsing 'heure' for frames that skipped the parsing stage.
+    """
+    if HOUR_COLUMN in df.columns:
+        return df[HOUR_COLUMN].to_numpy(dtype=np.int64)
+    if 'heure' in df.columns:
+        seconds = parse_heure(df['heure'])
+        return np.where(seconds >= 0, seconds // 3600, -1)
+    return None
+
+
+def build_cluster_profiles(results_df, food_df):
+    """
+    Precompute the per-cluster aggregates displayed on the Cluster Analysis page.
+
+    Users are mapped to their cluster through a user_id -> cluster lookup, so
+    the many-to-many merge between the clustering results and the food-type
+    proportions is never materialized. Meal times are read from the 'hour'
+    column produced at load time by analytics.time_parsing.add_time_columns.
+
+    Args:
+        results_df (pd.DataFrame): Clustering results with 'user_id' and 'cluster'.
+        food_df (pd.DataFrame): Per-user food-type proportions ('user_id', 'Type',
+            'proportion_total_*').
+
+    Returns:
+        dict: Maps each cluster number to a dict with:
+            - 'type_proportions' (pd.DataFrame): Mean proportions indexed by Type.
+            - 'hourly_counts' (np.ndarray or None): 24-bucket meal counts by hour,
+              None when no 'heure' column is available.
+    """
+    user_clusters = results_df.drop_duplicates('user_id').set_index('user_id')['cluster']
+    clusters = np.sort(user_clusters.unique())
+
+    # Proportions moyennes par type d'aliment pour chaque cluster
+    food_clusters = food_df['user_id'].map(user_clusters)
+    type_means = (
+        food_df[PROPORTION_COLUMNS]
+        .groupby([food_clusters, food_df['Type']])
+        .mean()
+        .round(3)
+    )
+
+    # Histogrammes horaires : une seule passe np.bincount pour tous les clusters
+    hourly = None
+    hours, time_clusters = _meal_hours(results_df), results_df['cluster']
+    if hours is None:
+        hours, time_clusters = _meal_hours(food_df), food_clusters
+
+    if hours is not None:
+        cluster_idx = np.searchsorted(clusters, time_clusters.to_numpy())
+        valid = (
+            (hours >= 0) & (hours < HOURS_PER_DAY)
+            & time_clusters.notna().to_numpy()
+        )
+        hourly = np.bincount(
+            cluster_idx[valid] * HOURS_PER_DAY + hours[valid],
+            minlength=len(clusters) * HOURS_PER_DAY
+        ).reshape(len(clusters), HOURS_PER_DAY)
+
+    profiles = {}
+    for idx, cluster in enumerate(clusters):
+        cluster = int(cluster)
+        if cluster in type_means.index.get_level_values(0):
+            type_proportions = type_means.xs(cluster, level=0)
+        else:
+            type_proportions = pd.DataFrame(columns=PROPORTION_COLUMNS)
+        type_proportions.index.name = 'Type'
+        profiles[cluster] = {
+            'type_proportions': type_proportions,
+            'hourly_counts': hourly[idx] if hourly is not None else None
+        }
+    return profiles
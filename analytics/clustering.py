@@ -0,0 +1,621 @@
+"""
+Incremental mini-batch k-means over per-user eating-habit features.
+
+User features derive from additive per-user statistics (meals, active days,
+meals per hour, nutrient sums). When the incremental pipeline
+(pipeline.incremental) publishes daily partitions, an update reads only the
+days rewritten since the previous update and corrects the running statistics
+by their old and new contributions; otherwise the meals workbook is read in
+full.
+
+Usage:
+    python -m analytics.clustering                 # update from the latest meals
+    python -m analytics.clustering --clusters 5    # fit from scratch
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from analytics.time_parsing import HOUR_COLUMN, add_time_columns
+from pipeline.incremental import WATERMARK_KEY, partition_key
+
+logger = logging.getLogger("analytics.clustering")
+
+MEALS_KEY = "transform/folder_2_filter_data/combined_meal_data_filtered.xlsx"
+RESULTS_PREFIX = "AI/clustering/results"
+USER_CLUSTERS_KEY = f"{RESULTS_PREFIX}/user_clusters.xlsx"
+ANALYSIS_KEY = f"{RESULTS_PREFIX}/cluster_analysis.json"
+STATE_KEY = "AI/clustering/state/minibatch_kmeans.npz"
+USER_STATS_PREFIX = "AI/clustering/state/user_stats"
+DAY_STATS_PREFIX = "AI/clustering/state/day_stats"
+PROGRESS_KEY = "AI/clustering/state/progress.json"
+MEALS_DATASET = 'combined_meal_data_filtered'
+
+HOURS_PER_DAY = 24
+HOUR_BUCKETS = 6
+NUTRIENT_FEATURES = {
+    'total_calories': 'calories',
+    'total_lipids': 'lipides',
+    'total_protein': 'proteines',
+    'total_carbs': 'glucides'
+}
+FEATURE_COLUMNS = (
+    ['repas_par_jour']
+    + [f'part_repas_{h * HOURS_PER_DAY // HOUR_BUCKETS:02d}h' for h in range(HOUR_BUCKETS)]
+    + list(NUTRIENT_FEATURES.values())
+)
+HOUR_COUNT_COLUMNS = [f'repas_{h:02d}h' for h in range(HOURS_PER_DAY)]
+STAT_COLUMNS = ['n_repas', 'n_jours'] + HOUR_COUNT_COLUMNS + list(NUTRIENT_FEATURES)
+
+
+def user_meal_stats(meal_records):
+    """
+    Compute additive per-user statistics from food-level meal records.
+
+    The statistics of disjoint sets of days add up, so running totals can be
+    corrected day by day.
+
+    Args:
+        meal_records (pd.DataFrame): Rows of combined_meal_data ('user_id',
+            'meal_id', 'date', 'heure' or 'hour', 'total_*').
+
+    Returns:
+        pd.DataFrame: Indexed by user_id, with STAT_COLUMNS (meals, active
+            days, meals started at each hour, nutrient sums).
+    """
+    if HOUR_COLUMN not in meal_records.columns:
+        meal_records = add_time_columns(meal_records.copy())
+    meals = meal_records.groupby(['user_id', 'meal_id'], sort=False).agg(
+        date=('date', 'first'),
+        hour=(HOUR_COLUMN, 'first'),
+        **{column: (column, 'sum') for column in NUTRIENT_FEATURES}
+    ).reset_index()
+
+    user_codes, user_ids = pd.factorize(meals['user_id'], sort=True)
+    n_users = len(user_ids)
+    n_meals = np.bincount(user_codes, minlength=n_users)
+    n_days = meals.groupby(user_codes)['date'].nunique().to_numpy()
+
+    hours = meals['hour'].to_numpy(dtype=np.int64)
+    valid = hours >= 0
+    hour_counts = np.bincount(
+        user_codes[valid] * HOURS_PER_DAY + hours[valid],
+        minlength=n_users * HOURS_PER_DAY
+    ).reshape(n_users, HOURS_PER_DAY)
+
+    nutrient_sums = np.zeros((n_users, len(NUTRIENT_FEATURES)))
+    np.add.at(nutrient_sums, user_codes, meals[list(NUTRIENT_FEATURES)].to_numpy(dtype=np.float64))
+
+    return pd.DataFrame(
+        np.column_stack([n_meals, n_days, hour_counts, nutrient_sums]),
+        index=pd.Index(user_ids, name='user_id'),
+        columns=STAT_COLUMNS
+    )
+
+
+def features_from_stats(stats):
+    """
+    Turn per-user statistics into feature vectors.
+
+    Args:
+        stats (pd.DataFrame): Output of user_meal_stats, or a sum of them.
+
+    Returns:
+        pd.DataFrame: Indexed by user_id, with FEATURE_COLUMNS (meals per day,
+            share of meals in each 4-hour bucket, mean nutrients per meal) and
+            HOUR_COUNT_COLUMNS (number of meals started at each hour). Users
+            without meals are left out.
+    """
+    stats = stats[stats['n_repas'] > 0]
+    n_meals = stats['n_repas'].to_numpy(dtype=np.float64)
+    n_days = stats['n_jours'].to_numpy(dtype=np.float64)
+    hour_counts = stats[HOUR_COUNT_COLUMNS].to_numpy(dtype=np.float64)
+    bucket_counts = hour_counts.reshape(len(stats), HOUR_BUCKETS, -1).sum(axis=2)
+    timed = np.maximum(bucket_counts.sum(axis=1, keepdims=True), 1)
+    nutrient_sums = stats[list(NUTRIENT_FEATURES)].to_numpy(dtype=np.float64)
+
+    features = np.column_stack([
+        n_meals / np.maximum(n_days, 1),
+        bucket_counts / timed,
+        nutrient_sums / n_meals[:, None]
+    ])
+    return pd.DataFrame(
+        np.column_stack([features, hour_counts]),
+        index=stats.index,
+        columns=FEATURE_COLUMNS + HOUR_COUNT_COLUMNS
+    )
+
+
+def compute_user_features(meal_records):
+    """
+    Build one feature vector per user from food-level meal records.
+
+    Args:
+        meal_records (pd.DataFrame): Rows of combined_meal_data ('user_id',
+            'meal_id', 'date', 'heure' or 'hour', 'total_*').
+
+    Returns:
+        pd.DataFrame: Output of features_from_stats.
+    """
+    return features_from_stats(user_meal_stats(meal_records))
+
+
+class IncrementalClusterModel:
+    """
+    Mini-batch k-means whose centroids and cluster summaries update in place.
+
+    Features are standardized with the scaling fitted at creation so that
+    centroids stay comparable across updates. Besides the centroids, the model
+    keeps per-cluster sufficient statistics (user count, feature sums, hourly
+    meal counts) and each user's last contribution, so cluster_analysis is
+    maintained by subtracting and adding users rather than rescanning them.
+    """
+
+    def __init__(self, centers, center_counts, scale_mean, scale_std, cluster_labels=None):
+        """
+        Args:
+            centers (np.ndarray): (k, d) centroids in standardized space.
+            center_counts (np.ndarray): Number of points each centroid has absorbed.
+            scale_mean (np.ndarray): Feature means used for standardization.
+            scale_std (np.ndarray): Feature standard deviations.
+            cluster_labels (np.ndarray, optional): Published cluster number of
+                each centroid. Defaults to 0..k-1.
+        """
+        self.centers = np.asarray(centers, dtype=np.float64)
+        self.center_counts = np.asarray(center_counts, dtype=np.float64)
+        self.scale_mean = np.asarray(scale_mean, dtype=np.float64)
+        self.scale_std = np.asarray(scale_std, dtype=np.float64)
+        n_clusters = len(self.centers)
+        self.cluster_labels = (
+            np.arange(n_clusters) if cluster_labels is None else np.asarray(cluster_labels, dtype=np.int64)
+        )
+
+        self.user_ids = []
+        self._user_rows = {}
+        self.labels = np.zeros(0, dtype=np.int64)
+        self.user_features = np.zeros((0, len(FEATURE_COLUMNS)))
+        self.user_hours = np.zeros((0, HOURS_PER_DAY))
+
+        self.cluster_sizes = np.zeros(n_clusters)
+        self.cluster_feature_sums = np.zeros((n_clusters, len(FEATURE_COLUMNS)))
+        self.cluster_hour_counts = np.zeros((n_clusters, HOURS_PER_DAY))
+
+    @staticmethod
+    def _scaling(features):
+        values = features[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+        std = values.std(axis=0)
+        return values.mean(axis=0), np.where(std > 0, std, 1.0)
+
+    def _standardize(self, features):
+        return (features[FEATURE_COLUMNS].to_numpy(dtype=np.float64) - self.scale_mean) / self.scale_std
+
+    def _nearest(self, X):
+        # ||x - c||² = ||x||² - 2 x.c + ||c||², le premier terme ne change pas l'argmin
+        distances = (self.centers ** 2).sum(axis=1) - 2 * X @ self.centers.T
+        return distances.argmin(axis=1)
+
+    @classmethod
+    def fit(cls, features, n_clusters, batch_size=1024, n_epochs=10, seed=0):
+        """
+        Fit centroids from scratch with k-means++ seeding and mini-batch passes.
+
+        Args:
+            features (pd.DataFrame): Output of compute_user_features.
+            n_clusters (int): Number of clusters.
+            batch_size (int): Users per mini-batch.
+            n_epochs (int): Passes over the users.
+            seed (int): Random seed.
+
+        Returns:
+            IncrementalClusterModel: The fitted model with every user assigned.
+        """
+        rng = np.random.default_rng(seed)
+        scale_mean, scale_std = cls._scaling(features)
+        X = (features[FEATURE_COLUMNS].to_numpy(dtype=np.float64) - scale_mean) / scale_std
+
+        # Initialisation k-means++ sur un échantillon
+        sample = X[rng.choice(len(X), min(len(X), 100 * n_clusters), replace=False)]
+        centers = [sample[rng.integers(len(sample))]]
+        closest = ((sample - centers[0]) ** 2).sum(axis=1)
+        for _ in range(1, n_clusters):
+            total = closest.sum()
+            probabilities = closest / total if total > 0 else None
+            centers.append(sample[rng.choice(len(sample), p=probabilities)])
+            closest = np.minimum(closest, ((sample - centers[-1]) ** 2).sum(axis=1))
+
+        model = cls(np.array(centers), np.zeros(n_clusters), scale_mean, scale_std)
+        for _ in range(n_epochs):
+            order = rng.permutation(len(X))
+            for start in range(0, len(X), batch_size):
+                model._update_centers(X[order[start:start + batch_size]])
+        model._assign(features, model._nearest(X))
+        return model
+
+    @classmethod
+    def from_assignments(cls, features, user_clusters):
+        """
+        Seed the model from an existing offline clustering.
+
+        Args:
+            features (pd.DataFrame): Output of compute_user_features.
+            user_clusters (pd.Series): Cluster number indexed by user_id.
+
+        Returns:
+            IncrementalClusterModel: Centroids at the mean of each cluster.
+        """
+        user_clusters = user_clusters[~user_clusters.index.duplicated()]
+        features = features.loc[features.index.intersection(user_clusters.index)]
+        scale_mean, scale_std = cls._scaling(features)
+        X = (features[FEATURE_COLUMNS].to_numpy(dtype=np.float64) - scale_mean) / scale_std
+        codes, cluster_labels = pd.factorize(user_clusters.loc[features.index], sort=True)
+
+        counts = np.bincount(codes, minlength=len(cluster_labels)).astype(np.float64)
+        centers = np.zeros((len(cluster_labels), X.shape[1]))
+        np.add.at(centers, codes, X)
+        centers /= np.maximum(counts, 1)[:, None]
+
+        model = cls(centers, counts, scale_mean, scale_std, cluster_labels.to_numpy())
+        model._assign(features, codes)
+        return model
+
+    def _update_centers(self, X):
+        # Mise à jour mini-batch : chaque centre devient la moyenne cumulée des points absorbés
+        nearest = self._nearest(X)
+        batch_counts = np.bincount(nearest, minlength=len(self.centers))
+        batch_sums = np.zeros_like(self.centers)
+        np.add.at(batch_sums, nearest, X)
+        moved = batch_counts > 0
+        total = self.center_counts[moved] + batch_counts[moved]
+        self.centers[moved] = (
+            self.center_counts[moved, None] * self.centers[moved] + batch_sums[moved]
+        ) / total[:, None]
+        self.center_counts[moved] = total
+        return nearest
+
+    def _assign(self, features, labels):
+        """Record user assignments and move their contributions between clusters."""
+        user_ids = features.index.to_numpy()
+        values = features[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+        hours = features[HOUR_COUNT_COLUMNS].to_numpy(dtype=np.float64)
+
+        known = np.array([user_id in self._user_rows for user_id in user_ids], dtype=bool)
+        rows = np.empty(len(user_ids), dtype=np.int64)
+        rows[known] = [self._user_rows[user_id] for user_id in user_ids[known]]
+
+        # Retirer l'ancienne contribution des utilisateurs déjà connus
+        old_rows = rows[known]
+        old_labels = self.labels[old_rows]
+        np.subtract.at(self.cluster_sizes, old_labels, 1)
+        np.subtract.at(self.cluster_feature_sums, old_labels, self.user_features[old_rows])
+        np.subtract.at(self.cluster_hour_counts, old_labels, self.user_hours[old_rows])
+
+        n_new = int((~known).sum())
+        rows[~known] = np.arange(len(self.user_ids), len(self.user_ids) + n_new)
+        for user_id, row in zip(user_ids[~known], rows[~known]):
+            self._user_rows[user_id] = row
+            self.user_ids.append(user_id)
+        self.labels = np.concatenate([self.labels, np.zeros(n_new, dtype=np.int64)])
+        self.user_features = np.concatenate([self.user_features, np.zeros((n_new, len(FEATURE_COLUMNS)))])
+        self.user_hours = np.concatenate([self.user_hours, np.zeros((n_new, HOURS_PER_DAY))])
+
+        self.labels[rows] = labels
+        self.user_features[rows] = values
+        self.user_hours[rows] = hours
+        np.add.at(self.cluster_sizes, labels, 1)
+        np.add.at(self.cluster_feature_sums, labels, values)
+        np.add.at(self.cluster_hour_counts, labels, hours)
+
+    def predict(self, features):
+        """
+        Return the published cluster number of each feature row.
+
+        Args:
+            features (pd.DataFrame): Rows with FEATURE_COLUMNS.
+
+        Returns:
+            np.ndarray: Cluster numbers, aligned with the rows.
+        """
+        return self.cluster_labels[self._nearest(self._standardize(features))]
+
+    def partial_fit(self, features):
+        """
+        Move the centroids towards a mini-batch of new or changed users and
+        (re)assign them.
+
+        Args:
+            features (pd.DataFrame): Output of compute_user_features for the
+                users to update.
+
+        Returns:
+            pd.Series: Their new cluster numbers, indexed by user_id.
+        """
+        if features.empty:
+            return pd.Series(dtype=np.int64, index=features.index, name='cluster')
+        nearest = self._update_centers(self._standardize(features))
+        self._assign(features, nearest)
+        return pd.Series(self.cluster_labels[nearest], index=features.index, name='cluster')
+
+    def changed_users(self, features, tolerance=1e-9):
+        """
+        Select the feature rows of users that are new or whose features moved.
+
+        Args:
+            features (pd.DataFrame): Output of compute_user_features.
+            tolerance (float): Absolute change under which a user is unchanged.
+
+        Returns:
+            pd.DataFrame: The rows to pass to partial_fit.
+        """
+        rows = features.index.map(lambda user_id: self._user_rows.get(user_id, -1)).to_numpy()
+        changed = rows < 0
+        known = ~changed
+        current = np.column_stack([
+            features[FEATURE_COLUMNS].to_numpy(dtype=np.float64),
+            features[HOUR_COUNT_COLUMNS].to_numpy(dtype=np.float64)
+        ])[known]
+        stored = np.column_stack([self.user_features, self.user_hours])[rows[known]]
+        changed[known] = (np.abs(current - stored) > tolerance).any(axis=1)
+        return features[changed]
+
+    def assignments(self):
+        """
+        Return the current cluster of every known user.
+
+        Returns:
+            pd.DataFrame: Columns 'user_id' and 'cluster'.
+        """
+        return pd.DataFrame({
+            'user_id': self.user_ids,
+            'cluster': self.cluster_labels[self.labels]
+        })
+
+    def cluster_analysis(self, top_hours=3):
+        """
+        Summarize each cluster from its sufficient statistics.
+
+        Args:
+            top_hours (int): Number of main meal hours reported per cluster.
+
+        Returns:
+            dict: Same layout as cluster_analysis.json ('cluster_<n>' keys with
+                'nombre_utilisateurs', 'repas_par_jour', 'heures_principales'
+                and 'moyennes_nutriments').
+        """
+        means = self.cluster_feature_sums / np.maximum(self.cluster_sizes, 1)[:, None]
+        nutrient_offset = FEATURE_COLUMNS.index(next(iter(NUTRIENT_FEATURES.values())))
+        analysis = {}
+        for index, cluster in enumerate(self.cluster_labels):
+            size = int(round(self.cluster_sizes[index]))
+            if size == 0:
+                continue
+            hour_counts = self.cluster_hour_counts[index]
+            main_hours = [int(h) for h in np.argsort(-hour_counts, kind='stable')[:top_hours] if hour_counts[h] > 0]
+            analysis[f"cluster_{cluster}"] = {
+                'nombre_utilisateurs': size,
+                'repas_par_jour': round(float(means[index, 0]), 2),
+                'heures_principales': main_hours,
+                'moyennes_nutriments': {
+                    name: round(float(means[index, nutrient_offset + i]), 2)
+                    for i, name in enumerate(NUTRIENT_FEATURES.values())
+                }
+            }
+        return analysis
+
+    def save(self, file):
+        """
+        Write the model, user contributions included, as a compressed .npz archive.
+
+        Args:
+            file (str or file-like): Destination.
+        """
+        np.savez_compressed(
+            file,
+            centers=self.centers,
+            center_counts=self.center_counts,
+            scale_mean=self.scale_mean,
+            scale_std=self.scale_std,
+            cluster_labels=self.cluster_labels,
+            user_ids=np.array(self.user_ids),
+            labels=self.labels,
+            user_features=self.user_features,
+            user_hours=self.user_hours
+        )
+
+    @classmethod
+    def load(cls, file):
+        """
+        Restore a model written by save.
+
+        Args:
+            file (str or file-like): Source.
+
+        Returns:
+            IncrementalClusterModel: The restored model.
+        """
+        with np.load(file, allow_pickle=False) as data:
+            model = cls(data['centers'], data['center_counts'], data['scale_mean'],
+                        data['scale_std'], data['cluster_labels'])
+            features = pd.DataFrame(
+                np.column_stack([data['user_features'], data['user_hours']]),
+                index=pd.Index(data['user_ids'].tolist(), name='user_id'),
+                columns=FEATURE_COLUMNS + HOUR_COUNT_COLUMNS
+            )
+            model._assign(features, data['labels'])
+        return model
+
+
+def _download(s3, key, temp_dir):
+    """Download a key into temp_dir, returning its path or None if it is missing."""
+    path = os.path.join(temp_dir, key.replace('/', '_'))
+    if s3.file_exists(key) and s3.download_file(key, path):
+        return path
+    return None
+
+
+def _read_json(s3, key, temp_dir):
+    path = _download(s3, key, temp_dir)
+    if path is None:
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _read_stats(s3, key, temp_dir):
+    path = _download(s3, key, temp_dir)
+    if path is None:
+        raise RuntimeError(f"Could not download {key}")
+    return pd.read_parquet(path)
+
+
+def _upload_frame(s3, frame, key, temp_dir):
+    path = os.path.join(temp_dir, "upload.parquet")
+    frame.to_parquet(path)
+    if not s3.upload_with_overwrite(path, key):
+        raise RuntimeError(f"Could not upload {key}")
+
+
+def _sum_stats(frames):
+    """Add per-user statistics, dropping users left without meals."""
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=STAT_COLUMNS, index=pd.Index([], name='user_id'), dtype=np.float64)
+    total = pd.concat(frames).groupby(level='user_id').sum()
+    return total[total['n_repas'] > 0]
+
+
+def _update_user_stats(s3, temp_dir):
+    """
+    Bring the running per-user statistics up to date.
+
+    With the pipeline's daily partitions, only the days rewritten since the
+    previous update are read: their new statistics are added and the ones
+    recorded for them before are subtracted. Without a previous update, or
+    without the partitions, every meal is read.
+
+    Args:
+        s3 (S3Manager): Connected S3 manager.
+        temp_dir (str): Directory for the downloads.
+
+    Returns:
+        tuple: (stats, touched, publish) with the statistics of every user,
+            the user_ids whose statistics changed (None when every user was
+            recomputed) and a function publishing the new statistics, to be
+            called once the model is saved.
+    """
+    watermark = _read_json(s3, WATERMARK_KEY, temp_dir)
+    if watermark is None:
+        # Pas de partitions journalières : lecture complète du classeur
+        meals_path = _download(s3, MEALS_KEY, temp_dir)
+        if meals_path is None:
+            raise RuntimeError(f"Could not download {MEALS_KEY}")
+        return user_meal_stats(pd.read_excel(meals_path)), None, lambda: None
+
+    run = watermark.get('run')
+    progress = _read_json(s3, PROGRESS_KEY, temp_dir)
+    if run is not None and progress is not None and progress['run'] <= run:
+        days = sorted(day for day, day_run in watermark.get('day_runs', {}).items() if day_run > progress['run'])
+        previous = _read_stats(s3, progress['user_stats'], temp_dir)
+        replaced = {day: _read_stats(s3, progress['day_stats'][day], temp_dir)
+                    for day in days if day in progress['day_stats']}
+    else:
+        days = watermark['dates']
+        progress = {'run': 0, 'user_stats': None, 'day_stats': {}}
+        previous = None
+        replaced = {}
+
+    added = {}
+    for day in days:
+        path = _download(s3, partition_key(MEALS_DATASET, day), temp_dir)
+        if path is None:
+            raise RuntimeError(f"Could not download the {MEALS_DATASET} partition of {day}")
+        added[day] = user_meal_stats(pd.read_parquet(path))
+        os.remove(path)
+    stats = _sum_stats(([] if previous is None else [previous])
+                       + list(added.values()) + [-frame for frame in replaced.values()])
+    touched = None if previous is None else pd.Index(
+        [user_id for frame in [*added.values(), *replaced.values()] for user_id in frame.index]
+    ).unique()
+    logger.info(f"Read {len(days)} days of meals ({len(replaced)} replaced)")
+
+    def publish():
+        if run is None or not days:
+            return
+        # Clés versionnées par exécution : l'état précédent reste valide
+        # tant que progress.json n'a pas été remplacé
+        day_stats = dict(progress['day_stats'])
+        for day, frame in added.items():
+            day_stats[day] = f"{DAY_STATS_PREFIX}/date={day}/run={run}.parquet"
+            _upload_frame(s3, frame, day_stats[day], temp_dir)
+        user_stats = f"{USER_STATS_PREFIX}/run={run}.parquet"
+        _upload_frame(s3, stats, user_stats, temp_dir)
+        s3.upload_json({'run': run, 'user_stats': user_stats, 'day_stats': day_stats}, PROGRESS_KEY)
+        for key in [progress['user_stats']] + [progress['day_stats'][day] for day in replaced]:
+            if key is not None and key not in day_stats.values() and key != user_stats:
+                s3.delete_file(key)
+
+    return stats, touched, publish
+
+
+def update_clusters(s3, n_clusters=None):
+    """
+    Refresh user_clusters.xlsx and cluster_analysis.json from the latest meals.
+
+    Only the meals of the days changed since the previous update are read
+    (see _update_user_stats), and only new users and users whose features
+    changed go through partial_fit. The first run seeds the model from the
+    published offline clustering, or fits it from scratch when n_clusters is
+    given or no clustering exists.
+
+    Args:
+        s3 (S3Manager): Connected S3 manager.
+        n_clusters (int, optional): Refit from scratch with this many clusters.
+
+    Returns:
+        IncrementalClusterModel: The updated model.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        stats, touched, publish_stats = _update_user_stats(s3, temp_dir)
+        features = features_from_stats(stats)
+
+        state_path = os.path.join(temp_dir, "state.npz")
+        clusters_path = os.path.join(temp_dir, "user_clusters.xlsx")
+        if n_clusters is not None:
+            model = IncrementalClusterModel.fit(features, n_clusters)
+        elif s3.file_exists(STATE_KEY) and s3.download_file(STATE_KEY, state_path):
+            model = IncrementalClusterModel.load(state_path)
+            candidates = features if touched is None else features.loc[features.index.intersection(touched)]
+            changed = model.changed_users(candidates)
+            model.partial_fit(changed)
+            logger.info(f"{len(changed)} new or changed users out of {len(features)}")
+        elif s3.file_exists(USER_CLUSTERS_KEY) and s3.download_file(USER_CLUSTERS_KEY, clusters_path):
+            offline = pd.read_excel(clusters_path).drop_duplicates('user_id').set_index('user_id')['cluster']
+            model = IncrementalClusterModel.from_assignments(features, offline)
+            model.partial_fit(features.loc[features.index.difference(offline.index)])
+        else:
+            raise RuntimeError("No clustering to update, pass n_clusters to fit one")
+
+        model.save(state_path)
+        s3.upload_with_overwrite(state_path, STATE_KEY)
+        model.assignments().to_excel(clusters_path, index=False)
+        s3.upload_with_overwrite(clusters_path, USER_CLUSTERS_KEY)
+        s3.upload_json(model.cluster_analysis(), ANALYSIS_KEY)
+        # Statistiques publiées après le modèle : une mise à jour interrompue
+        # relit les mêmes jours, et changed_users ignore ceux déjà absorbés
+        publish_stats()
+    return model
+
+
+if __name__ == "__main__":
+    from AWS.s3.connect_s3 import S3Manager
+
+    parser = argparse.ArgumentParser(description="Incremental user clustering")
+    parser.add_argument('--clusters', type=int, default=None,
+                        help="Refit from scratch with this many clusters")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    update_clusters(S3Manager(), args.clusters)
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+# Colonnes produites par l'étape combined_meal_data et nutriment source
+MACRO_TOTALS = {
+    'total_calories': 'Valeur calorique',
+    'total_lipids': 'Lipides',
+    'total_carbs': 'Glucides',
+    'total_protein': 'Protein'
+}
+
+DEFAULT_BATCH_SIZE = 1_000_000
+
+
+def iter_meal_nutrients(aliment_ids, quantities, matrix, nutrients=None,
+                        batch_size=DEFAULT_BATCH_SIZE, quantity_basis='reference'):
+    """
+    Yield nutrient totals of meal records batch by batch.
+
+    Each batch is a single vectorized pass: a take of the food rows from the
+    id-indexed nutrient matrix times the quantity scale. Peak memory is
+    bounded by batch_size x len(nutrients) float32 values.
+
+    Args:
+        aliment_ids (array-like): aliment_id of each meal record.
+        quantities (array-like): Consumed quantity of each meal record.
+        matrix (NutrientMatrix): Compiled food catalog.
+        nutrients (list, optional): Nutrient names, all by default.
+        batch_size (int): Number of meal records per batch.
+        quantity_basis (str): 'reference' when quantities are in the unit of
+            the catalog's reference quantity (value x quantity / quantitee),
+            'portion' when they count reference portions (value x quantity).
+
+    Yields:
+        tuple: (start, totals) where totals is a (batch, n_nutrients) float32
+            array for records [start, start + batch); NaN for unknown foods.
+    """
+    if quantity_basis not in ('reference', 'portion'):
+        raise ValueError(f"Unknown quantity basis: {quantity_basis}")
+    aliment_ids = np.asarray(aliment_ids)
+    quantities = np.asarray(quantities, dtype=np.float32)
+    # Colonnes choisies une seule fois : chaque lot ne copie que celles-ci
+    source = matrix.values if nutrients is None else matrix.values[:, matrix.columns(nutrients)]
+    reference = np.asarray(matrix.reference_quantity, dtype=np.float32)
+
+    for start in range(0, len(aliment_ids), batch_size):
+        stop = min(start + batch_size, len(aliment_ids))
+        rows = matrix.rows(aliment_ids[start:stop])
+        known = rows >= 0
+        safe_rows = np.where(known, rows, 0)
+
+        values = source.take(safe_rows, axis=0)
+
+        scale = quantities[start:stop].copy()
+        if quantity_basis == 'reference':
+            ref = reference.take(safe_rows)
+            scale /= np.where(ref > 0, ref, np.nan)
+        scale[~known] = np.nan
+        values *= scale[:, None]
+        yield start, values
+
+
+def compute_meal_nutrients(meals, matrix, nutrients=None, batch_size=DEFAULT_BATCH_SIZE,
+                           quantity_basis='reference'):
+    """
+    Nutrient totals of every meal record, keyed by aliment_id.
+
+    Args:
+        meals (pd.DataFrame): Meal records with 'aliment_id' and 'quantity'.
+        matrix (NutrientMatrix): Compiled food catalog.
+        nutrients (list, optional): Nutrient names, all by default.
+        batch_size (int): Number of meal records per batch.
+        quantity_basis (str): See iter_meal_nutrients.
+
+    Returns:
+        pd.DataFrame: One float32 column per nutrient, indexed like meals.
+    """
+    names = matrix.nutrients if nutrients is None else list(nutrients)
+    totals = np.empty((len(meals), len(names)), dtype=np.float32)
+    for start, values in iter_meal_nutrients(
+        meals['aliment_id'].to_numpy(), meals['quantity'].to_numpy(), matrix,
+        nutrients, batch_size, quantity_basis
+    ):
+        totals[start:start + len(values)] = values
+    return pd.DataFrame(totals, index=meals.index, columns=names)
+
+
+def add_macro_totals(meals, matrix, batch_size=DEFAULT_BATCH_SIZE, quantity_basis='reference'):
+    """
+    Add the total_calories, total_lipids, total_carbs and total_protein columns.
+
+    Replaces the join of meals against the food table done by the
+    combined_meal_data stage.
+
+    Args:
+        meals (pd.DataFrame): Meal records with 'aliment_id' and 'quantity'.
+            Modified in place.
+        matrix (NutrientMatrix): Compiled food catalog.
+        batch_size (int): Number of meal records per batch.
+        quantity_basis (str): See iter_meal_nutrients.
+
+    Returns:
+        pd.DataFrame: The same DataFrame, for chaining.
+    """
+    totals = compute_meal_nutrients(
+        meals, matrix, list(MACRO_TOTALS.values()), batch_size, quantity_basis
+    )
+    for total_column, nutrient in MACRO_TOTALS.items():
+        meals[total_column] = totals[nutrient].to_numpy()
+    return meals
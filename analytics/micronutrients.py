@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from analytics.nutrient_matrix import NUTRIENTS
+
+VITAMINS = [name for name, _, _ in NUTRIENTS if name.startswith('Vitamine')]
+MINERALS = ['Sodium', 'Calcium', 'Cuivre', 'Fer', 'Magnesium', 'Manganese',
+            'Phosphore', 'Potassium', 'Selenium', 'Zinc']
+MICRONUTRIENTS = VITAMINS + MINERALS
+
+
+def consumption_matrix(meals, matrix):
+    """
+    Sparse (user-day x food) matrix of consumed reference portions.
+
+    Args:
+        meals (pd.DataFrame): Meal records with 'user_id', 'date', 'aliment_id'
+            and 'quantity'.
+        matrix (NutrientMatrix): Compiled food catalog.
+
+    Returns:
+        tuple: (scipy.sparse.csr_matrix, pd.DataFrame) the consumption matrix
+            and the 'user_id'/'date' key of each of its rows.
+    """
+    food_rows = matrix.rows(meals['aliment_id'].to_numpy())
+    known = food_rows >= 0
+    meals = meals[known]
+    food_rows = food_rows[known]
+
+    days = pd.to_datetime(meals['date']).dt.normalize()
+    keys = pd.MultiIndex.from_arrays([meals['user_id'].to_numpy(), days.to_numpy()])
+    codes, user_days = pd.factorize(keys, sort=True)
+
+    reference = np.asarray(matrix.reference_quantity, dtype=np.float32)[food_rows]
+    portions = meals['quantity'].to_numpy(dtype=np.float32) / np.where(reference > 0, reference, np.nan)
+    portions = np.nan_to_num(portions)
+
+    # Les repas d'un même jour pour un même aliment sont additionnés
+    consumption = sp.coo_matrix(
+        (portions, (codes, food_rows)),
+        shape=(len(user_days), len(matrix))
+    ).tocsr()
+    index = pd.DataFrame({
+        'user_id': user_days.get_level_values(0),
+        'date': user_days.get_level_values(1)
+    })
+    return consumption, index
+
+
+def user_day_intake(meals, matrix, start_date=None, end_date=None, nutrients=MICRONUTRIENTS):
+    """
+    Intake of every nutrient for every user-day in one sparse-dense product.
+
+    Args:
+        meals (pd.DataFrame): Meal records with 'user_id', 'date', 'aliment_id'
+            and 'quantity'.
+        matrix (NutrientMatrix): Compiled food catalog.
+        start_date (date, optional): First day included.
+        end_date (date, optional): Last day included.
+        nutrients (list): Nutrient names to compute.
+
+    Returns:
+        pd.DataFrame: 'user_id', 'date' and one column per nutrient.
+    """
+    dates = pd.to_datetime(meals['date'])
+    mask = np.ones(len(meals), dtype=bool)
+    if start_date is not None:
+        mask &= (dates >= pd.Timestamp(start_date)).to_numpy()
+    if end_date is not None:
+        mask &= (dates < pd.Timestamp(end_date) + pd.Timedelta(days=1)).to_numpy()
+
+    nutrients = [name for name in nutrients if name in matrix.nutrients]
+    consumption, intake = consumption_matrix(meals[mask], matrix)
+    values = np.nan_to_num(np.asarray(matrix.values[:, matrix.columns(nutrients)]))
+    intake[nutrients] = consumption @ values
+    return intake
+
+
+def cluster_intake(intake, user_clusters):
+    """
+    Mean daily intake per cluster.
+
+    Args:
+        intake (pd.DataFrame): Output of user_day_intake.
+        user_clusters (pd.DataFrame): Rows with 'user_id' and 'cluster'.
+
+    Returns:
+        pd.DataFrame: Mean intake of each nutrient, indexed by cluster.
+    """
+    clusters = user_clusters.drop_duplicates('user_id').set_index('user_id')['cluster']
+    nutrients = [col for col in intake.columns if col not in ('user_id', 'date')]
+    result = intake[nutrients].groupby(intake['user_id'].map(clusters)).mean()
+    result.index.name = 'cluster'
+    return result
@@ -0,0 +1,328 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+FOOD_KEY = "reference_data/food/food_processed.xlsx"
+MATRIX_PREFIX = "reference_data/food/nutrient_matrix"
+MATRIX_FILES = ['values.npy', 'ids.npy', 'reference_quantity.npy', 'meta.json']
+
+# (colonne nutriment, colonne unité, unité canonique) de food_processed.xlsx : les 33
+# nutriments du schéma (dataframes_structures.json), une colonne unit_* chacun
+NUTRIENTS = [
+    ('Valeur calorique', 'unit_cal', 'kcal'),
+    ('Lipides', 'unit_lip', 'g'),
+    ('Graisses saturee', 'unit_saturee', 'g'),
+    ('Graisses mono-insaturee', 'unit_mono_ins', 'g'),
+    ('Graisses polyinsaturee', 'unit_poly_ins', 'g'),
+    ('Glucides', 'unit_glu', 'g'),
+    ('Sucre', 'unit_sucre', 'g'),
+    ('Protein', 'unit_prot', 'g'),
+    ('Fibre alimentaire', 'unit_fibre', 'g'),
+    ('Cholesterol', 'unit_chol', 'mg'),
+    ('Sodium', 'unit_sodium', 'mg'),
+    ('Eau', 'unit_eau', 'g'),
+    ('Vitamine A', 'unit_vitA', 'µg'),
+    ('Vitamine B1', 'unit_vitB1', 'mg'),
+    ('Vitamine B11', 'unit_vitB11', 'µg'),
+    ('Vitamine B12', 'unit_vitB12', 'µg'),
+    ('Vitamine B2', 'unit_vitB2', 'mg'),
+    ('Vitamine B3', 'unit_vitB3', 'mg'),
+    ('Vitamine B5', 'unit_vitB5', 'mg'),
+    ('Vitamine B6', 'unit_vitB6', 'mg'),
+    ('Vitamine C', 'unit_vitC', 'mg'),
+    ('Vitamine D', 'unit_vitD', 'µg'),
+    ('Vitamine E', 'unit_vitE', 'mg'),
+    ('Vitamine K', 'unit_vitK', 'µg'),
+    ('Calcium', 'unit_calcium', 'mg'),
+    ('Cuivre', 'unit_cuivre', 'mg'),
+    ('Fer', 'unit_fer', 'mg'),
+    ('Magnesium', 'unit_magnesium', 'mg'),
+    ('Manganese', 'unit_manganese', 'mg'),
+    ('Phosphore', 'unit_phosphore', 'mg'),
+    ('Potassium', 'unit_potassium', 'mg'),
+    ('Selenium', 'unit_selenium', 'µg'),
+    ('Zinc', 'unit_zinc', 'mg'),
+]
+
+# Facteurs de conversion vers la plus petite unité de chaque famille
+_MASS_UNITS = {'kg': 1e9, 'g': 1e6, 'mg': 1e3, 'µg': 1.0, 'μg': 1.0, 'ug': 1.0, 'mcg': 1.0}
+# Sur les étiquettes nutritionnelles, « cal » / « Cal » désigne la kilocalorie
+# (300 cal pour 100 g) : elle n'est pas convertie en calories physiques
+_ENERGY_UNITS = {'kcal': 1.0, 'cal': 1.0, 'calories': 1.0, 'kj': 1 / 4.184}
+
+
+def clean_numeric(series):
+    """
+    Vectorized cleaning of numeric columns exported with thousands separators.
+
+    Spaces are removed and, when a value holds several dots, all but the last
+    one are dropped (1.082.4 -> 1082.4). Unparseable values become NaN.
+
+    Args:
+        series (pd.Series): The raw column.
+
+    Returns:
+        pd.Series: float64 values.
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(np.float64)
+    cleaned = (
+        series.astype(str)
+        .str.replace(' ', '', regex=False)
+        .str.replace(r'\.(?=.*\.)', '', regex=True)
+    )
+    return pd.to_numeric(cleaned, errors='coerce').where(series.notna())
+
+
+def unit_factors(units, target):
+    """
+    Multiplicative factors converting each unit of a column to the target unit.
+
+    Args:
+        units (pd.Series): Unit of each value (mg, µg, g, kcal, kJ, ...).
+        target (str): The canonical unit.
+
+    Returns:
+        np.ndarray: float64 factors, NaN for unknown or incompatible units.
+    """
+    table = _ENERGY_UNITS if target.lower() in _ENERGY_UNITS else _MASS_UNITS
+    keys = {unit.lower(): factor for unit, factor in table.items()}
+    target_factor = keys[target.lower()]
+    # Valeur manquante : on suppose la valeur déjà exprimée dans l'unité cible
+    normalized = units.fillna(target).astype(str).str.strip().str.lower()
+    return (normalized.map(keys) / target_factor).to_numpy(dtype=np.float64)
+
+
+class NutrientMatrix:
+    """
+    Unit-normalized (food x nutrient) float32 matrix with an id -> row index.
+
+    The matrix is stored as plain .npy files so that every page and batch job
+    can memory-map it with zero copy and look nutrients up with NumPy fancy
+    indexing instead of DataFrame merges.
+    """
+
+    def __init__(self, values, ids, reference_quantity, nutrients, units):
+        """
+        Args:
+            values (np.ndarray): (n_foods, n_nutrients) float32 values per
+                reference quantity of food.
+            ids (np.ndarray): Food id of each row.
+            reference_quantity (np.ndarray): Reference quantity ('quantitee') of
+                each row, the portion the values refer to.
+            nutrients (list): Nutrient names, in column order.
+            units (list): Canonical unit of each nutrient.
+        """
+        self.values = values
+        self.ids = ids
+        self.reference_quantity = reference_quantity
+        self.nutrients = list(nutrients)
+        self.units = list(units)
+        self._columns = {name: col for col, name in enumerate(self.nutrients)}
+
+        # Table id -> ligne dense quand les identifiants sont des petits entiers
+        self._dense_rows = None
+        if len(ids) and np.issubdtype(ids.dtype, np.integer) and ids.min() >= 0 and ids.max() < 4 * len(ids) + 1024:
+            self._dense_rows = np.full(int(ids.max()) + 1, -1, dtype=np.int64)
+            self._dense_rows[ids] = np.arange(len(ids))
+        else:
+            self._sorted = np.argsort(ids, kind='stable')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self, food_ids):
+        """
+        Row index of each food id, -1 for unknown ids.
+
+        Args:
+            food_ids (array-like): Food ids (e.g. the aliment_id of meals).
+
+        Returns:
+            np.ndarray: int64 row indices.
+        """
+        food_ids = np.asarray(food_ids)
+        if self._dense_rows is not None:
+            in_range = (food_ids >= 0) & (food_ids < len(self._dense_rows))
+            rows = np.full(food_ids.shape, -1, dtype=np.int64)
+            rows[in_range] = self._dense_rows[food_ids[in_range].astype(np.int64)]
+            return rows
+        pos = np.searchsorted(self.ids, food_ids, sorter=self._sorted)
+        pos = np.clip(pos, 0, len(self.ids) - 1)
+        rows = self._sorted[pos]
+        return np.where(self.ids[rows] == food_ids, rows, -1)
+
+    def columns(self, nutrients):
+        """Column index of each nutrient name."""
+        return np.array([self._columns[name] for name in nutrients], dtype=np.int64)
+
+    def lookup(self, food_ids, nutrients=None):
+        """
+        Nutrient values of the given foods, NaN rows for unknown ids.
+
+        Args:
+            food_ids (array-like): Food ids.
+            nutrients (list, optional): Nutrient names, all by default.
+
+        Returns:
+            np.ndarray: (len(food_ids), n_nutrients) float32 values.
+        """
+        rows = self.rows(food_ids)
+        safe_rows = np.where(rows >= 0, rows, 0)
+        if nutrients is None:
+            result = self.values[safe_rows]
+        else:
+            result = self.values[np.ix_(safe_rows, self.columns(nutrients))]
+        result[rows < 0] = np.nan
+        return result
+
+    def save(self, directory):
+        """
+        Write the matrix as memory-mappable .npy files plus a JSON sidecar.
+
+        Args:
+            directory (str): Output directory, created if needed.
+        """
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'values.npy'), np.ascontiguousarray(self.values, dtype=np.float32))
+        np.save(os.path.join(directory, 'ids.npy'), self.ids)
+        np.save(os.path.join(directory, 'reference_quantity.npy'), self.reference_quantity)
+        with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'nutrients': self.nutrients, 'units': self.units}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Map a matrix written by save.
+
+        Args:
+            directory (str): Directory holding the matrix files.
+            mmap (bool): Memory-map the values (read-only, zero copy).
+
+        Returns:
+            NutrientMatrix: The matrix.
+        """
+        mmap_mode = 'r' if mmap else None
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        return cls(
+            np.load(os.path.join(directory, 'values.npy'), mmap_mode=mmap_mode),
+            np.load(os.path.join(directory, 'ids.npy')),
+            np.load(os.path.join(directory, 'reference_quantity.npy')),
+            meta['nutrients'],
+            meta['units']
+        )
+
+
+def compile_nutrient_matrix(food_df, nutrients=NUTRIENTS):
+    """
+    Compile the food_processed catalog into a unit-normalized NutrientMatrix.
+
+    Every nutrient is converted to its canonical unit (g, mg, µg or kcal) using
+    its unit_* column; values with an unknown unit become NaN.
+
+    Args:
+        food_df (pd.DataFrame): The content of food_processed.xlsx.
+        nutrients (list): (nutrient, unit column, canonical unit) triples.
+
+    Returns:
+        NutrientMatrix: The compiled matrix.
+    """
+    present = [n for n in nutrients if n[0] in food_df.columns]
+    values = np.empty((len(food_df), len(present)), dtype=np.float32)
+    for col, (name, unit_column, unit) in enumerate(present):
+        column = clean_numeric(food_df[name]).to_numpy(dtype=np.float64)
+        if unit_column in food_df.columns:
+            column = column * unit_factors(food_df[unit_column], unit)
+        values[:, col] = column
+
+    if 'quantitee' in food_df.columns:
+        reference_quantity = clean_numeric(food_df['quantitee']).to_numpy(dtype=np.float32)
+    else:
+        reference_quantity = np.full(len(food_df), 100, dtype=np.float32)
+
+    ids = food_df['id'].to_numpy()
+    if ids.dtype == object:
+        ids = pd.to_numeric(food_df['id']).to_numpy()
+    return NutrientMatrix(
+        values, ids, reference_quantity,
+        [n[0] for n in present], [n[2] for n in present]
+    )
+
+
+def fetch_nutrient_matrix(s3, local_dir, prefix=MATRIX_PREFIX):
+    """
+    Download the published matrix into local_dir and memory-map it.
+
+    The local copy is kept per version (ETag) of the published meta.json,
+    which publish_nutrient_matrix uploads last: a republished matrix is
+    downloaded into a new directory next to the previous one, whose mapped
+    files stay valid for the readers still using them.
+
+    Args:
+        s3 (S3Manager): Connected S3 manager.
+        local_dir (str): Local directory caching the matrix files.
+        prefix (str): S3 prefix of the published matrix.
+
+    Returns:
+        NutrientMatrix or None: The mapped matrix, None if it is not published.
+    """
+    version = s3.object_version(f"{prefix}/meta.json")
+    if version is None:
+        return None
+    version_dir = os.path.join(local_dir, version['etag'])
+    if not os.path.exists(os.path.join(version_dir, 'meta.json')):
+        os.makedirs(local_dir, exist_ok=True)
+        # Dossier temporaire renommé en une fois : plusieurs workers peuvent
+        # télécharger la même version en même temps
+        temp_dir = tempfile.mkdtemp(dir=local_dir, prefix='.part-')
+        try:
+            for name in MATRIX_FILES:
+                if not s3.download_file(f"{prefix}/{name}", os.path.join(temp_dir, name)):
+                    return None
+            try:
+                os.rename(temp_dir, version_dir)
+            except OSError:
+                pass  # Version déjà installée par un autre worker
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        for name in os.listdir(local_dir):
+            old_dir = os.path.join(local_dir, name)
+            if name != version['etag'] and not name.startswith('.part-') and os.path.isdir(old_dir):
+                shutil.rmtree(old_dir, ignore_errors=True)
+    return NutrientMatrix.load(version_dir)
+
+
+def publish_nutrient_matrix(s3, food_key=FOOD_KEY, prefix=MATRIX_PREFIX):
+    """
+    Compile food_processed.xlsx from S3 and upload the matrix files.
+
+    Args:
+        s3 (S3Manager): Connected S3 manager.
+        food_key (str): Key of the food catalog workbook.
+        prefix (str): S3 prefix of the published matrix.
+
+    Returns:
+        bool: True if every file was uploaded, False otherwise.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_food = os.path.join(temp_dir, os.path.basename(food_key))
+        if not s3.download_file(food_key, temp_food):
+            return False
+        matrix_dir = os.path.join(temp_dir, 'nutrient_matrix')
+        compile_nutrient_matrix(pd.read_excel(temp_food)).save(matrix_dir)
+        # meta.json en dernier : sa présence signale une matrice complète
+        return all(
+            s3.upload_with_overwrite(os.path.join(matrix_dir, name), f"{prefix}/{name}")
+            for name in MATRIX_FILES
+        )
+
+
+if __name__ == "__main__":
+    from AWS.s3.connect_s3 import S3Manager
+
+    publish_nutrient_matrix(S3Manager())
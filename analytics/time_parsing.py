@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+SECONDS_COLUMN = 'seconds_of_day'
+HOUR_COLUMN = 'hour'
+
+# Positions des chiffres dans 'HH:MM:SS'
+_DIGIT_POSITIONS = [0, 1, 3, 4, 6, 7]
+_COLON_POSITIONS = [2, 5]
+
+
+def parse_heure(heure):
+    """
+    Parse an 'heure' column into integer seconds of day with a fixed-format parser.
+
+    'HH:MM:SS' values are decoded from their ASCII bytes in a single vectorized
+    pass, without per-element format inference; 'HH:MM' values get zero
+    seconds. Values of type datetime.time (as read from Excel) are handled
+    through their string form, datetime columns through their time of day,
+    and numeric columns are interpreted as hours.
+
+    Args:
+        heure (pd.Series): The raw 'heure' column.
+
+    Returns:
+        np.ndarray: int32 seconds since midnight, -1 where the value is missing
+            or malformed.
+    """
+    if pd.api.types.is_numeric_dtype(heure):
+        hours = pd.to_numeric(heure, errors='coerce').to_numpy(dtype=np.float64)
+        valid = np.isfinite(hours) & (hours >= 0) & (hours < 24)
+        return np.where(valid, np.nan_to_num(hours) * 3600, -1).astype(np.int32)
+    if pd.api.types.is_datetime64_any_dtype(heure):
+        seconds = heure.dt.hour * 3600 + heure.dt.minute * 60 + heure.dt.second
+        return seconds.fillna(-1).to_numpy(dtype=np.int32)
+
+    missing = heure.isna().to_numpy()
+    text = heure.astype(str).str.strip().str.replace(r'\.\d+$', '', regex=True)
+    # 'HH:MM' : secondes nulles
+    text = text.where(text.str.len() > 5, text + ':00')
+    lengths = text.str.len().to_numpy()
+    # Les caractères non ASCII deviennent '?', donc une valeur invalide
+    raw = text.str.zfill(8).str.encode('ascii', 'replace').to_numpy(dtype='S8')
+    chars = raw.view(np.uint8).reshape(len(raw), 8).astype(np.int32)
+
+    digits = chars[:, _DIGIT_POSITIONS] - ord('0')
+    valid = (
+        ~missing
+        & (lengths <= 8)
+        & ((digits >= 0) & (digits <= 9)).all(axis=1)
+        & (chars[:, _COLON_POSITIONS] == ord(':')).all(axis=1)
+    )
+
+    hours = digits[:, 0] * 10 + digits[:, 1]
+    minutes = digits[:, 2] * 10 + digits[:, 3]
+    seconds = digits[:, 4] * 10 + digits[:, 5]
+    valid &= (hours < 24) & (minutes < 60) & (seconds < 60)
+
+    return np.where(valid, hours * 3600 + minutes * 60 + seconds, -1).astype(np.int32)
+
+
+def add_time_columns(df, column='heure'):
+    """
+    Add compact 'seconds_of_day' (int32) and 'hour' (int8) columns parsed from 'heure'.
+
+    Meant to run once at load time so that pages never parse time strings
+    during interaction. Missing or malformed times are encoded as -1.
+
+    Args:
+        df (pd.DataFrame): The dataset to enrich. Modified in place.
+        column (str): Name of the time column.
+
+    Returns:
+        pd.DataFrame: The same DataFrame, for chaining. Unchanged if it has no
+            time column.
+    """
+    if column not in df.columns:
+        return df
+    seconds = parse_heure(df[column])
+    df[SECONDS_COLUMN] = seconds
+    df[HOUR_COLUMN] = np.where(seconds >= 0, seconds // 3600, -1).astype(np.int8)
+    return df
@@ -0,0 +1,78 @@
+"""
+Benchmark of cache hits: st.cache_data copies against shared read-only views.
+
+Each simulated session reads the cached proportions table once and keeps
+the result, as a page does for the length of a rerun.
+
+Usage:
+    python -m benchmarks.bench_cache_hits --rows 2000000 --sessions 8
+"""
+import argparse
+import logging
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from loading.cache import CacheManager
+
+
+def synthetic_proportions(n_rows, n_users=2000, n_types=15, seed=0):
+    """Random user_food_proportion-like table (ids, type, date, totals and proportions)."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'user_id': rng.integers(0, n_users, n_rows),
+        'Type': np.array([f"Type_{i}" for i in range(n_types)])[rng.integers(0, n_types, n_rows)],
+        'date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, n_rows), unit='D')
+    })
+    for nutrient in ['calories', 'lipids', 'protein', 'carbs']:
+        df[f"total_{nutrient}"] = rng.gamma(2.0, 100.0, n_rows)
+        df[f"proportion_total_{nutrient}"] = rng.random(n_rows)
+    return df
+
+
+def measure_hits(get, n_sessions):
+    """Mean hit time and memory allocated by n_sessions holding their result."""
+    get()
+    tracemalloc.start()
+    start = time.perf_counter()
+    held = [get() for _ in range(n_sessions)]
+    seconds = (time.perf_counter() - start) / n_sessions
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return seconds, allocated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--sessions', type=int, default=8)
+    args = parser.parse_args()
+
+    import streamlit as st
+    # Hors d'un serveur Streamlit, st.cache_data avertit à chaque appel
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    df = synthetic_proportions(args.rows)
+    size_mb = df.memory_usage(deep=True).sum() / 2**20
+    print(f"{args.rows} rows ({size_mb:.0f} MB), {args.sessions} sessions")
+
+    @st.cache_data
+    def load_st():
+        return df
+
+    manager = CacheManager(budget_bytes=2**40)
+
+    def load_shared():
+        return manager.get_or_load(('proportions',), lambda: df.copy())
+
+    for name, get in [('st.cache_data', load_st), ('shared read-only', load_shared)]:
+        seconds, allocated = measure_hits(get, args.sessions)
+        print(f"{name:<18} hit {seconds * 1000:9.3f} ms   "
+              f"memory per session {allocated / args.sessions / 2**20:9.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark of the in-process collaborative filtering engine.
+
+Usage:
+    python -m benchmarks.bench_collaborative --users 100000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from recommender.collaborative import CollaborativeFilteringEngine
+
+
+def synthetic_proportions(n_users, n_types=15, density=0.6, seed=0):
+    """Random user_food_proportion-like data with ~density of the Types per user."""
+    rng = np.random.default_rng(seed)
+    mask = rng.random((n_users, n_types)) < density
+    users, types = np.nonzero(mask)
+    values = rng.random(len(users))
+    # Normaliser pour que les proportions d'un utilisateur somment à 1
+    totals = np.bincount(users, weights=values, minlength=n_users)
+    return pd.DataFrame({
+        'user_id': users,
+        'Type': np.array([f"Type_{i}" for i in range(n_types)])[types],
+        'proportion_total_calories': values / totals[users]
+    })
+
+
+def timed(label, func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<40} {elapsed * 1000:10.2f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--types', type=int, default=15)
+    parser.add_argument('--queries', type=int, default=100)
+    args = parser.parse_args()
+
+    df = synthetic_proportions(args.users, args.types)
+    print(f"{args.users} users, {args.types} types, {len(df)} interactions")
+
+    engine = timed("build engine", lambda: CollaborativeFilteringEngine.from_proportions(df))
+    rng = np.random.default_rng(1)
+    users = rng.choice(args.users, args.queries, replace=False)
+
+    start = time.perf_counter()
+    for user_id in users:
+        engine.recommend(user_id)
+    print(f"{'recommend (cold cache, per user)':<40} {(time.perf_counter() - start) / len(users) * 1000:10.2f} ms")
+
+    start = time.perf_counter()
+    for user_id in users:
+        engine.recommend(user_id)
+    print(f"{'recommend (warm cache, per user)':<40} {(time.perf_counter() - start) / len(users) * 1000:10.2f} ms")
+
+    new_interactions = synthetic_proportions(1_000, args.types, seed=2)
+    new_interactions['user_id'] += args.users - 500
+    timed("update (1000 users, half new)", lambda: engine.update(new_interactions))
+    timed("recommend new user", lambda: engine.recommend(args.users + 100))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark of the content-based nearest-neighbour engine.
+
+Usage:
+    python -m benchmarks.bench_content_based --foods 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from recommender.content_based import NUTRIENT_FEATURES, ContentBasedEngine
+
+
+def synthetic_catalog(n_foods, n_types=15, seed=0):
+    """Random food_processed-like catalog with the page 7 nutrient columns."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.gamma(2.0, 10.0, (n_foods, len(NUTRIENT_FEATURES))), columns=NUTRIENT_FEATURES)
+    df['id'] = np.arange(n_foods)
+    df['Aliment'] = 'Aliment_' + df['id'].astype(str)
+    df['Type'] = np.array([f"Type_{i}" for i in range(n_types)])[rng.integers(0, n_types, n_foods)]
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--foods', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    df = synthetic_catalog(args.foods)
+    rng = np.random.default_rng(1)
+    food_ids = rng.choice(args.foods, args.queries, replace=False)
+    print(f"{args.foods} foods, {args.queries} queries, k={args.k}")
+
+    exact = None
+    for index in ['brute', 'kdtree', 'lsh']:
+        start = time.perf_counter()
+        engine = ContentBasedEngine(df, index=index)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = [set(engine.similar_foods(food_id, k=args.k)['id']) for food_id in food_ids]
+        query = (time.perf_counter() - start) / len(food_ids)
+
+        if exact is None:
+            exact = results
+        recall = np.mean([len(r & e) / len(e) for r, e in zip(results, exact)])
+        print(f"{index:<8} build {build * 1000:9.1f} ms   query {query * 1000:7.2f} ms   recall@{args.k} {recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
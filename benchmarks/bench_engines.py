@@ -0,0 +1,517 @@
+"""
+DuckDB vs Pandas benchmark of the transform stages and page computations.
+
+Synthetic meal records follow the columns documented in
+dataframes_structures.json. Every (stage, engine) pair runs in a forked
+process so that its peak memory is measured in isolation.
+
+Usage:
+    python -m benchmarks.bench_engines --sizes 10000 1000000 --output report.json
+    python -m benchmarks.bench_engines --sizes 1000000 --compare previous.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import time
+from datetime import datetime
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+STRUCTURES_PATH = os.path.join(os.path.dirname(__file__), '..', 'dataframes_structures.json')
+COMBINED_KEY = "transform/folder_1_combine/combined_meal_data.xlsx"
+FOOD_KEY = "reference_data/food/food_processed.xlsx"
+
+TOTALS = {
+    'total_calories': 'Valeur calorique',
+    'total_lipids': 'Lipides',
+    'total_carbs': 'Glucides',
+    'total_protein': 'Protein'
+}
+TOTAL_COLUMNS = list(TOTALS)
+MAX_QUANTITY = 2000
+ROLLING_WINDOW = 7
+N_CLUSTERS = 5
+# Intervalle de vérification du processus de mesure
+CHILD_POLL_SECONDS = 1.0
+FOOD_TYPES = ['Fruit', 'Légume', 'Viande', 'Poisson', 'Féculent', 'Produit laitier',
+              'Boisson', 'Sucrerie', 'Céréale', 'Légumineuse', 'Oléagineux', 'Condiment']
+
+
+def _documented_columns(key):
+    with open(STRUCTURES_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)[key]['columns']
+
+
+def synthetic_dataset(n_records, n_users=None, n_foods=1000, n_days=365, seed=0):
+    """
+    Generate meal records and a food catalog with the documented schemas.
+
+    Args:
+        n_records (int): Number of meal records (one food in one meal).
+        n_users (int, optional): Number of users, n_records / 500 by default.
+        n_foods (int): Number of foods in the catalog.
+        n_days (int): Days covered by the records.
+        seed (int): Random seed.
+
+    Returns:
+        tuple: (meals, food) DataFrames. meals has the raw columns of
+            combined_meal_data (before the nutrient join), food the columns
+            of food_processed used by the combine stage.
+    """
+    rng = np.random.default_rng(seed)
+    n_users = n_users or max(n_records // 500, 10)
+    food_columns = ['id', 'Aliment', 'Type', 'quantitee'] + list(TOTALS.values())
+    documented = _documented_columns(FOOD_KEY)
+    missing = [column for column in food_columns if column not in documented]
+    if missing:
+        raise ValueError(f"Columns not documented for {FOOD_KEY}: {missing}")
+
+    food = pd.DataFrame({
+        'id': np.arange(n_foods),
+        'Aliment': [f"Aliment {i}" for i in range(n_foods)],
+        'Type': np.array(FOOD_TYPES)[rng.integers(0, len(FOOD_TYPES), n_foods)],
+        'quantitee': 100.0,
+        'Valeur calorique': rng.gamma(2.0, 80.0, n_foods),
+        'Lipides': rng.gamma(1.5, 6.0, n_foods),
+        'Glucides': rng.gamma(1.5, 12.0, n_foods),
+        'Protein': rng.gamma(1.5, 5.0, n_foods)
+    })
+
+    # Repas de 1 à 5 aliments, 2 à 4 repas par jour et par utilisateur
+    meal_of_record = np.sort(rng.integers(0, max(n_records // 3, 1), n_records))
+    meal_ids, meal_of_record = np.unique(meal_of_record, return_inverse=True)
+    n_meals = len(meal_ids)
+    meal_users = rng.integers(0, n_users, n_meals)
+    meal_days = rng.integers(0, n_days, n_meals)
+    meal_seconds = rng.choice([8, 12, 13, 16, 19, 20], n_meals) * 3600 + rng.integers(0, 3600, n_meals)
+    heures = pd.Series(pd.to_timedelta(meal_seconds, unit='s')).astype(str).str[-8:].to_numpy()
+
+    meals = pd.DataFrame({
+        'meal_record_id': np.arange(n_records),
+        'user_id': meal_users[meal_of_record],
+        'meal_id': meal_of_record,
+        'date': (pd.Timestamp('2024-01-01') + pd.to_timedelta(meal_days, unit='D'))[meal_of_record],
+        'heure': heures[meal_of_record],
+        'aliment_id': rng.integers(0, n_foods, n_records),
+        'quantity': np.round(rng.gamma(2.0, 60.0, n_records), 1)
+    })
+    documented = _documented_columns(COMBINED_KEY)
+    missing = [column for column in meals.columns if column not in documented]
+    if missing:
+        raise ValueError(f"Columns not documented for {COMBINED_KEY}: {missing}")
+    return meals, food
+
+
+# Étapes de transformation -------------------------------------------------
+
+def pandas_combine(ctx):
+    food = ctx['food'][['id', 'Aliment', 'quantitee'] + list(TOTALS.values())]
+    df = ctx['meals'].merge(food, left_on='aliment_id', right_on='id').drop(columns='id')
+    for total, source in TOTALS.items():
+        df[total] = df['quantity'] * df[source] / df['quantitee']
+    return df.drop(columns='quantitee')
+
+
+def duckdb_combine(ctx):
+    totals = ", ".join(f'm.quantity * f."{source}" / f.quantitee AS {total}' for total, source in TOTALS.items())
+    return ctx['con'].execute(f"""
+        SELECT m.*, f.Aliment, f."Valeur calorique", f.Lipides, f.Glucides, f.Protein, {totals}
+        FROM meals m JOIN food f ON m.aliment_id = f.id
+    """).df()
+
+
+def pandas_filter(ctx):
+    df = ctx['combined']
+    df = df[df['quantity'] > 0].copy()
+    df['quantity_status'] = np.where(df['quantity'] > MAX_QUANTITY, 'excessive', 'normal')
+    return df
+
+
+def duckdb_filter(ctx):
+    return ctx['con'].execute(f"""
+        SELECT *, CASE WHEN quantity > {MAX_QUANTITY} THEN 'excessive' ELSE 'normal' END AS quantity_status
+        FROM combined WHERE quantity > 0
+    """).df()
+
+
+def pandas_group(ctx):
+    return ctx['filtered'].groupby('date').agg(
+        **{column: (column, 'sum') for column in TOTAL_COLUMNS},
+        distinct_user_count=('user_id', 'nunique')
+    ).reset_index()
+
+
+def duckdb_group(ctx):
+    sums = ", ".join(f"SUM({column}) AS {column}" for column in TOTAL_COLUMNS)
+    return ctx['con'].execute(f"""
+        SELECT date, {sums}, COUNT(DISTINCT user_id) AS distinct_user_count
+        FROM filtered GROUP BY date ORDER BY date
+    """).df()
+
+
+def pandas_user_daily(ctx):
+    return ctx['filtered'].groupby(['date', 'user_id'])[TOTAL_COLUMNS].sum().reset_index()
+
+
+def duckdb_user_daily(ctx):
+    sums = ", ".join(f"SUM({column}) AS {column}" for column in TOTAL_COLUMNS)
+    return ctx['con'].execute(f"SELECT date, user_id, {sums} FROM filtered GROUP BY date, user_id").df()
+
+
+def pandas_daily_window(ctx):
+    df = ctx['daily'].sort_values('date').copy()
+    df['weekday'] = df['date'].dt.day_name()
+    for column in TOTAL_COLUMNS:
+        df[f'rolling_avg_{column}'] = df[column].rolling(ROLLING_WINDOW, min_periods=1).mean()
+    return df
+
+
+def _rolling_sql(partition=''):
+    over = f"PARTITION BY {partition} ORDER BY date" if partition else "ORDER BY date"
+    return ", ".join(
+        f"AVG({column}) OVER ({over} ROWS BETWEEN {ROLLING_WINDOW - 1} PRECEDING AND CURRENT ROW) "
+        f"AS rolling_avg_{column}"
+        for column in TOTAL_COLUMNS
+    )
+
+
+def duckdb_daily_window(ctx):
+    return ctx['con'].execute(
+        f"SELECT *, dayname(date) AS weekday, {_rolling_sql()} FROM daily ORDER BY date"
+    ).df()
+
+
+def pandas_user_window(ctx):
+    df = ctx['user_daily'].sort_values(['user_id', 'date']).copy()
+    rolling = df.groupby('user_id')[TOTAL_COLUMNS].rolling(ROLLING_WINDOW, min_periods=1).mean()
+    for column in TOTAL_COLUMNS:
+        df[f'rolling_avg_{column}'] = rolling[column].to_numpy()
+    return df
+
+
+def duckdb_user_window(ctx):
+    return ctx['con'].execute(
+        f"SELECT *, {_rolling_sql('user_id')} FROM user_daily ORDER BY user_id, date"
+    ).df()
+
+
+def pandas_food_proportion(ctx):
+    df = ctx['filtered'].merge(ctx['food'][['id', 'Type']], left_on='aliment_id', right_on='id')
+    df = df.groupby(['user_id', 'Type'])[TOTAL_COLUMNS].sum().reset_index()
+    totals = df.groupby('user_id')[TOTAL_COLUMNS].transform('sum')
+    for column in TOTAL_COLUMNS:
+        df[f'proportion_{column}'] = df[column] / totals[column]
+    return df
+
+
+def duckdb_food_proportion(ctx):
+    sums = ", ".join(f"SUM(m.{column}) AS {column}" for column in TOTAL_COLUMNS)
+    proportions = ", ".join(
+        f"{column} / SUM({column}) OVER (PARTITION BY user_id) AS proportion_{column}" for column in TOTAL_COLUMNS
+    )
+    return ctx['con'].execute(f"""
+        SELECT *, {proportions} FROM (
+            SELECT m.user_id, f.Type, {sums}
+            FROM filtered m JOIN food f ON m.aliment_id = f.id
+            GROUP BY m.user_id, f.Type
+        )
+    """).df()
+
+
+def pandas_daily_pct_change(ctx):
+    df = ctx['daily_window'].copy()
+    for column in TOTAL_COLUMNS:
+        df[f'percentage_change_{column}'] = df[column].pct_change() * 100
+    return df
+
+
+def _pct_change_sql(partition=''):
+    over = f"PARTITION BY {partition} ORDER BY date" if partition else "ORDER BY date"
+    return ", ".join(
+        f"({column} - LAG({column}) OVER ({over})) * 100.0 / LAG({column}) OVER ({over}) "
+        f"AS percentage_change_{column}"
+        for column in TOTAL_COLUMNS
+    )
+
+
+def duckdb_daily_pct_change(ctx):
+    return ctx['con'].execute(f"SELECT *, {_pct_change_sql()} FROM daily_window ORDER BY date").df()
+
+
+def pandas_user_pct_change(ctx):
+    df = ctx['user_window'].copy()
+    changes = df.groupby('user_id')[TOTAL_COLUMNS].pct_change() * 100
+    for column in TOTAL_COLUMNS:
+        df[f'percentage_change_{column}'] = changes[column]
+    return df
+
+
+def duckdb_user_pct_change(ctx):
+    return ctx['con'].execute(
+        f"SELECT *, {_pct_change_sql('user_id')} FROM user_window ORDER BY user_id, date"
+    ).df()
+
+
+# Calculs des pages --------------------------------------------------------
+
+def pandas_type_stats(ctx):
+    columns = [f'proportion_{column}' for column in TOTAL_COLUMNS]
+    return ctx['food_proportion'].groupby('Type')[columns].agg(['mean', 'std', 'count'])
+
+
+def duckdb_type_stats(ctx):
+    aggregates = ", ".join(
+        f"AVG(proportion_{column}) AS mean_{column}, STDDEV_SAMP(proportion_{column}) AS std_{column}"
+        for column in TOTAL_COLUMNS
+    )
+    return ctx['con'].execute(
+        f"SELECT Type, {aggregates}, COUNT(*) AS count FROM food_proportion GROUP BY Type"
+    ).df()
+
+
+def pandas_user_history(ctx):
+    df = ctx['user_pct_change']
+    user = df[df['user_id'] == ctx['user_id']].sort_values('date')
+    return user[TOTAL_COLUMNS].rolling(ROLLING_WINDOW).mean().join(user[TOTAL_COLUMNS].pct_change() * 100, rsuffix='_pct')
+
+
+def duckdb_user_history(ctx):
+    return ctx['con'].execute(f"""
+        SELECT date, {_rolling_sql()}, {_pct_change_sql()}
+        FROM user_pct_change WHERE user_id = $user_id ORDER BY date
+    """, {'user_id': ctx['user_id']}).df()
+
+
+def pandas_daily_stats(ctx):
+    df = ctx['daily_pct_change']
+    return df[TOTAL_COLUMNS + [f'percentage_change_{c}' for c in TOTAL_COLUMNS]].describe()
+
+
+def duckdb_daily_stats(ctx):
+    return ctx['con'].execute("SUMMARIZE daily_pct_change").df()
+
+
+def pandas_cluster_merge(ctx):
+    columns = [f'proportion_{column}' for column in TOTAL_COLUMNS]
+    df = ctx['clusters'].merge(ctx['food_proportion'], on='user_id')
+    return df.groupby(['cluster', 'Type'])[columns].mean()
+
+
+def duckdb_cluster_merge(ctx):
+    means = ", ".join(f"AVG(p.proportion_{column}) AS proportion_{column}" for column in TOTAL_COLUMNS)
+    return ctx['con'].execute(f"""
+        SELECT c.cluster, p.Type, {means}
+        FROM clusters c JOIN food_proportion p USING (user_id)
+        GROUP BY c.cluster, p.Type
+    """).df()
+
+
+# (nom, sortie réutilisée par les tâches suivantes, implémentation pandas, implémentation duckdb)
+TASKS = [
+    ('stage_1_combine', 'combined', pandas_combine, duckdb_combine),
+    ('stage_2_filter', 'filtered', pandas_filter, duckdb_filter),
+    ('stage_3_group_daily', 'daily', pandas_group, duckdb_group),
+    ('stage_3_group_user_daily', 'user_daily', pandas_user_daily, duckdb_user_daily),
+    ('stage_4_window_daily', 'daily_window', pandas_daily_window, duckdb_daily_window),
+    ('stage_4_window_user_daily', 'user_window', pandas_user_window, duckdb_user_window),
+    ('stage_4_food_proportion', 'food_proportion', pandas_food_proportion, duckdb_food_proportion),
+    ('stage_5_pct_change_daily', 'daily_pct_change', pandas_daily_pct_change, duckdb_daily_pct_change),
+    ('stage_5_pct_change_user_daily', 'user_pct_change', pandas_user_pct_change, duckdb_user_pct_change),
+    ('page_1_type_stats', None, pandas_type_stats, duckdb_type_stats),
+    ('page_2_user_history', None, pandas_user_history, duckdb_user_history),
+    ('page_3_daily_stats', None, pandas_daily_stats, duckdb_daily_stats),
+    ('page_4_cluster_merge', None, pandas_cluster_merge, duckdb_cluster_merge),
+]
+
+
+def _current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _reset_peak_rss():
+    """Reset the kernel's peak RSS mark (Linux), so VmHWM only covers what follows."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb(reset):
+    if reset:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _measure(func, ctx, repeat):
+    """Best wall time over repeat runs and peak RSS growth above the start, in MB."""
+    reset = _reset_peak_rss()
+    start_rss = _current_rss_mb()
+    timings = []
+    rows = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(ctx)
+        timings.append(time.perf_counter() - start)
+        rows = len(result)
+        del result
+    return {'seconds': min(timings), 'peak_mb': max(_peak_rss_mb(reset) - start_rss, 0.0), 'rows_out': rows}
+
+
+def _measure_in_child(func, ctx, repeat):
+    # Le processus enfant hérite des données par fork : sa mémoire de pointe n'inclut que la tâche
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+
+    def target():
+        ctx['con'] = _connect(ctx)
+        sender.send(_measure(func, ctx, repeat))
+
+    process = context.Process(target=target)
+    process.start()
+    # Seul l'enfant garde l'extrémité d'écriture : sa mort ferme le tube
+    sender.close()
+    try:
+        while not receiver.poll(CHILD_POLL_SECONDS):
+            if process.exitcode is not None:
+                break
+        try:
+            return receiver.recv()
+        except EOFError:
+            process.join()
+            raise RuntimeError(f"Measurement process exited with code {process.exitcode} without a result")
+    finally:
+        receiver.close()
+        process.join()
+
+
+def _connect(ctx):
+    con = duckdb.connect()
+    for name, value in ctx.items():
+        if isinstance(value, pd.DataFrame):
+            con.register(name, value)
+    return con
+
+
+def run_benchmark(sizes, repeat=3, isolate=True, seed=0):
+    """
+    Time every stage and page computation on both engines.
+
+    Args:
+        sizes (list): Numbers of meal records.
+        repeat (int): Runs per measurement, the best time is kept.
+        isolate (bool): Run each measurement in a forked process.
+        seed (int): Random seed of the synthetic data.
+
+    Returns:
+        dict: Machine-readable report with environment details and one
+            result per (size, task, engine).
+    """
+    results = []
+    isolate = isolate and 'fork' in multiprocessing.get_all_start_methods()
+    for size in sizes:
+        meals, food = synthetic_dataset(size, seed=seed)
+        ctx = {'meals': meals, 'food': food}
+        users = np.sort(meals['user_id'].unique())
+        ctx['user_id'] = int(users[len(users) // 2])
+        ctx['clusters'] = pd.DataFrame({'user_id': users, 'cluster': users % N_CLUSTERS})
+        for name, output, pandas_func, duckdb_func in TASKS:
+            for engine, func in (('pandas', pandas_func), ('duckdb', duckdb_func)):
+                if isolate:
+                    measurement = _measure_in_child(func, ctx, repeat)
+                else:
+                    ctx['con'] = _connect(ctx)
+                    measurement = _measure(func, ctx, repeat)
+                results.append({'size': size, 'task': name, 'engine': engine, **measurement})
+                print(f"{size:>10} {name:<32} {engine:<7} {measurement['seconds'] * 1000:10.1f} ms "
+                      f"{measurement['peak_mb']:8.1f} MB")
+            if output is not None:
+                # Entrée des tâches suivantes, identique pour les deux moteurs
+                ctx[output] = pandas_func(ctx)
+        del ctx, meals, food
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'created_at': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'pandas': pd.__version__,
+            'duckdb': duckdb.__version__,
+            'numpy': np.__version__
+        },
+        'repeat': repeat,
+        'results': results
+    }
+
+
+def compare_reports(previous, current):
+    """
+    Relative change of wall time and peak memory between two reports.
+
+    Args:
+        previous (dict): Baseline report.
+        current (dict): New report.
+
+    Returns:
+        pd.DataFrame: One row per (size, task, engine) present in both, with
+            the time and memory ratios (current / previous).
+    """
+    keys = ['size', 'task', 'engine']
+    merged = pd.DataFrame(previous['results']).merge(
+        pd.DataFrame(current['results']), on=keys, suffixes=('_before', '_after')
+    )
+    merged['time_ratio'] = merged['seconds_after'] / merged['seconds_before']
+    merged['memory_ratio'] = merged['peak_mb_after'] / merged['peak_mb_before'].where(merged['peak_mb_before'] > 0)
+    return merged[keys + ['seconds_before', 'seconds_after', 'time_ratio',
+                          'peak_mb_before', 'peak_mb_after', 'memory_ratio']]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help="Meal record counts, from 10k up to 50M")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-isolate', action='store_true', help="Measure in the main process")
+    parser.add_argument('--output', default=None, help="Write the JSON report to this path")
+    parser.add_argument('--compare', default=None, help="Baseline JSON report to compare with")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.sizes, args.repeat, not args.no_isolate)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    summary = pd.DataFrame(report['results']).pivot_table(
+        index=['size', 'task'], columns='engine', values='seconds'
+    )
+    summary['duckdb_speedup'] = summary['pandas'] / summary['duckdb']
+    print(summary.round(4).to_string())
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            print(compare_reports(json.load(f), report).round(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark of the meal-nutrient engine against the SQL join of the combined_meal_data stage.
+
+Usage:
+    python -m benchmarks.bench_meal_nutrients --records 5000000
+"""
+import argparse
+import time
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from analytics.meal_nutrients import MACRO_TOTALS, add_macro_totals, compute_meal_nutrients
+from analytics.nutrient_matrix import NUTRIENTS, compile_nutrient_matrix
+
+
+def synthetic_catalog(n_foods, seed=0):
+    """Random food_processed-like catalog with the 33 nutrients and their unit columns."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'id': np.arange(1, n_foods + 1), 'quantitee': 100.0})
+    df['Aliment'] = 'Aliment_' + df['id'].astype(str)
+    for name, unit_column, unit in NUTRIENTS:
+        df[name] = rng.gamma(2.0, 10.0, n_foods)
+        df[unit_column] = unit
+    return df
+
+
+def synthetic_meals(n_records, n_foods, seed=0):
+    """Meal records with random foods (1% unknown) and quantities."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'aliment_id': rng.integers(1, int(n_foods * 1.01) + 1, n_records),
+        'quantity': rng.uniform(10, 500, n_records)
+    })
+
+
+def _best(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=5_000_000)
+    parser.add_argument('--foods', type=int, default=2_000)
+    parser.add_argument('--batch-size', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    catalog = synthetic_catalog(args.foods)
+    meals = synthetic_meals(args.records, args.foods)
+    matrix = compile_nutrient_matrix(catalog)
+    print(f"{args.records} records, {args.foods} foods, batch {args.batch_size}")
+
+    con = duckdb.connect()
+    con.register('raw', meals)
+    con.register('food', catalog[['id', 'quantitee'] + list(MACRO_TOTALS.values())])
+    totals = ", ".join(
+        f"r.quantity * f.\"{source}\" / NULLIF(f.quantitee, 0) AS {column}"
+        for column, source in MACRO_TOTALS.items()
+    )
+    timings = {
+        'duckdb join (4 macros)': lambda: con.execute(
+            f"SELECT r.*, {totals} FROM raw r JOIN food f ON r.aliment_id = f.id"
+        ).df(),
+        'engine (4 macros)': lambda: add_macro_totals(meals.copy(), matrix, args.batch_size),
+        f'engine (all {len(matrix.nutrients)} nutrients)': lambda: compute_meal_nutrients(
+            meals, matrix, batch_size=args.batch_size
+        )
+    }
+    for name, function in timings.items():
+        print(f"{name:<28} {_best(function, args.repeat) * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
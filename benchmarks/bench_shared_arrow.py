@@ -0,0 +1,116 @@
+"""
+Benchmark of worker processes holding a dataset: private copies against
+memory-mapped Arrow files shared through loading.arrow_store.
+
+Each worker loads the synthetic proportions table, either by decoding its
+Parquet file with DuckDB (as the pages do) or by mapping the shared Arrow
+file, reads every column and reports its memory once all workers are
+loaded. The total proportional set size (PSS, shared pages divided between
+the processes which map them) is the memory the workers really cost.
+
+Linux only (reads /proc/self/smaps_rollup).
+
+Usage:
+    python -m benchmarks.bench_shared_arrow --rows 2000000 --workers 1 2 4 8
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import tempfile
+import time
+
+import duckdb
+
+from benchmarks.bench_cache_hits import synthetic_proportions
+from loading.arrow_store import ArrowStore
+
+KEY = ('bench_proportions',)
+
+
+def _memory_mb():
+    """Rss and Pss of the current process, in MB."""
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            field, _, rest = line.partition(':')
+            if field in ('Rss', 'Pss'):
+                values[field] = int(rest.split()[0]) / 1024
+    return values
+
+
+def _worker(mode, parquet_path, store_root, barrier, results):
+    start = time.perf_counter()
+    if mode == 'private':
+        connection = duckdb.connect()
+        connection.execute("SET enable_progress_bar = false")
+        df = connection.sql(f"SELECT * FROM read_parquet('{parquet_path}')").df()
+    else:
+        df = ArrowStore(store_root).load(KEY)
+    seconds = time.perf_counter() - start
+    # Lire toutes les colonnes, comme le ferait une page
+    for column in df.columns:
+        df[column].min()
+    barrier.wait()
+    results.put({'seconds': seconds, **_memory_mb()})
+    barrier.wait()
+
+
+def run(mode, n_workers, parquet_path, store_root):
+    """Load the dataset in n_workers processes at once and sum their memory."""
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(n_workers)
+    results = ctx.Queue()
+    workers = [
+        ctx.Process(target=_worker, args=(mode, parquet_path, store_root, barrier, results))
+        for _ in range(n_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    measures = []
+    while len(measures) < n_workers:
+        try:
+            measures.append(results.get(timeout=1))
+        except queue.Empty:
+            if any(worker.exitcode not in (None, 0) for worker in workers):
+                for worker in workers:
+                    worker.terminate()
+                raise RuntimeError(f"a {mode} worker died (out of memory?)")
+    for worker in workers:
+        worker.join()
+    return {
+        'load_seconds': max(m['seconds'] for m in measures),
+        'rss_mb': sum(m['Rss'] for m in measures),
+        'pss_mb': sum(m['Pss'] for m in measures)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        df = synthetic_proportions(args.rows)
+        parquet_path = os.path.join(temp_dir, 'proportions.parquet')
+        df.to_parquet(parquet_path)
+        store_root = os.path.join(temp_dir, 'arrow')
+        ArrowStore(store_root).save(KEY, df)
+        print(f"{args.rows} rows ({df.memory_usage(deep=True).sum() / 2**20:.0f} MB in pandas)")
+        del df
+
+        print(f"{'workers':>7}  {'mode':<8} {'load (s)':>9} {'total RSS (MB)':>15} {'total PSS (MB)':>15}")
+        for n_workers in args.workers:
+            for mode in ['private', 'shared']:
+                try:
+                    result = run(mode, n_workers, parquet_path, store_root)
+                except RuntimeError as e:
+                    print(f"{n_workers:>7}  {mode:<8} {e}")
+                    continue
+                print(f"{n_workers:>7}  {mode:<8} {result['load_seconds']:>9.3f} "
+                      f"{result['rss_mb']:>15.0f} {result['pss_mb']:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Headless load test of Home.py and the pages with concurrent AppTest sessions.
+
+Each simulated session opens a page and then performs random widget
+interactions (user and cluster switches, date ranges, sliders, metric
+selections), each one triggering a rerun. Every session runs in its own
+process: AppTest keeps per-process script state, and concurrent AppTest
+instances in threads of one process fail on each other's widget ids.
+Sessions still share the datasets of the loaders declared with shared=True
+through the memory-mapped Arrow files of loading.arrow_store, like the
+Streamlit processes of one container.
+
+Usage:
+    python -m benchmarks.seed_local_s3 --root /tmp/food-s3
+    S3_LOCAL_ROOT=/tmp/food-s3 python -m benchmarks.load_test --sessions 1 4 8 --interactions 10
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SCRIPTS = [os.path.join(ROOT, 'Home.py')] + sorted(glob.glob(os.path.join(ROOT, 'pages', '*.py')))
+
+
+def _raw_option(widget, label):
+    """
+    Recover the raw option behind a formatted selectbox label.
+
+    AppTest only exposes formatted labels, and re-applies format_func when a
+    value is set; the pages format user ids as "Utilisateur {id}", so the id
+    is searched among the label's tokens.
+    """
+    format_func = widget.format_func
+    for token in [label] + label.split():
+        for candidate in (token, int(token) if token.lstrip('-').isdigit() else None):
+            try:
+                if candidate is not None and format_func(candidate) == label:
+                    return candidate
+            except Exception:
+                continue
+    return label
+
+
+def _interact(at, rng):
+    """Change one random widget to a random valid value. Returns its kind, None if none."""
+    candidates = (
+        [('selectbox', w) for w in at.selectbox if len(w.options) > 1]
+        + [('slider', w) for w in at.slider]
+        + [('radio', w) for w in at.radio if len(w.options) > 1]
+        + [('multiselect', w) for w in at.multiselect if w.options]
+        + [('date_input', w) for w in at.date_input]
+        + [('checkbox', w) for w in at.checkbox]
+    )
+    if not candidates:
+        return None
+    kind, widget = rng.choice(candidates)
+    if kind == 'selectbox':
+        widget.set_value(_raw_option(widget, rng.choice(widget.options)))
+    elif kind == 'slider':
+        low, high = widget.min, widget.max
+        if isinstance(low, (int, float)) and not isinstance(low, bool) and high > low:
+            values = sorted(rng.uniform(low, high) for _ in range(2))
+            if isinstance(low, int) and isinstance(high, int):
+                values = [int(round(v)) for v in values]
+            widget.set_value(tuple(values) if isinstance(widget.value, (tuple, list)) else values[-1])
+    elif kind == 'radio':
+        widget.set_value(rng.choice(widget.options))
+    elif kind == 'multiselect':
+        widget.set_value(rng.sample(widget.options, rng.randint(1, min(3, len(widget.options)))))
+    elif kind == 'date_input':
+        value = widget.value
+        if isinstance(value, (tuple, list)) and len(value) == 2 and value[1] > value[0]:
+            # Sous-période aléatoire de la période affichée
+            span = (value[1] - value[0]).days
+            start = value[0] + timedelta(days=rng.randrange(span))
+            widget.set_value((start, start + timedelta(days=rng.randint(1, max(value[1] - start, timedelta(days=1)).days))))
+        else:
+            return None
+    elif kind == 'checkbox':
+        widget.set_value(not widget.value)
+    return kind
+
+
+def _run_session(script, interactions, seed, timeout):
+    """
+    Drive one session, in its own process.
+
+    Returns:
+        tuple: The rerun records and the peak RSS of the process in MB.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    records = []
+    rng = random.Random(seed)
+    page = os.path.basename(script)
+    at = AppTest.from_file(script, default_timeout=timeout)
+
+    def rerun(action):
+        start = time.perf_counter()
+        error = None
+        try:
+            at.run()
+            if at.exception:
+                error = at.exception[0].value
+        except Exception as e:
+            error = str(e)
+        records.append({'page': page, 'action': action, 'seconds': time.perf_counter() - start,
+                        'error': error[:300] if error else None})
+
+    rerun('open')
+    for _ in range(interactions):
+        try:
+            action = _interact(at, rng)
+        except Exception as e:
+            records.append({'page': page, 'action': 'interact', 'seconds': 0.0, 'error': str(e)[:300]})
+            continue
+        if action is None:
+            break
+        rerun(action)
+    return records, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _percentiles(seconds):
+    if not seconds:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    p50, p95, p99 = np.percentile(np.asarray(seconds) * 1000, [50, 95, 99])
+    return {'p50_ms': round(float(p50), 1), 'p95_ms': round(float(p95), 1), 'p99_ms': round(float(p99), 1)}
+
+
+def run_load(n_sessions, interactions=10, scripts=SCRIPTS, timeout=300, seed=0):
+    """
+    Run n_sessions concurrent sessions spread over the scripts.
+
+    Args:
+        n_sessions (int): Number of concurrent sessions.
+        interactions (int): Widget interactions per session after opening the page.
+        scripts (list): Streamlit scripts to drive, assigned round-robin.
+        timeout (float): Per-rerun timeout in seconds.
+        seed (int): Random seed of the interactions.
+
+    Returns:
+        dict: Latency percentiles (overall and per page) and throughput of
+            the reruns that succeeded, error count and peak RSS of the
+            session processes.
+    """
+    context = multiprocessing.get_context('spawn')
+    start = time.perf_counter()
+    # Un processus neuf par session
+    with context.Pool(n_sessions, maxtasksperchild=1) as pool:
+        sessions = pool.starmap(
+            _run_session,
+            [(scripts[i % len(scripts)], interactions, seed * 1000 + i, timeout) for i in range(n_sessions)],
+            chunksize=1
+        )
+    elapsed = time.perf_counter() - start
+
+    records = [record for session_records, _ in sessions for record in session_records]
+    peak_rss = [rss for _, rss in sessions]
+    errors = [r for r in records if r['error']]
+    # Les réexécutions en erreur ne comptent ni dans les latences ni dans le débit
+    reruns = [r for r in records if r['action'] != 'interact' and not r['error']]
+    by_page = {}
+    for record in reruns:
+        by_page.setdefault(record['page'], []).append(record['seconds'])
+    return {
+        'sessions': n_sessions,
+        'reruns': len(reruns),
+        'wall_seconds': round(elapsed, 3),
+        'throughput_reruns_per_second': round(len(reruns) / elapsed, 3) if elapsed else None,
+        **_percentiles([r['seconds'] for r in reruns]),
+        'first_run': _percentiles([r['seconds'] for r in reruns if r['action'] == 'open']),
+        'pages': {page: _percentiles(seconds) for page, seconds in sorted(by_page.items())},
+        'errors': len(errors),
+        'error_samples': sorted({f"{r['page']}: {r['error']}" for r in errors})[:10],
+        'peak_rss_mb_per_session': round(float(np.mean(peak_rss)), 1),
+        'max_peak_rss_mb': round(float(np.max(peak_rss)), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 4, 8],
+                        help="Concurrent session counts to test, in order")
+    parser.add_argument('--interactions', type=int, default=10)
+    parser.add_argument('--pages', nargs='*', default=None,
+                        help="Substrings selecting the scripts to drive (all by default)")
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--output', default=None, help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    if not os.getenv('S3_LOCAL_ROOT'):
+        parser.error("S3_LOCAL_ROOT must point to a seeded local bucket (see benchmarks.seed_local_s3)")
+    scripts = [s for s in SCRIPTS if not args.pages or any(p in os.path.basename(s) for p in args.pages)]
+
+    # Les pages écrivent leurs fichiers temporaires dans le répertoire courant
+    os.chdir(tempfile.mkdtemp(prefix="load_test_"))
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'scripts': [os.path.relpath(s, ROOT) for s in scripts],
+        'interactions_per_session': args.interactions,
+        'runs': []
+    }
+    for n_sessions in args.sessions:
+        result = run_load(n_sessions, args.interactions, scripts, args.timeout)
+        report['runs'].append(result)
+        print(f"{n_sessions:>4} sessions  p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms  "
+              f"p99 {result['p99_ms']} ms  {result['throughput_reruns_per_second']} reruns/s  "
+              f"{result['peak_rss_mb_per_session']} MB/session  {result['errors']} errors")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Populate a local S3 stand-in directory with synthetic versions of every artifact the pages read.
+
+Usage:
+    python -m benchmarks.seed_local_s3 --root /tmp/food-s3 --records 50000
+    S3_LOCAL_ROOT=/tmp/food-s3 streamlit run Home.py
+"""
+import argparse
+import os
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+import recommender.store as rec_store
+from AWS.s3.connect_s3 import S3Manager
+from analytics.anomaly_index import INDEX_KEY, RESULTS_KEY, AnomalyIndex
+from analytics.anomaly_scorer import StreamingAnomalyScorer
+from analytics.clustering import ANALYSIS_KEY, USER_CLUSTERS_KEY, IncrementalClusterModel, compute_user_features
+from analytics.nutrient_matrix import FOOD_KEY, NUTRIENTS, publish_nutrient_matrix
+from benchmarks import bench_engines as engines
+from recommender.collaborative import CollaborativeFilteringEngine
+from recommender.content_based import ContentBasedEngine
+
+FOLDER_6 = "transform/folder_6_parquet"
+MEALS_KEY = "transform/folder_2_filter_data/combined_meal_data_filtered.xlsx"
+PROPORTIONS_XLSX_KEY = "transform/folder_4_windows_function/type_food/user_food_proportion_pandas.xlsx"
+ANOMALY_STATS_KEY = "AI/anomaly_detection/results/model_statistics.json"
+CF_STATS_KEY = "AI/recommender/collaborative_filtering/results/stats.json"
+CB_STATS_KEY = "AI/recommender/content_based/results/stats.json"
+CB_RECOMMENDATIONS_KEY = "AI/recommender/content_based/results/recommendations.json"
+
+
+def _food_catalog(food, rng):
+    """Extend the benchmark catalog with every food_processed nutrient and unit column."""
+    catalog = food[['id', 'Aliment', 'Type', 'quantitee']].copy()
+    catalog['unit_quantity'] = 'g'
+    for name, unit_column, unit in NUTRIENTS:
+        catalog[name] = food[name] if name in food.columns else np.round(rng.gamma(1.2, 2.0, len(food)), 3)
+        catalog[unit_column] = unit
+    return catalog
+
+
+def _put_json(s3, data, key):
+    if not s3.upload_json(data, key):
+        raise RuntimeError(f"Could not write {key}")
+
+
+def _metrics(rng):
+    return {'mae': float(rng.uniform(0.3, 1.2)), 'rmse': float(rng.uniform(0.5, 1.6)),
+            'coverage': float(rng.uniform(60, 99))}
+
+
+def seed_bucket(root, n_records=50_000, seed=0):
+    """
+    Write synthetic artifacts under root, at the keys the pages read.
+
+    Args:
+        root (str): Directory used as S3_LOCAL_ROOT.
+        n_records (int): Number of synthetic meal records.
+        seed (int): Random seed.
+
+    Returns:
+        dict: Number of records, users and foods written.
+    """
+    rng = np.random.default_rng(seed)
+    os.environ['S3_LOCAL_ROOT'] = root
+    s3 = S3Manager()
+    meals, food = engines.synthetic_dataset(n_records, seed=seed)
+    ctx = {'meals': meals, 'food': food}
+    for _, output, pandas_func, _ in engines.TASKS:
+        if output is not None:
+            ctx[output] = pandas_func(ctx)
+    users = np.sort(meals['user_id'].unique())
+    timestamp = datetime.now().isoformat()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        def put_frame(df, key):
+            path = os.path.join(temp_dir, os.path.basename(key))
+            if key.endswith('.xlsx'):
+                df.to_excel(path, index=False)
+            else:
+                df.to_parquet(path, index=False)
+            s3.upload_file(path, key)
+
+        # Étapes de transformation
+        for engine in ['duckdb', 'pandas']:
+            put_frame(ctx['food_proportion'],
+                      f"{FOLDER_6}/folder_4_windows_function_filtered/user_food_proportion_{engine}.parquet")
+            put_frame(ctx['user_pct_change'],
+                      f"{FOLDER_6}/folder_5_percentage_change_filtered/user_daily_percentage_change_{engine}.parquet")
+            put_frame(ctx['daily_pct_change'],
+                      f"{FOLDER_6}/folder_5_percentage_change_filtered/daily_percentage_change_{engine}.parquet")
+        put_frame(ctx['filtered'], MEALS_KEY)
+        put_frame(ctx['food_proportion'], PROPORTIONS_XLSX_KEY)
+        catalog = _food_catalog(food, rng)
+        put_frame(catalog, FOOD_KEY)
+        publish_nutrient_matrix(s3)
+
+        # Clustering
+        features = compute_user_features(ctx['filtered'])
+        model = IncrementalClusterModel.fit(features, min(engines.N_CLUSTERS, len(features)))
+        put_frame(model.assignments(), USER_CLUSTERS_KEY)
+        _put_json(s3, model.cluster_analysis(), ANALYSIS_KEY)
+
+        # Détection d'anomalies
+        meal_level = ctx['filtered'].groupby(['user_id', 'meal_id']).agg(
+            date=('date', 'first'), heure=('heure', 'first'),
+            **{column: (column, 'sum') for column in engines.TOTAL_COLUMNS}
+        ).reset_index()
+        scored = StreamingAnomalyScorer(threshold=2.0).score_batch(meal_level)
+        scored['anomaly_score'] = scored['anomaly_score'].fillna(0.0)
+        put_frame(scored, RESULTS_KEY)
+        index_path = os.path.join(temp_dir, "anomaly_index.parquet")
+        AnomalyIndex(scored).to_parquet(index_path)
+        s3.upload_file(index_path, INDEX_KEY)
+        anomalies = scored[scored['is_anomaly']]
+        _put_json(s3, {
+            'general_statistics': {'anomaly_rate': round(100 * len(anomalies) / max(len(scored), 1), 2)},
+            'anomaly_statistics': {'mean_anomaly_score': float(anomalies['anomaly_score'].mean() or 0)},
+            'nutrient_statistics': {'anomalies': {
+                column: {'mean': float(anomalies[column].mean() or 0), 'std': float(anomalies[column].std() or 0)}
+                for column in engines.TOTAL_COLUMNS
+            }}
+        }, ANOMALY_STATS_KEY)
+
+        # Recommandations collaboratives
+        cf_engine = CollaborativeFilteringEngine.from_proportions(ctx['food_proportion'])
+        recommendations = {model_type: {} for model_type in rec_store.MODEL_TYPES}
+        for user_id in users:
+            for model_type, recs in cf_engine.recommend(user_id).items():
+                recommendations[model_type][str(user_id)] = recs
+        _put_json(s3, recommendations, rec_store.MONOLITHIC_KEY)
+        rec_store.publish_sharded_recommendations(s3, recommendations)
+        _put_json(s3, {
+            'general_statistics': {'total_users': len(users), 'total_items': int(food['Type'].nunique()),
+                                   'total_interactions': len(ctx['food_proportion']), 'timestamp': timestamp},
+            'model_metrics': {model_type: _metrics(rng) for model_type in rec_store.MODEL_TYPES}
+        }, CF_STATS_KEY)
+
+        # Recommandations par contenu
+        cb_engine = ContentBasedEngine(catalog)
+        examples = {}
+        for user_id in users[:20]:
+            prefs = ctx['food_proportion'][ctx['food_proportion']['user_id'] == user_id]
+            profile = cb_engine.type_profile(dict(zip(prefs['Type'], prefs['proportion_total_calories'])))
+            recs = cb_engine.recommend(profile, k=10)
+            examples[str(user_id)] = [
+                {'Nom': row.Aliment, 'Type': row.Type, 'similarity': float(row.similarity)}
+                for row in recs.itertuples()
+            ]
+        _put_json(s3, examples, CB_RECOMMENDATIONS_KEY)
+        _put_json(s3, {
+            'general_statistics': {'total_users': len(users), 'timestamp': timestamp},
+            'model_metrics': {'content_based': _metrics(rng)}
+        }, CB_STATS_KEY)
+
+    return {'records': n_records, 'users': len(users), 'foods': len(food)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed a local S3 stand-in with synthetic artifacts")
+    parser.add_argument('--root', required=True)
+    parser.add_argument('--records', type=int, default=50_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(seed_bucket(args.root, args.records, args.seed))
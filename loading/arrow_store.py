@@ -0,0 +1,274 @@
+"""
+Decoded datasets shared between Streamlit processes as Arrow IPC files.
+
+When the app runs as several Streamlit processes behind a load balancer,
+each one would otherwise download, decode and hold its own copy of every
+dataset. The store materializes a loader's DataFrame once into an Arrow IPC
+file of a local directory shared by the workers; every worker, including
+the one which wrote it, then memory-maps the file. Numeric, datetime and
+string columns are handed to pandas without copying, so their pages live
+in the OS page cache, shared by all the processes, and a worker started
+later attaches in milliseconds instead of reloading from S3.
+
+The first worker to miss a dataset holds a file lock while it loads it;
+the others wait for the file and map it. Files are written under a
+temporary name and renamed, so a reader never sees a partial file, and a
+worker keeps reading its mapping if the file is replaced or removed.
+
+Configuration:
+    ARROW_CACHE_DIR   shared directory (default cache/arrow, empty to disable)
+
+Usage:
+    python -m loading.arrow_store list
+    python -m loading.arrow_store clear [--name user_food_proportion]
+"""
+import argparse
+import contextlib
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from monitoring.spans import span
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus
+    fcntl = None
+
+logger = logging.getLogger("loading.arrow_store")
+
+DEFAULT_DIR = os.path.join("cache", "arrow")
+KEY_METADATA = b"loading.key"
+VERSION_METADATA = b"loading.version"
+
+
+def _file_stem(key):
+    name = re.sub(r"[^\w.-]", "_", str(key[0]))
+    digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+    return f"{name}-{digest}"
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """Exclusive lock shared by every process of the host."""
+    with open(path, "a") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _to_table(frame, key, version=None):
+    table = pa.Table.from_pandas(frame)
+    # Les chaînes pandas sont des large_string : les écrire ainsi évite une
+    # conversion des offsets (donc une copie) à chaque lecture
+    fields = [
+        field.with_type(pa.large_string()) if pa.types.is_string(field.type) else field
+        for field in table.schema
+    ]
+    metadata = {**(table.schema.metadata or {}), KEY_METADATA: repr(key).encode("utf-8")}
+    if version is not None:
+        metadata[VERSION_METADATA] = version.encode("utf-8")
+    return table.cast(pa.schema(fields, metadata=metadata))
+
+
+class ArrowStore:
+    """Directory of memory-mapped Arrow IPC datasets shared by processes."""
+
+    def __init__(self, root):
+        """
+        Args:
+            root (str): Local directory shared by the workers.
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        """Path of the IPC file of a cache key."""
+        return os.path.join(self.root, f"{_file_stem(key)}.arrow")
+
+    def _is_fresh(self, path, max_age):
+        try:
+            return max_age is None or time.time() - os.path.getmtime(path) < max_age
+        except OSError:
+            return False
+
+    def load(self, key, max_age=None, version=None):
+        """
+        Map the dataset of a key.
+
+        Args:
+            key (tuple): Cache key.
+            max_age (float, optional): Ignore files written longer ago, in seconds.
+            version (str, optional): Ignore files of another version of the
+                source data (see loading.refresh).
+
+        Returns:
+            pd.DataFrame: A frame backed by the mapped file, or None if the
+                dataset is not materialized (or is unreadable).
+        """
+        path = self.path(key)
+        if not self._is_fresh(path, max_age):
+            return None
+        try:
+            with span("arrow_store.attach", key=key[0]) as attach:
+                source = pa.memory_map(path)
+                reader = ipc.open_file(source)
+                if version is not None and (reader.schema.metadata or {}).get(VERSION_METADATA) != version.encode("utf-8"):
+                    return None
+                table = reader.read_all()
+                attach.add_bytes(source.size())
+                # split_blocks : une colonne par bloc, sans consolidation (copie)
+                return table.to_pandas(split_blocks=True)
+        except FileNotFoundError:
+            return None
+        except (pa.ArrowException, OSError) as e:
+            logger.warning(f"Unreadable Arrow file {path}, removing it: {e}")
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            return None
+
+    def save(self, key, frame, version=None):
+        """
+        Materialize a DataFrame as the IPC file of a key.
+
+        Args:
+            key (tuple): Cache key.
+            frame (pd.DataFrame): Dataset to share.
+            version (str, optional): Version of the source data it was loaded from.
+
+        Returns:
+            bool: True if the file was written.
+        """
+        path = self.path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            table = _to_table(frame, key, version)
+            with span("arrow_store.write", key=key[0]) as write:
+                with pa.OSFile(temp_path, "wb") as sink:
+                    with ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+                os.replace(temp_path, path)
+                write.add_bytes(os.path.getsize(path))
+            logger.info(f"Materialized {key} to {path}")
+            return True
+        except (pa.ArrowException, TypeError, ValueError, OSError) as e:
+            logger.warning(f"Not sharing {key} between processes: {e}")
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)
+            return False
+
+    def get_or_materialize(self, key, loader, max_age=None, version=None):
+        """
+        Map the dataset of a key, loading and materializing it on a miss.
+
+        Only one process loads a missing dataset; the others wait for its
+        file. Results which are not DataFrames, or cannot be converted to
+        Arrow, are returned as loaded without being shared.
+
+        Args:
+            key (tuple): Cache key.
+            loader (callable): Called without arguments on a miss.
+            max_age (float, optional): Reload files written longer ago, in seconds.
+            version (str, optional): Reload files of another version of the
+                source data.
+        """
+        frame = self.load(key, max_age, version)
+        if frame is not None:
+            return frame
+        with _file_lock(f"{self.path(key)}.lock"):
+            # Un autre processus a pu écrire le fichier pendant l'attente du verrou
+            frame = self.load(key, max_age, version)
+            if frame is not None:
+                return frame
+            value = loader()
+            if not isinstance(value, pd.DataFrame) or not self.save(key, value, version):
+                return value
+        # Relire le fichier : ce processus partage lui aussi les pages mappées
+        frame = self.load(key)
+        return value if frame is None else frame
+
+    def invalidate(self, name=None):
+        """Remove every file, or the files of one dataset name."""
+        prefix = "" if name is None else f"{_file_stem((name,)).rsplit('-', 1)[0]}-"
+        for file_name in os.listdir(self.root):
+            if file_name.endswith(".arrow") and file_name.startswith(prefix):
+                with contextlib.suppress(OSError):
+                    os.remove(os.path.join(self.root, file_name))
+
+    def entries(self):
+        """
+        Describe the materialized datasets.
+
+        Returns:
+            list: One dict per file with name, arguments, source version, size,
+                rows and age.
+        """
+        now = time.time()
+        entries = []
+        for file_name in sorted(os.listdir(self.root)):
+            if not file_name.endswith(".arrow"):
+                continue
+            path = os.path.join(self.root, file_name)
+            try:
+                reader = ipc.open_file(pa.memory_map(path))
+                metadata = reader.schema.metadata or {}
+                entries.append({
+                    'name': file_name.rsplit("-", 1)[0],
+                    'key': metadata.get(KEY_METADATA, b"").decode("utf-8"),
+                    'version': metadata.get(VERSION_METADATA, b"").decode("utf-8") or None,
+                    'size_bytes': os.path.getsize(path),
+                    'rows': sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches)),
+                    'age_seconds': round(now - os.path.getmtime(path), 1)
+                })
+            except (pa.ArrowException, OSError):
+                continue
+        return entries
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The store of ARROW_CACHE_DIR, or None when sharing is disabled."""
+    global _store
+    root = os.getenv('ARROW_CACHE_DIR', DEFAULT_DIR)
+    if not root:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ArrowStore(root)
+    return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the Arrow datasets shared between processes")
+    parser.add_argument('command', choices=['list', 'clear'])
+    parser.add_argument('--dir', default=os.getenv('ARROW_CACHE_DIR') or DEFAULT_DIR)
+    parser.add_argument('--name', help="Dataset name to clear (all by default)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    store = ArrowStore(args.dir)
+    if args.command == 'clear':
+        store.invalidate(args.name)
+        return
+    for entry in store.entries():
+        print(f"{entry['name']:<32} {entry['size_bytes'] / 2**20:9.1f} MB  {entry['rows']:>10} rows  "
+              f"{entry['age_seconds']:>9.0f} s  {entry['key']}")
+
+
+if __name__ == "__main__":
+    main()
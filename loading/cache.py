@@ -0,0 +1,404 @@
+"""
+Process-wide cache of loaded datasets under a global memory budget.
+
+Unlike st.cache_data, which keeps every dataset and argument variant for
+the life of the process, the manager measures the in-memory size of each
+cached value (deep pandas memory usage, Arrow and NumPy buffers) and evicts
+entries when the total exceeds the budget, either least recently used first
+or by a cost-aware policy (GreedyDual-Size-Frequency) which keeps datasets
+that are expensive to reload per byte and often hit. Its contents are shown
+on the cache administration page.
+
+Cached values are frozen and shared by every session: a hit returns a view
+of the cached dataset (see loading.readonly), not a copy, so a rerun pays
+almost nothing to read a dataset and memory does not grow with sessions.
+Model artifacts which manage their own state (the recommendation engines,
+the nutrient matrix) are cached as resources: returned as is, like
+st.cache_resource, but counted against the same budget.
+Loaders declared with shared=True also share their DataFrames between
+Streamlit processes through memory-mapped Arrow files (loading.arrow_store),
+and loaders declared with their S3 sources are refreshed in the background
+when those files change (loading.refresh).
+
+Configuration:
+    CACHE_BUDGET_MB   memory budget of the cached values (default 512)
+    CACHE_POLICY      'lru' or 'cost' (default 'cost')
+"""
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+import types
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from loading import refresh
+from loading.arrow_store import get_store
+from loading.readonly import freeze, share
+from loading.singleflight import SingleFlight
+
+logger = logging.getLogger("loading.cache")
+
+DEFAULT_BUDGET_MB = 512
+POLICIES = ('lru', 'cost')
+
+
+def measure_size(value, _seen=None):
+    """
+    Estimate the memory held by a cached value.
+
+    DataFrames and Series are measured with deep memory usage, Arrow tables
+    and NumPy arrays by their buffers (a view counts its base array once),
+    containers and plain objects recursively.
+
+    Args:
+        value: The cached value.
+
+    Returns:
+        int: Size in bytes.
+    """
+    seen = set() if _seen is None else _seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, np.ndarray):
+        root = value
+        while isinstance(root.base, np.ndarray):
+            root = root.base
+        if root is not value:
+            if id(root) in seen:
+                return 0
+            seen.add(id(root))
+        return int(root.nbytes)
+    if isinstance(value, (bytes, bytearray, str)):
+        return sys.getsizeof(value)
+    if hasattr(value, 'nbytes') and type(value).__module__.startswith('pyarrow'):
+        return int(value.nbytes)
+    if isinstance(value, (dict, types.MappingProxyType)):
+        return sys.getsizeof(value) + sum(
+            measure_size(k, seen) + measure_size(v, seen) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(measure_size(item, seen) for item in value)
+    if hasattr(value, '__dict__') and not isinstance(value, type):
+        return sys.getsizeof(value) + measure_size(vars(value), seen)
+    return sys.getsizeof(value)
+
+
+class CacheEntry:
+    """One cached value and its accounting."""
+
+    __slots__ = ('key', 'value', 'size', 'load_seconds', 'created', 'last_access', 'hits', 'priority', 'expires',
+                 'frozen')
+
+    def __init__(self, key, value, size, load_seconds, ttl=None, frozen=True):
+        self.key = key
+        self.value = value
+        self.size = size
+        self.load_seconds = load_seconds
+        self.frozen = frozen
+        self.created = time.time()
+        self.last_access = self.created
+        self.hits = 0
+        self.priority = 0.0
+        self.expires = self.created + ttl if ttl else None
+
+
+class CacheManager:
+    """Thread-safe dataset cache bounded by a memory budget."""
+
+    def __init__(self, budget_bytes, policy='cost', read_only=True):
+        """
+        Args:
+            budget_bytes (int): Maximum total size of the cached values.
+            policy (str): 'lru' evicts the least recently used entry; 'cost'
+                evicts the entry with the lowest (hits + 1) * load time / size,
+                aged by the priority of the last evicted entry.
+            read_only (bool): Freeze cached values and return shared views.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown cache policy {policy!r}, expected one of {POLICIES}")
+        self.budget_bytes = int(budget_bytes)
+        self.policy = policy
+        self.read_only = read_only
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._clock = 0.0
+        self._flights = SingleFlight()
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    def _priority(self, entry):
+        return self._clock + (entry.hits + 1) * max(entry.load_seconds, 1e-6) / max(entry.size, 1)
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires is not None and time.time() >= entry.expires:
+                self._remove(key)
+                return None
+            entry.hits += 1
+            entry.last_access = time.time()
+            entry.priority = self._priority(entry)
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def get(self, key, default=None):
+        """Cached value of the key, updating its recency and hit count."""
+        entry = self._lookup(key)
+        if entry is None:
+            return default
+        return share(entry.value) if self.read_only and entry.frozen else entry.value
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (entry.expires is None or time.time() < entry.expires)
+
+    def put(self, key, value, load_seconds=0.0, size=None, ttl=None, frozen=True):
+        """
+        Cache a value, evicting others until the budget is respected.
+
+        A value larger than the whole budget is still cached, alone: every
+        other entry is evicted, rather than reloading it on every rerun.
+
+        Args:
+            key (tuple): Cache key.
+            value: Value to cache.
+            load_seconds (float): Time it took to load, used by the 'cost' policy.
+            size (int, optional): Size in bytes, measured when omitted.
+            ttl (float, optional): Seconds after which the entry expires.
+            frozen (bool): Freeze the value and return views of it; False for
+                resources returned as is.
+        """
+        size = measure_size(value) if size is None else int(size)
+        if size > self.budget_bytes:
+            logger.warning(f"Caching {key} alone: {size / 2**20:.1f} MB exceeds the "
+                           f"{self.budget_bytes / 2**20:.0f} MB budget")
+        if self.read_only and frozen:
+            value = freeze(value)
+        with self._lock:
+            self._remove(key)
+            entry = CacheEntry(key, value, size, load_seconds, ttl, frozen)
+            entry.priority = self._priority(entry)
+            self._entries[key] = entry
+            self.used_bytes += size
+            self._evict(keep=key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.used_bytes -= entry.size
+        return entry
+
+    def _evict(self, keep=None):
+        while self.used_bytes > self.budget_bytes:
+            candidates = [e for k, e in self._entries.items() if k != keep]
+            if not candidates:
+                break
+            if self.policy == 'lru':
+                victim = candidates[0]
+            else:
+                victim = min(candidates, key=lambda e: e.priority)
+                self._clock = victim.priority
+            self._remove(victim.key)
+            self.evictions += 1
+            self.evicted_bytes += victim.size
+            logger.info(f"Evicted {victim.key} ({victim.size / 2**20:.1f} MB, {victim.hits} hits)")
+
+    def get_or_load(self, key, loader, ttl=None, frozen=True):
+        """
+        Return the cached value of the key, loading and caching it on a miss.
+
+        Concurrent misses of the same key are coalesced: one caller runs the
+        loader while the others wait for it and share its result. None
+        results (failed loads) are returned but not cached, so the next
+        rerun retries.
+
+        Args:
+            key (tuple): Cache key.
+            loader (callable): Called without arguments on a miss.
+            ttl (float, optional): Seconds after which a loaded value expires.
+            frozen (bool): See put().
+        """
+        with self._lock:
+            if key in self:
+                return self.get(key)
+
+        def load():
+            with self._lock:
+                # Un chargement a pu se terminer entre la vérification et l'entrée en vol :
+                # valeur gelée, la vue est créée une seule fois ci-dessous
+                entry = self._lookup(key)
+                if entry is not None:
+                    return entry.value
+                self.misses += 1
+            start = time.perf_counter()
+            value = loader()
+            if value is not None:
+                if self.read_only and frozen:
+                    # Les appelants reçoivent la valeur gelée, celle mise en cache
+                    value = freeze(value)
+                self.put(key, value, time.perf_counter() - start, ttl=ttl, frozen=frozen)
+            return value
+
+        value, _ = self._flights.do(key, load)
+        return share(value) if self.read_only and frozen and value is not None else value
+
+    def in_flight(self):
+        """Keys being loaded and the number of callers waiting for each."""
+        return self._flights.in_flight()
+
+    def invalidate(self, name=None):
+        """Drop every entry, or the entries of one dataset name."""
+        with self._lock:
+            for key in [k for k in self._entries if name is None or k[0] == name]:
+                self._remove(key)
+
+    def resize(self, budget_bytes=None, policy=None):
+        """Change the budget or the policy, evicting as needed."""
+        with self._lock:
+            if policy is not None:
+                if policy not in POLICIES:
+                    raise ValueError(f"Unknown cache policy {policy!r}, expected one of {POLICIES}")
+                self.policy = policy
+            if budget_bytes is not None:
+                self.budget_bytes = int(budget_bytes)
+            self._evict()
+
+    def entries(self):
+        """
+        Describe the cached entries, most recently used last.
+
+        Returns:
+            list: One dict per entry with name, arguments, size, hits, age,
+                idle time, load time, eviction priority and whether it is a
+                resource.
+        """
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    'name': entry.key[0],
+                    'args': ', '.join(repr(a) for a in entry.key[1:]),
+                    'size_bytes': entry.size,
+                    'hits': entry.hits,
+                    'age_seconds': round(now - entry.created, 1),
+                    'idle_seconds': round(now - entry.last_access, 1),
+                    'load_seconds': round(entry.load_seconds, 3),
+                    'ttl_seconds': round(entry.expires - entry.created) if entry.expires else None,
+                    'priority': entry.priority,
+                    'resource': not entry.frozen
+                }
+                for entry in self._entries.values()
+            ]
+
+    def stats(self):
+        """Global counters of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'policy': self.policy,
+                'budget_bytes': self.budget_bytes,
+                'used_bytes': self.used_bytes,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self._flights.coalesced,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+                'evicted_bytes': self.evicted_bytes
+            }
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager():
+    """The cache manager shared by every session of the process."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                budget_mb = float(os.getenv('CACHE_BUDGET_MB', DEFAULT_BUDGET_MB))
+                _manager = CacheManager(int(budget_mb * 2**20), os.getenv('CACHE_POLICY', 'cost'))
+    return _manager
+
+
+def cached(name=None, ttl=None, shared=False, sources=None, resource=False):
+    """
+    Decorator caching a loader's results in the shared cache manager.
+
+    Replaces @st.cache_data on loaders: values are keyed by the loader name
+    and its arguments (which must be hashable), shared read-only between
+    sessions, and accounted against the memory budget.
+
+    Args:
+        name (str, optional): Dataset name shown on the admin page, the
+            function name by default.
+        ttl (float, optional): Seconds after which a cached result is reloaded.
+        shared (bool): Also share DataFrame results between processes as
+            memory-mapped Arrow files (see loading.arrow_store).
+        sources (list or callable, optional): S3 keys the loader reads, or a
+            function of the loader's arguments returning them. Cached results
+            are then refreshed in the background when those files change
+            (see loading.refresh).
+        resource (bool): Cache the result as is, neither frozen nor copied,
+            like st.cache_resource: for objects which manage their own state
+            and locking, such as the recommendation engines.
+    """
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (label, *args, *sorted(kwargs.items()))
+            refresh.mark_read(key)
+            store = get_store() if shared else None
+
+            def load(version=None):
+                if store is None:
+                    return func(*args, **kwargs)
+                return store.get_or_materialize(
+                    key, lambda: func(*args, **kwargs), max_age=ttl,
+                    version=version['token'] if version else None
+                )
+
+            if sources is None:
+                return get_manager().get_or_load(key, load, ttl=ttl, frozen=not resource)
+
+            def load_versioned():
+                # Version lue avant le chargement : une modification pendant celui-ci sera détectée
+                keys = sources(*args, **kwargs) if callable(sources) else sources
+                version = refresh.fetch_version(keys)
+                value = load(version)
+                if value is not None:
+                    refresh.watch(key, load, keys, version, ttl, frozen=not resource)
+                return value
+
+            return get_manager().get_or_load(key, load_versioned, ttl=ttl, frozen=not resource)
+
+        def clear():
+            get_manager().invalidate(label)
+            store = get_store() if shared else None
+            if store is not None:
+                store.invalidate(label)
+
+        wrapper.clear = clear
+        return wrapper
+    return decorator
@@ -0,0 +1,333 @@
+"""
+Loaders of the datasets and model artifacts read by the pages.
+
+The loaders live in one module, rather than in each page script, so that
+the cold-start warmup (loading.warmup) can prefetch and decode them in the
+background before a visitor opens the page which needs them. Every
+dataset is registered for the warmup below its loader, in the order in
+which the pages depend on them.
+"""
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+
+import duckdb
+import pandas as pd
+import streamlit as st
+
+from AWS.s3.connect_s3 import S3Manager
+from analytics.anomaly_index import INDEX_KEY, RESULTS_KEY, AnomalyIndex
+from analytics.cluster_profiles import build_cluster_profiles
+from analytics.nutrient_matrix import FOOD_KEY, MATRIX_PREFIX, clean_numeric, compile_nutrient_matrix, fetch_nutrient_matrix
+from analytics.time_parsing import HOUR_COLUMN, add_time_columns
+from loading import refresh, warmup
+from loading.cache import cached, get_manager
+from monitoring import spans
+from recommender.collaborative import CollaborativeFilteringEngine
+from recommender.content_based import ContentBasedEngine
+
+PROPORTIONS_PREFIX = "transform/folder_6_parquet/folder_4_windows_function_filtered"
+PERCENTAGE_CHANGE_PREFIX = "transform/folder_6_parquet/folder_5_percentage_change_filtered"
+PROPORTIONS_KEY = f"{PROPORTIONS_PREFIX}/user_food_proportion_duckdb.parquet"
+CLUSTER_RESULTS_KEY = "AI/clustering/results/user_clusters.xlsx"
+CLUSTER_ANALYSIS_KEY = "AI/clustering/results/cluster_analysis.json"
+ANOMALY_STATS_KEY = "AI/anomaly_detection/results/model_statistics.json"
+USER_PREFERENCES_KEY = "transform/folder_4_windows_function/type_food/user_food_proportion_pandas.xlsx"
+MEALS_KEY = "transform/folder_2_filter_data/combined_meal_data_filtered.xlsx"
+MATRIX_DIR = os.path.join("cache", "nutrient_matrix")
+SOURCES = ["DuckDB", "Pandas"]
+
+
+@contextlib.contextmanager
+def _downloaded(file_path):
+    """
+    Download an S3 object to a private temporary directory.
+
+    Yields the local path, or None if the download failed. Loaders run
+    concurrently during the warmup, so each download gets its own directory
+    instead of a shared temp_<name> file in the working directory.
+    """
+    temp_dir = tempfile.mkdtemp()
+    try:
+        temp_file = os.path.join(temp_dir, os.path.basename(file_path))
+        yield temp_file if S3Manager().download_file(file_path, temp_file) else None
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def _read_parquet(file_path):
+    """Download a Parquet file from S3 and read it with DuckDB."""
+    try:
+        with _downloaded(file_path) as temp_file:
+            if temp_file is None:
+                return None
+            query = f"SELECT * FROM read_parquet('{temp_file}')"
+            # Une connexion par lecture : la connexion par défaut de DuckDB ne
+            # supporte pas les requêtes simultanées des threads de préchargement
+            with spans.span("duckdb.read_parquet"), duckdb.connect() as connection:
+                return connection.sql(query).df()
+    except Exception as e:
+        st.error(f"Erreur lors du chargement des données: {str(e)}")
+        return None
+
+
+def _read_excel(file_path):
+    """Download an Excel workbook from S3 and read it with pandas."""
+    try:
+        with _downloaded(file_path) as temp_file:
+            if temp_file is None:
+                return None
+            with spans.span("pandas.read_excel"):
+                return pd.read_excel(temp_file)
+    except Exception as e:
+        st.error(f"Erreur lors du chargement des données: {str(e)}")
+        return None
+
+
+# Pages 1 à 3 : tables issues des transformations DuckDB ou Pandas
+def _user_food_proportion_key(source):
+    return f"{PROPORTIONS_PREFIX}/user_food_proportion_{source.lower()}.parquet"
+
+
+def _user_daily_percentage_change_key(source):
+    return f"{PERCENTAGE_CHANGE_PREFIX}/user_daily_percentage_change_{source.lower()}.parquet"
+
+
+def _daily_percentage_change_key(source):
+    return f"{PERCENTAGE_CHANGE_PREFIX}/daily_percentage_change_{source.lower()}.parquet"
+
+
+@spans.timed("load_user_food_proportion")
+@cached("user_food_proportion", shared=True, sources=lambda source: [_user_food_proportion_key(source)])
+def load_user_food_proportion(source):
+    return _read_parquet(_user_food_proportion_key(source))
+
+
+@spans.timed("load_user_daily_percentage_change")
+@cached("user_daily_percentage_change", shared=True, sources=lambda source: [_user_daily_percentage_change_key(source)])
+def load_user_daily_percentage_change(source):
+    return _read_parquet(_user_daily_percentage_change_key(source))
+
+
+@spans.timed("load_daily_percentage_change")
+@cached("daily_percentage_change", shared=True, sources=lambda source: [_daily_percentage_change_key(source)])
+def load_daily_percentage_change(source):
+    return _read_parquet(_daily_percentage_change_key(source))
+
+
+for _source in SOURCES:
+    warmup.register(f"Proportions par type ({_source})", load_user_food_proportion, _source)
+    warmup.register(f"Variations par utilisateur ({_source})", load_user_daily_percentage_change, _source)
+    warmup.register(f"Variations quotidiennes ({_source})", load_daily_percentage_change, _source)
+
+
+# Page 4 : clusters
+def load_cluster_food_data():
+    """Proportions DuckDB des pages 1 à 3, lues et mises en cache une seule fois"""
+    return load_user_food_proportion("DuckDB")
+
+
+@spans.timed("load_cluster_results")
+@cached("cluster_results", sources=[CLUSTER_RESULTS_KEY, CLUSTER_ANALYSIS_KEY])
+def load_cluster_results():
+    try:
+        # Charger les résultats
+        with _downloaded(CLUSTER_RESULTS_KEY) as temp_results:
+            if temp_results is None:
+                return None, None
+            with spans.span("pandas.read_excel"):
+                results_df = add_time_columns(pd.read_excel(temp_results))
+
+        # Charger l'analyse
+        with _downloaded(CLUSTER_ANALYSIS_KEY) as temp_analysis:
+            if temp_analysis is None:
+                return None, None
+            with open(temp_analysis, 'r', encoding='utf-8') as f:
+                analysis_data = json.load(f)
+
+        return results_df, analysis_data
+
+    except Exception as e:
+        st.error(f"Erreur lors du chargement des données: {str(e)}")
+        return None, None
+
+
+# Agrégats par cluster, calculés une seule fois par version des données
+@spans.timed("load_cluster_profiles")
+@cached("cluster_profiles", sources=[CLUSTER_RESULTS_KEY, PROPORTIONS_KEY])
+def load_cluster_profiles():
+    results_df, _ = load_cluster_results()
+    food_df = load_cluster_food_data()
+    if results_df is None or food_df is None:
+        return None
+    with spans.span("build_cluster_profiles"):
+        return build_cluster_profiles(results_df, food_df)
+
+
+warmup.register("Résultats des clusters", load_cluster_results)
+warmup.register("Profils des clusters", load_cluster_profiles)
+
+
+# Page 5 : détection d'anomalies
+@spans.timed("load_anomaly_results")
+@cached("anomaly_results", sources=[INDEX_KEY, RESULTS_KEY, ANOMALY_STATS_KEY])
+def load_anomaly_results():
+    """Charge tous les résultats des modèles d'IA depuis S3"""
+    # Créer un dossier temporaire
+    temp_dir = tempfile.mkdtemp()
+    s3 = S3Manager()
+
+    try:
+        # Anomaly detection results : index Parquet publié, sinon classeur Excel
+        temp_index = os.path.join(temp_dir, "anomaly_index.parquet")
+        if s3.file_exists(INDEX_KEY) and s3.download_file(INDEX_KEY, temp_index):
+            with spans.span("pyarrow.read_parquet"):
+                anomaly_index = AnomalyIndex.from_parquet(temp_index)
+            if HOUR_COLUMN not in anomaly_index.frame.columns:
+                add_time_columns(anomaly_index.frame)
+        else:
+            temp_predictions = os.path.join(temp_dir, "predictions.xlsx")
+            s3.download_file(RESULTS_KEY, temp_predictions)
+            with spans.span("pandas.read_excel"):
+                anomaly_index = AnomalyIndex(add_time_columns(pd.read_excel(temp_predictions)))
+
+        temp_stats = os.path.join(temp_dir, "stats.json")
+        s3.download_file(ANOMALY_STATS_KEY, temp_stats)
+        with open(temp_stats, 'r', encoding='utf-8') as f:
+            anomaly_analysis = json.load(f)
+
+        return {
+            'anomalies': {
+                'index': anomaly_index,
+                'analysis': anomaly_analysis
+            }
+        }
+
+    except Exception as e:
+        st.error(f"Erreur lors du chargement des résultats : {str(e)}")
+        return None
+
+    finally:
+        # Nettoyage : supprimer les fichiers temporaires
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+warmup.register("Résultats de détection d'anomalies", load_anomaly_results)
+
+
+# Page 6 : filtrage collaboratif
+def load_cf_proportions():
+    """Proportions par type d'aliment utilisées pour le calcul en direct (cache des pages 1 à 3)"""
+    return load_user_food_proportion("DuckDB")
+
+
+@spans.timed("load_cf_engine")
+@cached("cf_engine", resource=True)
+def load_cf_engine():
+    """Construit le moteur de filtrage collaboratif en mémoire (partagé entre les sessions)"""
+    df = load_cf_proportions()
+    if df is None:
+        return None
+    return CollaborativeFilteringEngine.from_proportions(df)
+
+
+def _update_cf_engine():
+    """Applique la nouvelle version des proportions au moteur en cache, sans le reconstruire"""
+    # Appelé aussi au rafraîchissement des proportions Pandas : la mise à jour est alors vide
+    engine = get_manager().get(("cf_engine",))
+    df = load_cf_proportions()
+    if engine is None or df is None:
+        return
+    with spans.span("cf.update"):
+        engine.update(df, snapshot=True)
+
+
+warmup.register("Moteur de filtrage collaboratif", load_cf_engine)
+refresh.on_refresh("user_food_proportion", _update_cf_engine)
+
+
+# Page 7 : recommandations basées sur le contenu
+@spans.timed("load_content_based_data")
+@cached("content_based_data", shared=True, sources=lambda file_path: [file_path])
+def load_content_based_data(file_path):
+    """Charge un fichier depuis S3 et retourne un DataFrame"""
+    s3 = S3Manager()
+    temp_dir = tempfile.mkdtemp()
+    temp_file = os.path.join(temp_dir, os.path.basename(file_path))
+    try:
+        if not s3.download_file(file_path, temp_file):
+            return None
+        with spans.span("pandas.read_excel"):
+            df = pd.read_excel(temp_file)
+
+        # Nettoyer les colonnes numériques si c'est le fichier food_processed
+        if "food_processed.xlsx" in file_path:
+            numeric_cols = ['Valeur calorique', 'Lipides', 'Glucides', 'Protein', 'Fibre alimentaire', 'Sucre', 'Sodium']
+            for col in numeric_cols:
+                if col in df.columns:
+                    df[col] = clean_numeric(df[col])
+
+        return df
+    except Exception as e:
+        st.error(f"Erreur lors du chargement du fichier {file_path}: {str(e)}")
+        return None
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+@spans.timed("load_content_engine")
+@cached("content_engine", resource=True)
+def load_content_engine():
+    """Compile le catalogue d'aliments en index de plus proches voisins (partagé entre les sessions)"""
+    food_features = load_content_based_data(FOOD_KEY)
+    if food_features is None:
+        return None
+    return ContentBasedEngine(food_features)
+
+
+warmup.register("Catalogue d'aliments", load_content_based_data, FOOD_KEY)
+warmup.register("Préférences des utilisateurs", load_content_based_data, USER_PREFERENCES_KEY)
+warmup.register("Moteur de recommandation par contenu", load_content_engine)
+# Reconstruire le moteur à partir de la nouvelle version du catalogue
+refresh.on_refresh("content_based_data", load_content_engine.clear)
+
+
+# Page 8 : micronutriments
+@spans.timed("load_nutrient_matrix")
+@cached("nutrient_matrix", resource=True, sources=[f"{MATRIX_PREFIX}/meta.json", FOOD_KEY])
+def load_nutrient_matrix():
+    """Matrice (aliment x nutriment) publiée, sinon compilée depuis food_processed"""
+    matrix = fetch_nutrient_matrix(S3Manager(), MATRIX_DIR)
+    if matrix is None:
+        food_df = _read_excel(FOOD_KEY)
+        if food_df is None:
+            return None
+        with spans.span("compile_nutrient_matrix"):
+            matrix = compile_nutrient_matrix(food_df)
+    return matrix
+
+
+@spans.timed("load_micronutrient_meals")
+@cached("micronutrient_meals", shared=True, sources=[MEALS_KEY])
+def load_micronutrient_meals():
+    meals = _read_excel(MEALS_KEY)
+    if meals is not None:
+        meals = meals[['user_id', 'date', 'aliment_id', 'quantity']].copy()
+        meals['date'] = pd.to_datetime(meals['date'])
+    return meals
+
+
+@spans.timed("load_micronutrient_user_clusters")
+@cached("micronutrient_user_clusters", shared=True, sources=[CLUSTER_RESULTS_KEY])
+def load_micronutrient_user_clusters():
+    clusters = _read_excel(CLUSTER_RESULTS_KEY)
+    if clusters is not None and {'user_id', 'cluster'}.issubset(clusters.columns):
+        return clusters[['user_id', 'cluster']]
+    return None
+
+
+warmup.register("Matrice des nutriments", load_nutrient_matrix)
+warmup.register("Repas (micronutriments)", load_micronutrient_meals)
+warmup.register("Clusters des utilisateurs (micronutriments)", load_micronutrient_user_clusters)
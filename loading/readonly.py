@@ -0,0 +1,90 @@
+"""
+Read-only sharing of cached datasets between sessions.
+
+A cached value is frozen once when it enters the cache: the NumPy buffers
+behind its DataFrames, Series and arrays are flagged read-only (string
+columns are already immutable Arrow arrays with pandas 3). Each cache hit
+then gets a view instead of a copy: a shallow DataFrame copy shares every
+column buffer with the cached frame, and copy-on-write makes any
+modification of the view allocate its own column. Writing through a
+buffer instead (`df.to_numpy()[0] = x`, or any write with copy-on-write
+disabled on pandas < 3) raises "assignment destination is read-only"
+rather than corrupting the dataset for the other sessions.
+
+Containers are frozen too: dicts (e.g. the cluster analysis JSON) become
+read-only mappings (types.MappingProxyType) and lists become tuples, so a
+session cannot change the payload the other sessions read.
+"""
+import types
+
+import numpy as np
+import pandas as pd
+
+
+def _freeze_array(array):
+    array = getattr(array, '_ndarray', array)
+    if isinstance(array, np.ndarray):
+        array.flags.writeable = False
+
+
+def freeze(value, _seen=None):
+    """
+    Make a value read-only before it is shared.
+
+    The buffers of DataFrames, Series and arrays are flagged read-only in
+    place. Dicts and lists are rebuilt as read-only mappings and tuples of
+    frozen items, and tuples around frozen items. The buffers held by plain
+    objects (e.g. AnomalyIndex) are frozen recursively, but their attributes
+    are left as they are: the object manages its own state.
+
+    Args:
+        value: The value about to be shared.
+
+    Returns:
+        The frozen value, to be cached instead of the original.
+    """
+    seen = {} if _seen is None else _seen
+    if id(value) in seen:
+        return seen[id(value)]
+    seen[id(value)] = value
+
+    if isinstance(value, pd.DataFrame):
+        for array in value._mgr.arrays:
+            _freeze_array(array)
+    elif isinstance(value, pd.Series):
+        _freeze_array(value._mgr.array)
+    elif isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, types.MappingProxyType):
+        pass
+    elif isinstance(value, dict):
+        value = seen[id(value)] = types.MappingProxyType({key: freeze(item, seen) for key, item in value.items()})
+    elif isinstance(value, (list, tuple)):
+        items = [freeze(item, seen) for item in value]
+        if isinstance(value, list):
+            value = seen[id(value)] = tuple(items)
+        elif any(item is not original for item, original in zip(items, value)):
+            value = seen[id(value)] = value._make(items) if hasattr(value, '_make') else tuple(items)
+    elif hasattr(value, '__dict__') and not isinstance(value, type):
+        for item in vars(value).values():
+            freeze(item, seen)
+    return value
+
+
+def share(value):
+    """
+    View of a frozen value handed to one caller, without copying data.
+
+    DataFrames and Series are shallow-copied (column buffers are shared) and
+    tuples of results rebuilt around views. Frozen mappings and other
+    objects are returned as is: they cannot be modified, and rebuilding JSON
+    payloads on every hit would cost as much as the copy this avoids.
+
+    Args:
+        value: A value previously passed to freeze().
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    if isinstance(value, tuple):
+        return tuple(share(item) for item in value)
+    return value
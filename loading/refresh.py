@@ -0,0 +1,243 @@
+"""
+Stale-while-revalidate refresh of the cached datasets.
+
+Cached datasets used to stay as loaded until the process restarted, and
+clearing them made the next visitor wait for a full reload. A loader
+declared with the S3 files it reads (loading.cache.cached(sources=...))
+now records the version of those files (ETag and LastModified) when it
+loads. A background thread checks the versions every REFRESH_INTERVAL
+seconds with HEAD requests. When a file changed, it reloads the dataset off
+the request path and swaps it into the cache in one step. Readers keep
+getting the previous version until then, and keep it if the reload fails.
+
+Pages show the version and age of the datasets they read in the sidebar
+(render_indicator).
+
+Configuration:
+    REFRESH_INTERVAL   seconds between two checks (default 300, 0 disables)
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import streamlit as st
+
+logger = logging.getLogger("loading.refresh")
+
+DEFAULT_INTERVAL = 300
+
+
+class Watch:
+    """A cached dataset, the S3 files it was loaded from and their version."""
+
+    __slots__ = ('key', 'load', 'sources', 'version', 'ttl', 'frozen', 'loaded_at', 'checked_at', 'refreshing',
+                 'error')
+
+    def __init__(self, key, load, sources, version, ttl=None, frozen=True):
+        self.key = key
+        self.load = load
+        self.sources = sources
+        self.version = version
+        self.ttl = ttl
+        self.frozen = frozen
+        self.loaded_at = time.time()
+        self.checked_at = self.loaded_at
+        self.refreshing = False
+        self.error = None
+
+
+_watches = {}
+_callbacks = {}
+_lock = threading.Lock()
+_local = threading.local()
+_thread = None
+
+
+def fetch_version(sources, s3=None, _heads=None):
+    """
+    Current version of a set of S3 files.
+
+    A missing file is part of the version, so that a loader falling back on
+    another file (e.g. the anomaly index) is reloaded when it appears.
+
+    Args:
+        sources (list): S3 keys of the files.
+        s3 (S3Manager, optional): Client to use, a new one by default.
+
+    Returns:
+        dict: 'token' (short hash of the ETags) and 'last_modified' (most
+            recent modification, None if no file exists).
+    """
+    if s3 is None:
+        from AWS.s3.connect_s3 import S3Manager
+        s3 = S3Manager()
+    heads = {} if _heads is None else _heads
+    for source in sources:
+        if source not in heads:
+            heads[source] = s3.object_version(source)
+    versions = [heads[source] for source in sources]
+    token = hashlib.sha1("|".join(v['etag'] if v else "-" for v in versions).encode("utf-8")).hexdigest()[:8]
+    modified = [v['last_modified'] for v in versions if v]
+    return {'token': token, 'last_modified': max(modified) if modified else None}
+
+
+def interval():
+    """Seconds between two checks, 0 when the refresh is disabled."""
+    return float(os.getenv('REFRESH_INTERVAL', DEFAULT_INTERVAL))
+
+
+def watch(key, load, sources, version, ttl=None, frozen=True):
+    """
+    Watch the source files of a dataset which has just been cached.
+
+    Args:
+        key (tuple): Cache key of the dataset.
+        load (callable): Reloads the dataset, called with the new version.
+        sources (list): S3 keys the dataset is loaded from.
+        version (dict): Version returned by fetch_version() before the load.
+        ttl (float, optional): TTL of the cache entry, kept on reload.
+        frozen (bool): Whether the cache entry is frozen (False for resources).
+    """
+    with _lock:
+        _watches[key] = Watch(key, load, sources, version, ttl, frozen)
+    _ensure_started()
+
+
+def on_refresh(name, callback):
+    """
+    Call a function after each refresh of a dataset.
+
+    Used to update or drop artifacts built from the dataset, e.g. the
+    recommendation engine of a page, so that they follow the new version.
+
+    Args:
+        name (str): Dataset name (first element of its cache keys).
+        callback (callable): Called without arguments.
+    """
+    with _lock:
+        _callbacks.setdefault(name, []).append(callback)
+
+
+def _reload(entry, version, manager):
+    entry.refreshing = True
+    start = time.perf_counter()
+    try:
+        value = entry.load(version)
+    except Exception as e:
+        value = None
+        entry.error = str(e)
+    finally:
+        entry.refreshing = False
+    if value is None:
+        # Garder la dernière version valide, nouvel essai au prochain passage
+        logger.warning(f"Refresh of {entry.key} failed, keeping version "
+                       f"{entry.version['token'] if entry.version else None}")
+        return False
+    manager.put(entry.key, value, time.perf_counter() - start, ttl=entry.ttl, frozen=entry.frozen)
+    entry.version = version
+    entry.loaded_at = time.time()
+    entry.error = None
+    logger.info(f"Refreshed {entry.key} to version {version['token']}")
+    for callback in _callbacks.get(entry.key[0], []):
+        callback()
+    return True
+
+
+def check(s3=None):
+    """
+    Check every watched dataset once, reloading those whose files changed.
+
+    Datasets evicted from the cache are no longer watched: they are loaded
+    again, at their current version, by the next reader.
+
+    Returns:
+        int: Number of datasets reloaded.
+    """
+    from AWS.s3.connect_s3 import S3Manager
+    from loading.cache import get_manager
+    manager = get_manager()
+    s3 = s3 or S3Manager()
+    # Ordre du premier chargement : un jeu de données dérivé d'autres (profils
+    # des clusters) est rechargé après eux
+    with _lock:
+        entries = list(_watches.values())
+    heads = {}
+    reloaded = 0
+    for entry in entries:
+        if entry.key not in manager:
+            with _lock:
+                if _watches.get(entry.key) is entry:
+                    del _watches[entry.key]
+            continue
+        version = fetch_version(entry.sources, s3, heads)
+        entry.checked_at = time.time()
+        if version['token'] == entry.version['token']:
+            continue
+        reloaded += _reload(entry, version, manager)
+    return reloaded
+
+
+def _run():
+    while True:
+        time.sleep(interval())
+        try:
+            check()
+        except Exception as e:
+            logger.error(f"Dataset refresh failed: {e}")
+
+
+def _ensure_started():
+    global _thread
+    if _thread is not None or interval() <= 0:
+        return
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name="dataset-refresh", daemon=True)
+            _thread.start()
+
+
+def mark_read(key):
+    """Note that the current script run read a dataset, for render_indicator()."""
+    if not hasattr(_local, 'read'):
+        _local.read = []
+    if key not in _local.read:
+        _local.read.append(key)
+
+
+def _format_age(seconds):
+    if seconds < 90:
+        return f"{seconds:.0f} s"
+    if seconds < 90 * 60:
+        return f"{seconds / 60:.0f} min"
+    if seconds < 36 * 3600:
+        return f"{seconds / 3600:.0f} h"
+    return f"{seconds / 86400:.0f} j"
+
+
+def render_indicator():
+    """Sidebar version and age of the datasets read during this script run."""
+    read, _local.read = getattr(_local, 'read', []), []
+    with _lock:
+        entries = [_watches[key] for key in read if key in _watches]
+    if not entries:
+        return
+    now = time.time()
+    lines = []
+    for entry in entries:
+        label = " ".join(str(part) for part in entry.key)
+        line = f"**{label}** : version `{entry.version['token']}`, "
+        if entry.version['last_modified'] is not None:
+            modified = datetime.now(timezone.utc) - entry.version['last_modified']
+            line += f"données d'il y a {_format_age(modified.total_seconds())}, "
+        line += f"chargées il y a {_format_age(now - entry.loaded_at)}"
+        if entry.refreshing:
+            line += " — 🔄 mise à jour en cours"
+        lines.append(line)
+    with st.sidebar.expander("📦 Version des données"):
+        st.markdown("\n".join(f"- {line}" for line in lines))
+        if interval() > 0:
+            st.caption(f"Vérification des mises à jour toutes les {_format_age(interval())}, "
+                       f"dernière il y a {_format_age(now - min(e.checked_at for e in entries))}.")
@@ -0,0 +1,91 @@
+"""
+Single-flight coalescing of concurrent loads.
+
+When several sessions open a page on a cold cache, each of them used to
+download and decode the same dataset. With a SingleFlight, the first
+caller of a key runs the load while the others wait for it and share its
+result, so a dataset is fetched once however many sessions ask for it.
+
+Only errors (Exception) are shared. A leader interrupted by a control-flow
+BaseException of its own session (Streamlit's StopException or
+RerunException, KeyboardInterrupt) wakes the waiters, which elect a new
+leader among themselves and run the load again.
+"""
+import threading
+
+
+class _Call:
+    """A load in flight and its outcome."""
+
+    __slots__ = ('done', 'value', 'error', 'interrupted', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.interrupted = False
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, func):
+        """
+        Run func for the key, or wait for the call already in flight.
+
+        Args:
+            key: Hashable key of the call.
+            func (callable): Called without arguments by the first caller.
+
+        Returns:
+            tuple: The result and True for the caller which ran func, False
+                for callers which waited. An Exception raised by func is
+                raised in every caller; any other BaseException only in the
+                caller which ran func, the waiters retrying the call.
+        """
+        waiting = False
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                else:
+                    call.waiters += 1
+                    if not waiting:
+                        self.coalesced += 1
+            if leader:
+                break
+            waiting = True
+            call.done.wait()
+            if call.interrupted:
+                # Le leader a été interrompu : nouvelle élection
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.value, False
+
+        try:
+            call.value = func()
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException:
+            call.interrupted = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, True
+
+    def in_flight(self):
+        """Keys being loaded and the number of callers waiting for each."""
+        with self._lock:
+            return {key: call.waiters for key, call in self._calls.items()}
@@ -0,0 +1,154 @@
+"""
+Cold-start warmup of the datasets and model artifacts.
+
+After a deploy, the first visitor of each page used to wait for the S3
+download and decode of its datasets, and page 3 also for the scipy import.
+The first run of Home.py now starts a background thread pool which imports
+the heavy modules and loads every dataset registered by loading.datasets,
+filling the shared caches before the pages are opened.
+
+A page which needs a dataset being warmed up joins its load in flight
+(loading.cache coalesces concurrent loads of a key) and waits for that
+dataset only; a dataset still queued is loaded by the page itself, and the
+warmup then finds it cached. Model artifacts, cached as resources in the
+same cache, behave alike.
+
+Configuration:
+    WARMUP            '0' to disable the warmup (default enabled)
+    WARMUP_WORKERS    threads of the pool (default 4)
+"""
+import importlib
+import logging
+import os
+import threading
+import time
+from concurrent import futures
+
+logger = logging.getLogger("loading.warmup")
+
+DEFAULT_WORKERS = 4
+HEAVY_MODULES = ['scipy.stats', 'openpyxl']
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class WarmupTask:
+    """One dataset, artifact or module to load during the warmup."""
+
+    __slots__ = ('name', 'func', 'args', 'state', 'seconds', 'error', 'future')
+
+    def __init__(self, name, func, args):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.state = PENDING
+        self.seconds = None
+        self.error = None
+        self.future = None
+
+
+_tasks = []
+_lock = threading.Lock()
+_started_at = None
+
+
+def register(name, func, *args):
+    """
+    Register a loader to call during the warmup.
+
+    Tasks are submitted in registration order, so a loader should be
+    registered after the loaders it depends on.
+
+    Args:
+        name (str): Label shown in the warmup progress.
+        func (callable): Loader, usually decorated with loading.cache.cached.
+        *args: Arguments of the call to warm up.
+    """
+    task = WarmupTask(name, func, args)
+    with _lock:
+        _tasks.append(task)
+    return task
+
+
+def _run(task):
+    task.state = RUNNING
+    start = time.perf_counter()
+    try:
+        # Un loader renvoie None quand le chargement a échoué (erreur déjà journalisée)
+        task.state = FAILED if task.func(*task.args) is None else DONE
+    except Exception as e:
+        task.state = FAILED
+        task.error = str(e)
+        logger.warning(f"Warmup of {task.name} failed: {e}")
+    finally:
+        task.seconds = time.perf_counter() - start
+
+
+def enabled():
+    """Whether the warmup is enabled by the WARMUP environment variable."""
+    return os.getenv('WARMUP', '1') != '0'
+
+
+def start(workers=None):
+    """
+    Start the warmup, once per process.
+
+    Args:
+        workers (int, optional): Threads of the pool, WARMUP_WORKERS by default.
+
+    Returns:
+        bool: True if this call started the warmup.
+    """
+    global _started_at
+    if not enabled():
+        return False
+    with _lock:
+        if _started_at is not None:
+            return False
+        _started_at = time.time()
+    # L'import enregistre les jeux de données auprès du préchargement
+    import loading.datasets  # noqa: F401
+
+    workers = workers or int(os.getenv('WARMUP_WORKERS', DEFAULT_WORKERS))
+    executor = futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="warmup")
+    with _lock:
+        for task in _tasks:
+            task.future = executor.submit(_run, task)
+    executor.shutdown(wait=False)
+    logger.info(f"Warmup of {len(_tasks)} datasets started with {workers} threads")
+    return True
+
+
+def is_running():
+    """Whether warmup tasks are still pending or running."""
+    with _lock:
+        return any(task.future is not None and not task.future.done() for task in _tasks)
+
+
+def status():
+    """
+    Progress of the warmup.
+
+    Returns:
+        list: One dict per task with name, state, duration and error, empty
+            if the warmup has not started.
+    """
+    with _lock:
+        if _started_at is None:
+            return []
+        return [
+            {
+                'name': task.name,
+                'state': task.state,
+                'seconds': round(task.seconds, 3) if task.seconds is not None else None,
+                'error': task.error
+            }
+            for task in _tasks
+        ]
+
+
+for _module in HEAVY_MODULES:
+    register(f"import {_module}", importlib.import_module, _module)
@@ -0,0 +1,395 @@
+"""
+On-demand sampling profiler for single Streamlit reruns.
+
+A background thread samples the stack of the script thread every few
+milliseconds through sys._current_frames(), so the profiled rerun runs at
+full speed apart from the sampling itself and nothing is traced. Samples
+are stored as collapsed stacks (flamegraph.pl / speedscope input) and as a
+speedscope JSON profile under cache/profiles, offered for download on the
+page, and added to hotspots aggregated over every session of the process.
+
+A rerun is profiled when:
+    - the sidebar button "Profiler la prochaine interaction" was clicked:
+      the rerun after the click (the slow interaction) is profiled;
+    - the URL contains ?profile=1: the current rerun is profiled and the
+      parameter is removed.
+
+Usage:
+    python -m monitoring.profiler hotspots cache/profiles --top 30
+    python -m monitoring.profiler merge cache/profiles --page 3_ > merged.collapsed.txt
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger("monitoring.profiler")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))).replace('\\', '/')
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join("cache", "profiles"))
+SAMPLE_INTERVAL = float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000
+QUERY_PARAM = "profile"
+ARM_KEY = "_profiler_arm"
+LAST_PROFILE_KEY = "_profiler_last"
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+_local = threading.local()
+_hotspots_lock = threading.Lock()
+# Piles agrégées sur toutes les sessions du processus
+_hotspots = Counter()
+
+
+def _frame_label(code):
+    filename = code.co_filename.replace('\\', '/')
+    if filename.startswith(ROOT + '/'):
+        filename = filename[len(ROOT) + 1:]
+    elif 'site-packages/' in filename:
+        # Bibliothèques : chemin à partir de site-packages
+        filename = filename.split('site-packages/')[-1]
+    elif '/lib/python' in filename:
+        # Bibliothèque standard : chemin à partir de lib/pythonX.Y
+        filename = filename.split('/lib/python')[-1].partition('/')[2]
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ',')
+
+
+class SamplingProfiler:
+    """Periodically samples the stack of one thread."""
+
+    def __init__(self, thread_id=None, interval=SAMPLE_INTERVAL, root_file=None):
+        """
+        Args:
+            thread_id (int, optional): Thread to sample, the calling thread by default.
+            interval (float): Seconds between two samples.
+            root_file (str, optional): Frames above the outermost frame of this
+                file (the Streamlit runner) are dropped from the stacks.
+        """
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.root_file = os.path.abspath(root_file) if root_file else None
+        self.samples = Counter()
+        self.n_samples = 0
+        self.started = None
+        self.duration = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._labels = {}
+
+    def _stack(self, frame):
+        stack = []
+        root_depth = None
+        while frame is not None:
+            code = frame.f_code
+            entry = self._labels.get(code)
+            if entry is None:
+                is_root = self.root_file is not None and os.path.abspath(code.co_filename) == self.root_file
+                entry = self._labels[code] = (_frame_label(code), is_root)
+            stack.append(entry[0])
+            if entry[1]:
+                root_depth = len(stack)
+            frame = frame.f_back
+        if root_depth is not None:
+            stack = stack[:root_depth]
+        return tuple(reversed(stack))
+
+    def _run(self):
+        next_sample = time.perf_counter()
+        while not self._stop.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            self.samples[self._stack(frame)] += 1
+            self.n_samples += 1
+            del frame
+            next_sample += self.interval
+            self._stop.wait(max(0.0, next_sample - time.perf_counter()))
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started
+        return self
+
+
+def to_collapsed(samples):
+    """Collapsed stacks, one "frame;frame;frame count" line per distinct stack."""
+    return ''.join(
+        f"{';'.join(stack)} {count}\n"
+        for stack, count in sorted(samples.items(), key=lambda item: -item[1])
+        if stack
+    )
+
+
+def parse_collapsed(text):
+    """Read collapsed stacks back into a Counter."""
+    samples = Counter()
+    for line in text.splitlines():
+        stack, _, count = line.rpartition(' ')
+        if stack and count.isdigit():
+            samples[tuple(stack.split(';'))] += int(count)
+    return samples
+
+
+def to_speedscope(samples, name, interval=SAMPLE_INTERVAL):
+    """
+    Convert samples into a speedscope "sampled" profile.
+
+    Args:
+        samples (Counter): {stack tuple (root first): sample count}.
+        name (str): Profile name shown by speedscope.
+        interval (float): Seconds represented by one sample.
+
+    Returns:
+        dict: A document following the speedscope file format schema.
+    """
+    frames, index = [], {}
+    stacks, weights = [], []
+    for stack, count in samples.items():
+        indices = []
+        for label in stack:
+            if label not in index:
+                index[label] = len(frames)
+                func, _, location = label.rpartition(' (')
+                file, _, line = location.rstrip(')').rpartition(':')
+                frames.append({'name': func or label, 'file': file, 'line': int(line) if line.isdigit() else None})
+            indices.append(index[label])
+        stacks.append(indices)
+        weights.append(round(count * interval * 1000, 3))
+    return {
+        '$schema': SPEEDSCOPE_SCHEMA,
+        'name': name,
+        'exporter': 'monitoring.profiler',
+        'activeProfileIndex': 0,
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': round(sum(weights), 3),
+            'samples': stacks,
+            'weights': weights
+        }]
+    }
+
+
+def hotspots(samples, top=20):
+    """
+    Functions ranked by self samples, with their inclusive share.
+
+    Args:
+        samples (Counter): {stack tuple: sample count}.
+        top (int): Number of functions returned.
+
+    Returns:
+        list: Dicts with function, self/total sample counts and percentages.
+    """
+    total = sum(samples.values())
+    if not total:
+        return []
+    self_counts, total_counts = Counter(), Counter()
+    for stack, count in samples.items():
+        if not stack:
+            continue
+        self_counts[stack[-1]] += count
+        for label in set(stack):
+            total_counts[label] += count
+    return [
+        {
+            'function': label,
+            'self': self_counts[label],
+            'self_pct': round(100 * self_counts[label] / total, 1),
+            'total': total_counts[label],
+            'total_pct': round(100 * total_counts[label] / total, 1)
+        }
+        for label, _ in self_counts.most_common(top)
+    ]
+
+
+def cumulative_hotspots(top=20):
+    """Hotspots of all reruns profiled by this process, across sessions."""
+    with _hotspots_lock:
+        samples = Counter(_hotspots)
+    return hotspots(samples, top), sum(samples.values())
+
+
+def save_profile(profiler, page, directory=PROFILE_DIR):
+    """
+    Write the collapsed stacks and the speedscope file of a finished profile.
+
+    Returns:
+        dict: Paths and contents of both files, plus a short summary.
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    name = f"{page}_{timestamp}"
+    collapsed = to_collapsed(profiler.samples)
+    speedscope = json.dumps(to_speedscope(profiler.samples, name, profiler.interval))
+    paths = {
+        'collapsed': os.path.join(directory, f"{name}.collapsed.txt"),
+        'speedscope': os.path.join(directory, f"{name}.speedscope.json")
+    }
+    try:
+        os.makedirs(directory, exist_ok=True)
+        for kind, content in (('collapsed', collapsed), ('speedscope', speedscope)):
+            with open(paths[kind], 'w', encoding='utf-8') as f:
+                f.write(content)
+    except OSError as e:
+        logger.warning(f"Could not store profile {name}: {e}")
+    return {
+        'name': name,
+        'page': page,
+        'duration_ms': round(profiler.duration * 1000, 1),
+        'samples': profiler.n_samples,
+        'hotspots': hotspots(profiler.samples, top=15),
+        'collapsed': collapsed,
+        'speedscope': speedscope,
+        'paths': paths
+    }
+
+
+def _arm():
+    import streamlit as st
+    st.session_state[ARM_KEY] = 'pending'
+
+
+def start_rerun(page, script_file=None):
+    """
+    Start the sampler when this rerun was requested for profiling.
+
+    A sampler left running by an interrupted rerun of this thread is
+    stopped first.
+
+    Args:
+        page (str): Page name used in file names.
+        script_file (str, optional): Page script, frames above it are dropped.
+    """
+    import streamlit as st
+
+    # Un rerun interrompu (StopException, RerunException) n'a pas appelé
+    # finish_rerun : son échantillonneur tournerait indéfiniment
+    leftover = getattr(_local, 'profiler', None)
+    _local.profiler = None
+    if leftover is not None:
+        leftover.stop()
+        logger.info(f"Discarded the profile of an interrupted rerun of {getattr(_local, 'page', 'page')}")
+
+    requested = False
+    try:
+        if st.query_params.get(QUERY_PARAM) in ('1', 'true'):
+            del st.query_params[QUERY_PARAM]
+            requested = True
+    except Exception:
+        pass
+    # Le clic sur le bouton déclenche lui-même un rerun : on profile le suivant
+    state = st.session_state.get(ARM_KEY)
+    if state == 'pending':
+        st.session_state[ARM_KEY] = 'armed'
+    elif state == 'armed':
+        st.session_state[ARM_KEY] = None
+        requested = True
+
+    st.sidebar.button(
+        "🔬 Profiler la prochaine interaction",
+        on_click=_arm,
+        disabled=st.session_state.get(ARM_KEY) is not None,
+        help="Le rerun déclenché par votre prochaine action sur la page sera profilé"
+    )
+    _local.page = page
+    _local.profiler = SamplingProfiler(root_file=script_file).start() if requested else None
+
+
+def finish_rerun():
+    """Stop the sampler if running, store the profile and show the panel."""
+    profiler = getattr(_local, 'profiler', None)
+    _local.profiler = None
+    if profiler is not None:
+        profiler.stop()
+        with _hotspots_lock:
+            _hotspots.update(profiler.samples)
+        import streamlit as st
+        st.session_state[LAST_PROFILE_KEY] = save_profile(profiler, getattr(_local, 'page', 'page'))
+    render_panel()
+
+
+def render_panel():
+    """Sidebar panel with the last profile of the session and the cumulative hotspots."""
+    import pandas as pd
+    import streamlit as st
+
+    profile = st.session_state.get(LAST_PROFILE_KEY)
+    if st.session_state.get(ARM_KEY) is not None:
+        st.sidebar.info("🔬 Profilage armé : la prochaine interaction sera profilée.")
+    if profile is None:
+        return
+
+    with st.sidebar.expander(f"🔬 Profil : {profile['page']} ({profile['duration_ms']:.0f} ms)"):
+        st.caption(f"{profile['samples']} échantillons — {profile['name']}")
+        if profile['hotspots']:
+            st.dataframe(
+                pd.DataFrame(profile['hotspots'])[['function', 'self_pct', 'total_pct']].rename(
+                    columns={'function': 'Fonction', 'self_pct': 'Propre (%)', 'total_pct': 'Inclusif (%)'}),
+                hide_index=True,
+                use_container_width=True
+            )
+        st.download_button(
+            "Télécharger (speedscope)",
+            profile['speedscope'],
+            file_name=f"{profile['name']}.speedscope.json",
+            mime="application/json",
+            key="_profiler_speedscope"
+        )
+        st.download_button(
+            "Télécharger (collapsed stacks)",
+            profile['collapsed'],
+            file_name=f"{profile['name']}.collapsed.txt",
+            mime="text/plain",
+            key="_profiler_collapsed"
+        )
+        cumulative, n_samples = cumulative_hotspots(top=10)
+        if cumulative:
+            st.caption(f"Hotspots cumulés de toutes les sessions ({n_samples} échantillons)")
+            st.dataframe(
+                pd.DataFrame(cumulative)[['function', 'self_pct']].rename(
+                    columns={'function': 'Fonction', 'self_pct': 'Propre (%)'}),
+                hide_index=True,
+                use_container_width=True
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate stored rerun profiles.")
+    parser.add_argument('command', choices=['hotspots', 'merge'])
+    parser.add_argument('directory', nargs='?', default=PROFILE_DIR)
+    parser.add_argument('--page', default=None, help="Only profiles whose name starts with this page")
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    samples = Counter()
+    pattern = f"{args.page or ''}*.collapsed.txt"
+    for path in sorted(glob.glob(os.path.join(args.directory, pattern))):
+        with open(path, encoding='utf-8') as f:
+            samples.update(parse_collapsed(f.read()))
+
+    if args.command == 'merge':
+        # Piles fusionnées, à passer à flamegraph.pl ou à ouvrir dans speedscope
+        sys.stdout.write(to_collapsed(samples))
+        return
+    for row in hotspots(samples, args.top):
+        print(f"{row['self_pct']:>6.1f}% self {row['total_pct']:>6.1f}% total  {row['function']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+"""
+Nested timing spans recorded per Streamlit rerun.
+
+Loaders and chart sections open spans with `span()` or the `timed`
+decorator; each span records its wall time, its nesting level and the bytes
+it read. A page calls `start_rerun()` after st.set_page_config and
+`finish_rerun()` at its end, which shows the optional sidebar panel and
+exports the rerun as one JSON line and into Prometheus counters. Both also
+drive the on-demand profiler (monitoring.profiler).
+
+Recording is enabled per session by the sidebar checkbox or the `?perf=1`
+query parameter, or for every session by PERF_SPANS=1. When it is disabled,
+span() returns a shared no-op context manager and timed functions are called
+directly, so instrumented code pays one thread-local lookup per call.
+
+Usage:
+    python -m monitoring.spans summarize cache/spans/spans.jsonl
+    python -m monitoring.spans prometheus cache/spans/spans.jsonl > spans.prom
+"""
+import argparse
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+from monitoring import profiler
+
+logger = logging.getLogger("monitoring.spans")
+
+PANEL_KEY = "_perf_spans_enabled"
+HISTORY_KEY = "_perf_spans_history"
+HISTORY_SIZE = 50
+QUERY_PARAM = "perf"
+# Export JSON lines (désactivé si la variable vaut une chaîne vide) et fichier texte Prometheus optionnel
+LOG_PATH = os.getenv('PERF_SPANS_LOG', os.path.join("cache", "spans", "spans.jsonl"))
+PROMETHEUS_PATH = os.getenv('PERF_SPANS_PROM')
+METRIC_PREFIX = "food_dashboard"
+
+_local = threading.local()
+_metrics_lock = threading.Lock()
+_log_lock = threading.Lock()
+# (page, span) -> [nombre, secondes, octets], agrégé sur toutes les sessions du processus
+_metrics = {}
+
+
+class Span:
+    """One timed section of a rerun."""
+
+    __slots__ = ('name', 'depth', 'attrs', 'bytes', 'start', 'seconds', '_stack')
+
+    def __init__(self, name, depth, attrs, stack):
+        self.name = name
+        self.depth = depth
+        self.attrs = attrs
+        self.bytes = 0
+        self.start = None
+        self.seconds = None
+        self._stack = stack
+
+    def __enter__(self):
+        self._stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self.start
+        self._stack.pop()
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        return False
+
+    def add_bytes(self, n_bytes):
+        """Count bytes read or written inside the span."""
+        self.bytes += int(n_bytes or 0)
+
+    def set(self, **attrs):
+        """Attach attributes (cache hit, row count...) to the span."""
+        self.attrs.update(attrs)
+
+
+class _NoopSpan:
+    """Shared span returned while recording is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def add_bytes(self, n_bytes):
+        pass
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class RerunRecorder:
+    """Spans of one script run, in opening order."""
+
+    def __init__(self, page, session_id=None):
+        self.page = page
+        self.session_id = session_id
+        self.timestamp = datetime.now().isoformat(timespec='milliseconds')
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.stack = []
+        self.seconds = None
+
+    def span(self, name, **attrs):
+        new_span = Span(name, len(self.stack), attrs, self.stack)
+        self.spans.append(new_span)
+        return new_span
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.origin
+        return self.to_dict()
+
+    def to_dict(self):
+        return {
+            'timestamp': self.timestamp,
+            'page': self.page,
+            'session': self.session_id,
+            'total_ms': round((self.seconds or 0) * 1000, 3),
+            'spans': [
+                {
+                    'name': s.name,
+                    'depth': s.depth,
+                    'start_ms': round((s.start - self.origin) * 1000, 3) if s.start else None,
+                    'ms': round(s.seconds * 1000, 3) if s.seconds is not None else None,
+                    'bytes': s.bytes,
+                    **({'attrs': s.attrs} if s.attrs else {})
+                }
+                for s in self.spans
+            ]
+        }
+
+
+def current_recorder():
+    """Recorder of the rerun running in this thread, None if recording is disabled."""
+    return getattr(_local, 'recorder', None)
+
+
+def span(name, **attrs):
+    """
+    Open a span in the current rerun.
+
+    Args:
+        name (str): Name of the section, e.g. "s3.download" or "chart: heatmap".
+        **attrs: Attributes stored with the span (S3 key, rows...).
+
+    Returns:
+        A context manager yielding the span (a no-op one when disabled).
+    """
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is None:
+        return _NOOP
+    return recorder.span(name, **attrs)
+
+
+def add_bytes(n_bytes):
+    """Count bytes on the innermost open span, if any."""
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is not None and recorder.stack:
+        recorder.stack[-1].add_bytes(n_bytes)
+
+
+def timed(name=None):
+    """
+    Decorator recording each call of the function as a span.
+
+    Placed above @st.cache_data, cache hits show up as short spans without
+    children, while misses contain the download and decode spans.
+
+    Args:
+        name (str, optional): Span name, the function name by default.
+    """
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = getattr(_local, 'recorder', None)
+            if recorder is None:
+                return func(*args, **kwargs)
+            with recorder.span(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def plotly_chart(fig, **kwargs):
+    """st.plotly_chart with the figure serialization recorded as a span."""
+    import streamlit as st
+
+    with span("plotly_chart"):
+        return st.plotly_chart(fig, **kwargs)
+
+
+def _session_id():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        return ctx.session_id if ctx else None
+    except Exception:
+        return None
+
+
+def enabled_by_default():
+    """Whether new sessions record spans (PERF_SPANS=1 or ?perf=1 in the URL)."""
+    import streamlit as st
+
+    if os.getenv('PERF_SPANS', '').lower() in ('1', 'true', 'yes'):
+        return True
+    try:
+        return st.query_params.get(QUERY_PARAM) in ('1', 'true')
+    except Exception:
+        return False
+
+
+def start_rerun(page):
+    """
+    Start recording the spans of this rerun if the session enabled it.
+
+    Args:
+        page (str): Page name used in exports (e.g. the script file name).
+    """
+    import streamlit as st
+
+    script_file = page if page.endswith('.py') else None
+    if script_file:
+        page = os.path.splitext(os.path.basename(page))[0]
+    # La case à cocher reste maîtresse une fois la session initialisée
+    if PANEL_KEY not in st.session_state:
+        st.session_state[PANEL_KEY] = enabled_by_default()
+    enabled = st.sidebar.checkbox("⏱️ Mesures de performance", key=PANEL_KEY)
+    _local.recorder = RerunRecorder(page, _session_id()) if enabled else None
+    profiler.start_rerun(page, script_file)
+
+
+def finish_rerun():
+    """Stop recording and profiling, export the rerun and show the sidebar panels."""
+    profiler.finish_rerun()
+    recorder = getattr(_local, 'recorder', None)
+    _local.recorder = None
+    if recorder is None:
+        return None
+    record = recorder.finish()
+    _aggregate(record)
+    export_jsonl(record)
+    if PROMETHEUS_PATH:
+        write_prometheus(PROMETHEUS_PATH)
+    render_panel(record)
+    return record
+
+
+def _aggregate(record):
+    with _metrics_lock:
+        for key, (count, seconds, n_bytes) in aggregate_records([record]).items():
+            totals = _metrics.setdefault(key, [0, 0.0, 0])
+            totals[0] += count
+            totals[1] += seconds
+            totals[2] += n_bytes
+
+
+def export_jsonl(record, path=None):
+    """Append one rerun record to the JSON lines log."""
+    path = LOG_PATH if path is None else path
+    if not path:
+        return
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        line = json.dumps(record, default=str)
+        with _log_lock, open(path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    except OSError as e:
+        logger.warning(f"Could not write spans to {path}: {e}")
+
+
+def _escape(label):
+    return str(label).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(metrics=None):
+    """
+    Render aggregated spans in the Prometheus text exposition format.
+
+    Args:
+        metrics (dict, optional): {(page, span): [count, seconds, bytes]}, the
+            process-wide aggregate by default.
+
+    Returns:
+        str: Summary-style seconds (sum/count) and a bytes counter per span.
+    """
+    if metrics is None:
+        with _metrics_lock:
+            metrics = {key: list(values) for key, values in _metrics.items()}
+    seconds = f"{METRIC_PREFIX}_span_seconds"
+    reruns = f"{METRIC_PREFIX}_rerun_seconds"
+    read_bytes = f"{METRIC_PREFIX}_span_bytes_total"
+    lines = [
+        f"# HELP {reruns} Wall time of page reruns.",
+        f"# TYPE {reruns} summary"
+    ]
+    for (page, name), (count, total, _) in sorted(metrics.items()):
+        if name == '_rerun':
+            lines.append(f'{reruns}_sum{{page="{_escape(page)}"}} {total:.6f}')
+            lines.append(f'{reruns}_count{{page="{_escape(page)}"}} {count}')
+    lines += [f"# HELP {seconds} Wall time spent in instrumented spans.", f"# TYPE {seconds} summary"]
+    for (page, name), (count, total, _) in sorted(metrics.items()):
+        if name != '_rerun':
+            labels = f'page="{_escape(page)}",span="{_escape(name)}"'
+            lines.append(f'{seconds}_sum{{{labels}}} {total:.6f}')
+            lines.append(f'{seconds}_count{{{labels}}} {count}')
+    lines += [f"# HELP {read_bytes} Bytes read inside instrumented spans.", f"# TYPE {read_bytes} counter"]
+    for (page, name), (_, _, n_bytes) in sorted(metrics.items()):
+        if name != '_rerun' and n_bytes:
+            lines.append(f'{read_bytes}{{page="{_escape(page)}",span="{_escape(name)}"}} {n_bytes}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path):
+    """Atomically write the aggregate for a node_exporter textfile collector."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(prometheus_text())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write Prometheus metrics to {path}: {e}")
+
+
+def render_panel(record):
+    """Sidebar panel listing the spans of the rerun and the session history."""
+    import pandas as pd
+    import streamlit as st
+
+    history = st.session_state.setdefault(HISTORY_KEY, deque(maxlen=HISTORY_SIZE))
+    history.append(record)
+
+    with st.sidebar.expander(f"⏱️ Rerun : {record['total_ms']:.0f} ms", expanded=True):
+        if record['spans']:
+            rows = pd.DataFrame([
+                {
+                    'Section': '\u2003' * s['depth'] + s['name'],
+                    'ms': s['ms'],
+                    'Ko': round(s['bytes'] / 1024, 1) if s['bytes'] else None
+                }
+                for s in record['spans']
+            ])
+            st.dataframe(rows, hide_index=True, use_container_width=True)
+        else:
+            st.caption("Aucune section instrumentée n'a été exécutée.")
+        st.caption(f"{len(history)} reruns enregistrés pour cette session")
+        st.download_button(
+            "Télécharger (JSON lines)",
+            '\n'.join(json.dumps(r, default=str) for r in history),
+            file_name="spans.jsonl",
+            mime="application/x-ndjson",
+            key="_perf_spans_jsonl"
+        )
+        st.download_button(
+            "Télécharger (Prometheus)",
+            prometheus_text(),
+            file_name="spans.prom",
+            mime="text/plain",
+            key="_perf_spans_prom"
+        )
+
+
+def read_jsonl(path):
+    """Read the rerun records of a JSON lines log."""
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records):
+    """
+    Latency percentiles and bytes per page and span over many reruns.
+
+    Args:
+        records (list): Rerun records as exported by export_jsonl.
+
+    Returns:
+        list: One dict per (page, span) with count, p50/p95/p99 ms and mean bytes.
+    """
+    samples = {}
+    for record in records:
+        samples.setdefault((record['page'], '_rerun'), []).append((record['total_ms'], 0))
+        for s in record['spans']:
+            if s['ms'] is not None:
+                samples.setdefault((record['page'], s['name']), []).append((s['ms'], s['bytes']))
+    rows = []
+    for (page, name), values in sorted(samples.items()):
+        ms = np.array([v[0] for v in values])
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        rows.append({
+            'page': page,
+            'span': name,
+            'count': len(values),
+            'p50_ms': round(float(p50), 2),
+            'p95_ms': round(float(p95), 2),
+            'p99_ms': round(float(p99), 2),
+            'mean_bytes': int(np.mean([v[1] for v in values]))
+        })
+    return rows
+
+
+def aggregate_records(records):
+    """Build the {(page, span): [count, seconds, bytes]} aggregate from records."""
+    metrics = {}
+    for record in records:
+        totals = metrics.setdefault((record['page'], '_rerun'), [0, 0.0, 0])
+        totals[0] += 1
+        totals[1] += record['total_ms'] / 1000
+        for s in record['spans']:
+            if s['ms'] is not None:
+                totals = metrics.setdefault((record['page'], s['name']), [0, 0.0, 0])
+                totals[0] += 1
+                totals[1] += s['ms'] / 1000
+                totals[2] += s['bytes']
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate exported rerun spans.")
+    parser.add_argument('command', choices=['summarize', 'prometheus'])
+    parser.add_argument('path', nargs='?', default=LOG_PATH, help="JSON lines log of reruns")
+    args = parser.parse_args()
+
+    records = read_jsonl(args.path)
+    if args.command == 'prometheus':
+        print(prometheus_text(aggregate_records(records)), end='')
+        return
+    for row in summarize(records):
+        print(f"{row['page'][:32]:<32} {row['span'][:40]:<40} n={row['count']:<5} "
+              f"p50={row['p50_ms']:>9.2f} ms  p95={row['p95_ms']:>9.2f} ms  "
+              f"p99={row['p99_ms']:>9.2f} ms  {row['mean_bytes'] / 1024:>9.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
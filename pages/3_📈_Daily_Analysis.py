@@ -2,38 +2,17 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import duckdb
 import sys
 import os
-from scipy.stats import gaussian_kde
 import numpy as np
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
-from AWS.s3.connect_s3 import S3Manager
+from loading import refresh
+from loading.datasets import load_daily_percentage_change
+from monitoring import spans
 
 st.set_page_config(page_title="Daily Analysis", page_icon="📈", layout="wide")
-
-# Fonction pour charger les données
-@st.cache_data
-def load_data(source):
-    s3 = S3Manager()
-    if source == "DuckDB":
-        file_path = "transform/folder_6_parquet/folder_5_percentage_change_filtered/daily_percentage_change_duckdb.parquet"
-    else:
-        file_path = "transform/folder_6_parquet/folder_5_percentage_change_filtered/daily_percentage_change_pandas.parquet"
-    
-    temp_file = f"temp_{os.path.basename(file_path)}"
-    try:
-        if s3.download_file(file_path, temp_file):
-            query = f"SELECT * FROM read_parquet('{temp_file}')"
-            return duckdb.query(query).to_df()
-        return None
-    except Exception as e:
-        st.error(f"Erreur lors du chargement des données: {str(e)}")
-        return None
-    finally:
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
+spans.start_rerun(__file__)
 
 st.title("📈 Analyse Quotidienne Globale")
 
@@ -45,7 +24,7 @@ source = st.radio(
 )
 
 # Chargement des données
-df = load_data(source)
+df = load_daily_percentage_change(source)
 
 if df is not None:
     # Sélection des métriques
@@ -73,39 +52,41 @@ if df is not None:
         
         if len(date_range) == 2:
             start_date, end_date = date_range
-            mask = (df["date"].dt.date >= start_date) & (df["date"].dt.date <= end_date)
-            df_filtered = df[mask]
+            with spans.span("filter: date range"):
+                mask = (df["date"].dt.date >= start_date) & (df["date"].dt.date <= end_date)
+                df_filtered = df[mask]
             
             # Évolution temporelle
             st.subheader("Évolution temporelle globale")
             
-            # Graphique des tendances
-            fig = go.Figure()
+            with spans.span("chart: trends"):
+                # Graphique des tendances
+                fig = go.Figure()
             
-            for metric in selected_metrics:
-                # Valeurs journalières
-                fig.add_trace(go.Scatter(
-                    x=df_filtered["date"],
-                    y=df_filtered[metrics[metric]],
-                    name=f"{metric} (journalier)",
-                    line=dict(dash="dash")
-                ))
+                for metric in selected_metrics:
+                    # Valeurs journalières
+                    fig.add_trace(go.Scatter(
+                        x=df_filtered["date"],
+                        y=df_filtered[metrics[metric]],
+                        name=f"{metric} (journalier)",
+                        line=dict(dash="dash")
+                    ))
                 
-                # Moyennes mobiles
-                fig.add_trace(go.Scatter(
-                    x=df_filtered["date"],
-                    y=df_filtered[f"rolling_avg_{metrics[metric]}"],
-                    name=f"{metric} (moyenne mobile)",
-                    line=dict(width=3)
-                ))
+                    # Moyennes mobiles
+                    fig.add_trace(go.Scatter(
+                        x=df_filtered["date"],
+                        y=df_filtered[f"rolling_avg_{metrics[metric]}"],
+                        name=f"{metric} (moyenne mobile)",
+                        line=dict(width=3)
+                    ))
             
-            fig.update_layout(
-                title="Évolution des métriques nutritionnelles",
-                xaxis_title="Date",
-                yaxis_title="Valeur",
-                legend_title="Métriques"
-            )
-            st.plotly_chart(fig, use_container_width=True)
+                fig.update_layout(
+                    title="Évolution des métriques nutritionnelles",
+                    xaxis_title="Date",
+                    yaxis_title="Valeur",
+                    legend_title="Métriques"
+                )
+                spans.plotly_chart(fig, use_container_width=True)
             
             # Graphiques par macronutriment
             st.subheader("Évolution par macronutriment")
@@ -115,37 +96,38 @@ if df is not None:
                 col1, col2 = st.columns([2, 1])
                 
                 with col1:
-                    fig = go.Figure()
+                    with spans.span(f"chart: {metric}"):
+                        fig = go.Figure()
                     
-                    # Valeurs journalières
-                    fig.add_trace(go.Scatter(
-                        x=df_filtered["date"],
-                        y=df_filtered[metrics[metric]],
-                        mode="lines+markers",
-                        name=metric,
-                        line=dict(width=2),
-                        marker=dict(size=6)
-                    ))
+                        # Valeurs journalières
+                        fig.add_trace(go.Scatter(
+                            x=df_filtered["date"],
+                            y=df_filtered[metrics[metric]],
+                            mode="lines+markers",
+                            name=metric,
+                            line=dict(width=2),
+                            marker=dict(size=6)
+                        ))
                     
-                    # Moyenne mobile sur 7 jours
-                    rolling_mean = df_filtered[metrics[metric]].rolling(window=7).mean()
-                    fig.add_trace(go.Scatter(
-                        x=df_filtered["date"],
-                        y=rolling_mean,
-                        mode="lines",
-                        name=f"Moyenne mobile (7j)",
-                        line=dict(width=2, dash="dash")
-                    ))
+                        # Moyenne mobile sur 7 jours
+                        rolling_mean = df_filtered[metrics[metric]].rolling(window=7).mean()
+                        fig.add_trace(go.Scatter(
+                            x=df_filtered["date"],
+                            y=rolling_mean,
+                            mode="lines",
+                            name=f"Moyenne mobile (7j)",
+                            line=dict(width=2, dash="dash")
+                        ))
                     
-                    fig.update_layout(
-                        title=f"Évolution de {metric}",
-                        xaxis_title="Date",
-                        yaxis_title=f"{metric}",
-                        showlegend=True,
-                        height=400
-                    )
+                        fig.update_layout(
+                            title=f"Évolution de {metric}",
+                            xaxis_title="Date",
+                            yaxis_title=f"{metric}",
+                            showlegend=True,
+                            height=400
+                        )
                     
-                    st.plotly_chart(fig, use_container_width=True)
+                        spans.plotly_chart(fig, use_container_width=True)
                 
                 with col2:
                     # Statistiques pour ce macronutriment
@@ -164,61 +146,64 @@ if df is not None:
             st.subheader("Distribution des variations quotidiennes")
             
             # Calculer les variations pour chaque métrique
-            variations = {}
-            for metric in selected_metrics:
-                variations[metric] = df_filtered[metrics[metric]].pct_change() * 100
+            with spans.span("chart: variation violins"):
+                variations = {}
+                for metric in selected_metrics:
+                    variations[metric] = df_filtered[metrics[metric]].pct_change() * 100
             
-            # Violin plot pour toutes les métriques
-            fig_violin = go.Figure()
-            for metric in selected_metrics:
-                fig_violin.add_trace(go.Violin(
-                    y=variations[metric],
-                    name=metric,
-                    box_visible=True,
-                    meanline_visible=True,
-                    points="outliers"
-                ))
+                # Violin plot pour toutes les métriques
+                fig_violin = go.Figure()
+                for metric in selected_metrics:
+                    fig_violin.add_trace(go.Violin(
+                        y=variations[metric],
+                        name=metric,
+                        box_visible=True,
+                        meanline_visible=True,
+                        points="outliers"
+                    ))
             
-            fig_violin.update_layout(
-                title="Distribution des variations (Violin Plot)",
-                yaxis_title="Variation (%)",
-                showlegend=True,
-                height=500,
-                violinmode="overlay"
-            )
-            st.plotly_chart(fig_violin, use_container_width=True)
+                fig_violin.update_layout(
+                    title="Distribution des variations (Violin Plot)",
+                    yaxis_title="Variation (%)",
+                    showlegend=True,
+                    height=500,
+                    violinmode="overlay"
+                )
+                spans.plotly_chart(fig_violin, use_container_width=True)
             
             # Histogrammes par métrique
             cols = st.columns(len(selected_metrics))
             for idx, metric in enumerate(selected_metrics):
                 with cols[idx]:
-                    fig_hist = go.Figure()
-                    fig_hist.add_trace(go.Histogram(
-                        x=variations[metric],
-                        name=metric,
-                        nbinsx=30,
-                        histnorm='probability density'
-                    ))
+                    with spans.span(f"chart: {metric} histogram"):
+                        fig_hist = go.Figure()
+                        fig_hist.add_trace(go.Histogram(
+                            x=variations[metric],
+                            name=metric,
+                            nbinsx=30,
+                            histnorm='probability density'
+                        ))
                     
-                    # Ajouter une courbe de densité
-                    hist_data = variations[metric].dropna()
-                    kde = gaussian_kde(hist_data)
-                    x_range = np.linspace(hist_data.min(), hist_data.max(), 100)
-                    fig_hist.add_trace(go.Scatter(
-                        x=x_range,
-                        y=kde(x_range),
-                        name="Densité",
-                        line=dict(color='red', width=2)
-                    ))
+                        # Ajouter une courbe de densité (scipy importé à la demande, préchargé par Home)
+                        from scipy.stats import gaussian_kde
+                        hist_data = variations[metric].dropna()
+                        kde = gaussian_kde(hist_data)
+                        x_range = np.linspace(hist_data.min(), hist_data.max(), 100)
+                        fig_hist.add_trace(go.Scatter(
+                            x=x_range,
+                            y=kde(x_range),
+                            name="Densité",
+                            line=dict(color='red', width=2)
+                        ))
                     
-                    fig_hist.update_layout(
-                        title=f"Distribution {metric}",
-                        xaxis_title="Variation (%)",
-                        yaxis_title="Densité",
-                        showlegend=False,
-                        height=400
-                    )
-                    st.plotly_chart(fig_hist, use_container_width=True)
+                        fig_hist.update_layout(
+                            title=f"Distribution {metric}",
+                            xaxis_title="Variation (%)",
+                            yaxis_title="Densité",
+                            showlegend=False,
+                            height=400
+                        )
+                        spans.plotly_chart(fig_hist, use_container_width=True)
             
             # Ajout de l'interprétation business
             st.markdown("""
@@ -271,21 +256,22 @@ if df is not None:
             
             # Corrélations
             st.subheader("Matrice de corrélation")
-            corr_data = df_filtered[[metrics[m] for m in selected_metrics]].corr()
+            with spans.span("chart: correlations"):
+                corr_data = df_filtered[[metrics[m] for m in selected_metrics]].corr()
             
-            fig_corr = px.imshow(
-                corr_data,
-                labels=dict(color="Corrélation"),
-                x=selected_metrics,
-                y=selected_metrics,
-                color_continuous_scale="RdBu",
-                aspect="auto"
-            )
+                fig_corr = px.imshow(
+                    corr_data,
+                    labels=dict(color="Corrélation"),
+                    x=selected_metrics,
+                    y=selected_metrics,
+                    color_continuous_scale="RdBu",
+                    aspect="auto"
+                )
             
-            fig_corr.update_layout(
-                title="Corrélation entre les métriques"
-            )
-            st.plotly_chart(fig_corr, use_container_width=True)
+                fig_corr.update_layout(
+                    title="Corrélation entre les métriques"
+                )
+                spans.plotly_chart(fig_corr, use_container_width=True)
             
             # Données brutes
             with st.expander("Voir les données brutes"):
@@ -297,3 +283,6 @@ if df is not None:
                     df_display[f"{metric} variation (%)"] = df_display[metrics[metric]].pct_change() * 100
                 
                 st.dataframe(df_display.sort_values("date"), use_container_width=True)
+
+refresh.render_indicator()
+spans.finish_rerun()
@@ -2,69 +2,75 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import json
 from datetime import datetime, timedelta
 import numpy as np
 import duckdb
 import sys
 import os
-import tempfile
 
 # Ajouter le chemin racine au PYTHONPATH
 sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
 from AWS.s3.connect_s3 import S3Manager
+from analytics.anomaly_scorer import RecentScoredMeals
+from analytics.time_parsing import HOUR_COLUMN
+from loading import refresh
+from loading.cache import cached
+from loading.datasets import load_anomaly_results
+from monitoring import spans
 
 st.set_page_config(page_title="Détection d'Anomalies Alimentaires", page_icon="🔍", layout="wide")
+spans.start_rerun(__file__)
 
-# Fonction pour charger les données depuis S3
-@st.cache_data
-def load_data_from_s3(file_path):
-    """Charge un fichier depuis S3"""
-    s3 = S3Manager()
-    temp_file = tempfile.NamedTemporaryFile(suffix=os.path.basename(file_path))
+@cached("recent_anomalies_window", resource=True)
+def load_recent_window():
+    """Fenêtre des derniers repas notés, partagée entre les sessions"""
+    return RecentScoredMeals()
+
+@spans.timed("load_recent_anomalies")
+@cached("recent_anomalies", ttl=30)
+def load_recent_anomalies():
+    """Charge les repas notés par le scoreur en continu depuis la dernière actualisation"""
     try:
-        s3.download_file(file_path, temp_file.name)
-        return temp_file
+        return load_recent_window().refresh(S3Manager())
     except Exception as e:
-        st.error(f"Erreur lors du chargement du fichier {file_path}: {str(e)}")
-        return None
+        st.warning(f"Résultats en continu indisponibles : {str(e)}")
+        return pd.DataFrame()
+
+def time_column(df):
+    """Colonne horaire à afficher : 'heure' si elle est présente, sinon l'heure entière"""
+    return 'heure' if 'heure' in df.columns else HOUR_COLUMN
 
-@st.cache_data
-def load_all_ai_results():
-    """Charge tous les résultats des modèles d'IA depuis S3"""
-    # Créer un dossier temporaire
-    temp_dir = tempfile.mkdtemp()
-    s3 = S3Manager()
+@spans.timed("section: recent anomalies")
+def display_recent_anomalies():
+    """Affiche les anomalies détectées en continu sur les derniers repas"""
+    recent = load_recent_anomalies()
+    if recent.empty:
+        return
     
-    try:
-        # Anomaly detection results
-        predictions_key = "AI/anomaly_detection/results/anomalies_detected.xlsx"
-        temp_predictions = os.path.join(temp_dir, "predictions.xlsx")
-        s3.download_file(predictions_key, temp_predictions)
-        anomaly_data = pd.read_excel(temp_predictions)
-        
-        stats_key = "AI/anomaly_detection/results/model_statistics.json"
-        temp_stats = os.path.join(temp_dir, "stats.json")
-        s3.download_file(stats_key, temp_stats)
-        with open(temp_stats, 'r', encoding='utf-8') as f:
-            anomaly_analysis = json.load(f)
-        
-        return {
-            'anomalies': {
-                'data': anomaly_data,
-                'analysis': anomaly_analysis
-            }
-        }
-            
-    except Exception as e:
-        st.error(f"Erreur lors du chargement des résultats : {str(e)}")
-        return None
-        
-    finally:
-        # Nettoyage : supprimer les fichiers temporaires
-        import shutil
-        shutil.rmtree(temp_dir, ignore_errors=True)
+    st.subheader("⚡ Anomalies Récentes")
+    
+    st.write("""
+    Les derniers repas enregistrés sont comparés en continu aux habitudes de chaque utilisateur, 
+    pour la même tranche horaire. Cette section est actualisée toutes les 30 secondes.
+    """)
+    
+    flagged = recent[recent['is_anomaly']].sort_values('anomaly_score', ascending=False)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Repas analysés", len(recent))
+    with col2:
+        st.metric("Anomalies récentes", len(flagged))
+    
+    if not flagged.empty:
+        st.dataframe(
+            flagged[[
+                'user_id', 'date', time_column(flagged), 'total_calories', 'total_lipids',
+                'total_carbs', 'total_protein', 'anomaly_score'
+            ]].head(50).style.background_gradient(subset=['anomaly_score'], cmap='Reds'),
+            use_container_width=True
+        )
 
+@spans.timed("section: model metrics")
 def display_model_metrics(results):
     """Affiche les métriques principales des modèles"""
     st.subheader("📊 Métriques des Modèles")
@@ -89,6 +95,7 @@ def display_model_metrics(results):
             f"{results['anomalies']['analysis']['anomaly_statistics']['mean_anomaly_score']:.3f}"
         )
 
+@spans.timed("chart: temporal patterns")
 def plot_temporal_patterns(results):
     """Affiche les patterns temporels des repas anormaux"""
     st.subheader("⏰ Distribution Temporelle des Anomalies")
@@ -99,14 +106,9 @@ def plot_temporal_patterns(results):
     particulières ou des moments de la journée plus propices aux écarts alimentaires.
     """)
     
-    # Préparer les données des anomalies
-    anomaly_data = results['anomalies']['data']
-    
     # Distribution par heure pour les anomalies
-    anomalies = anomaly_data[anomaly_data['is_anomaly']]
-    hour_dist = anomalies.groupby(
-        pd.to_datetime(anomalies['heure']).dt.hour
-    ).size()
+    anomalies = results['anomalies']['index'].frame
+    hour_dist = anomalies[anomalies[HOUR_COLUMN] >= 0].groupby(HOUR_COLUMN).size()
     
     # Créer le graphique
     fig = go.Figure()
@@ -128,8 +130,9 @@ def plot_temporal_patterns(results):
         xaxis=dict(tickmode='linear', tick0=0, dtick=1)
     )
     
-    st.plotly_chart(fig, use_container_width=True)
+    spans.plotly_chart(fig, use_container_width=True)
 
+@spans.timed("chart: nutritional patterns")
 def plot_nutritional_patterns(results):
     """Affiche les patterns nutritionnels des anomalies"""
     st.subheader("🥗 Profil Nutritionnel des Anomalies")
@@ -181,8 +184,9 @@ def plot_nutritional_patterns(results):
         barmode='group'
     )
     
-    st.plotly_chart(fig, use_container_width=True)
+    spans.plotly_chart(fig, use_container_width=True)
 
+@spans.timed("section: anomaly details")
 def display_anomaly_details(results):
     """Affiche les détails des anomalies détectées"""
     st.subheader("🔍 Analyse Détaillée des Anomalies")
@@ -197,17 +201,16 @@ def display_anomaly_details(results):
     d'identifier si les anomalies sont principalement liées à la quantité de calories consommées.
     """)
     
-    anomaly_data = results['anomalies']['data']
-    anomalies = anomaly_data[anomaly_data['is_anomaly']].sort_values('anomaly_score')
+    anomaly_index = results['anomalies']['index']
     
     # Filtres
     col1, col2 = st.columns(2)
     with col1:
         min_score = st.slider(
             "Score d'anomalie minimum",
-            float(anomalies['anomaly_score'].min()),
-            float(anomalies['anomaly_score'].max()),
-            float(anomalies['anomaly_score'].min())
+            anomaly_index.min_score,
+            anomaly_index.max_score,
+            anomaly_index.min_score
         )
     with col2:
         max_items = st.slider(
@@ -215,16 +218,42 @@ def display_anomaly_details(results):
             1, 50, 10
         )
     
-    # Filtrer les anomalies
-    filtered_anomalies = anomalies[
-        anomalies['anomaly_score'] >= min_score
-    ].head(max_items)
+    col1, col2 = st.columns(2)
+    selected_user = None
+    if anomaly_index.user_keys is not None:
+        with col1:
+            selected_user = st.selectbox(
+                "Utilisateur",
+                [None] + anomaly_index.user_keys.tolist(),
+                format_func=lambda x: "Tous les utilisateurs" if x is None else f"Utilisateur {x}"
+            )
+    start_date = end_date = None
+    date_bounds = anomaly_index.date_bounds
+    if date_bounds is not None:
+        with col2:
+            date_range = st.date_input(
+                "Période",
+                value=date_bounds,
+                min_value=date_bounds[0],
+                max_value=date_bounds[1]
+            )
+        if len(date_range) == 2:
+            start_date, end_date = date_range
+    
+    # Filtrer les anomalies via l'index trié par score
+    filtered_anomalies = anomaly_index.query(
+        min_score=min_score,
+        max_items=max_items,
+        user_id=selected_user,
+        start_date=start_date,
+        end_date=end_date
+    )
     
     # Afficher le tableau des anomalies
     st.write("#### Anomalies Détectées")
     st.dataframe(
         filtered_anomalies[[
-            'date', 'heure', 'total_calories', 'total_lipids',
+            'date', time_column(filtered_anomalies), 'total_calories', 'total_lipids',
             'total_carbs', 'total_protein', 'anomaly_score'
         ]].style.background_gradient(subset=['anomaly_score'], cmap='Reds'),
         use_container_width=True
@@ -238,12 +267,12 @@ def display_anomaly_details(results):
         size='total_calories',
         color='anomaly_score',
         hover_data=[
-            'date', 'heure', 'total_lipids', 'total_carbs', 'total_protein'
+            'date', time_column(filtered_anomalies), 'total_lipids', 'total_carbs', 'total_protein'
         ],
         title="Distribution des anomalies par calories et score"
     )
     
-    st.plotly_chart(fig, use_container_width=True)
+    spans.plotly_chart(fig, use_container_width=True)
 
 def main():
     st.title("🔍 Détection d'Anomalies Alimentaires")
@@ -262,7 +291,7 @@ def main():
     
     try:
         # Charger les résultats
-        results = load_all_ai_results()
+        results = load_anomaly_results()
         
         if results is not None:
             # Afficher les métriques principales
@@ -277,6 +306,9 @@ def main():
             # Afficher les détails des anomalies
             display_anomaly_details(results)
             
+            # Afficher les anomalies du scoreur en continu
+            display_recent_anomalies()
+            
         else:
             st.error("Impossible de charger les données. Assurez-vous que le modèle de détection d'anomalies a été entraîné et que les résultats sont disponibles.")
             
@@ -286,3 +318,5 @@ def main():
 
 if __name__ == "__main__":
     main()
+    refresh.render_indicator()
+    spans.finish_rerun()
@@ -10,20 +10,66 @@ import os
 # Ajouter le chemin racine au PYTHONPATH
 sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
 from AWS.s3.connect_s3 import S3Manager
+import recommender.store as rec_store
+from loading import refresh
+from loading.cache import cached
+from loading.datasets import load_cf_engine
+from monitoring import spans
 
+spans.start_rerun(__file__)
+
+@spans.timed("load_recommendations")
+@cached("cf_recommendations")
 def load_recommendations():
-    """Charge les recommandations depuis S3"""
+    """Charge le fichier monolithique des recommandations (si le stockage par utilisateur n'est pas publié)"""
     s3_manager = S3Manager()
     try:
         response = s3_manager.s3_client.get_object(
             Bucket=s3_manager.bucket_name,
-            Key='AI/recommender/collaborative_filtering/results/recommendations.json'
+            Key=rec_store.MONOLITHIC_KEY
         )
+        spans.add_bytes(response['ContentLength'])
         return json.loads(response['Body'].read().decode('utf-8'))
     except Exception as e:
         st.error(f"Erreur lors du chargement des recommandations: {str(e)}")
         return None
 
+@spans.timed("load_user_ids")
+@cached("cf_user_ids", sources=[rec_store.USER_INDEX_KEY, rec_store.MONOLITHIC_KEY])
+def load_user_ids():
+    """Charge la liste des utilisateurs ayant des recommandations"""
+    try:
+        user_ids = rec_store.load_user_ids(S3Manager())
+    except Exception as e:
+        st.error(f"Erreur lors du chargement des utilisateurs: {str(e)}")
+        return None
+    if user_ids is None:
+        recommendations = load_recommendations()
+        if recommendations is None:
+            return None
+        user_ids = sorted(int(uid) for uid in recommendations['user_user_cf'].keys())
+    return user_ids
+
+@spans.timed("load_user_recommendations")
+@cached("cf_user_recommendations", sources=lambda user_id: [rec_store.user_shard_key(user_id), rec_store.MONOLITHIC_KEY])
+def load_user_recommendations(user_id):
+    """Charge uniquement les trois listes de recommandations d'un utilisateur"""
+    try:
+        user_recs = rec_store.load_user_recommendations(S3Manager(), user_id)
+    except Exception as e:
+        st.error(f"Erreur lors du chargement des recommandations: {str(e)}")
+        return None
+    if user_recs is None:
+        recommendations = load_recommendations()
+        if recommendations is None:
+            return None
+        user_recs = {
+            model_type: recommendations.get(model_type, {}).get(str(user_id), [])
+            for model_type in rec_store.MODEL_TYPES
+        }
+    return user_recs
+
+@spans.timed("load_stats")
 def load_stats():
     """Charge les statistiques depuis S3"""
     s3_manager = S3Manager()
@@ -32,18 +78,19 @@ def load_stats():
             Bucket=s3_manager.bucket_name,
             Key='AI/recommender/collaborative_filtering/results/stats.json'
         )
+        spans.add_bytes(response['ContentLength'])
         return json.loads(response['Body'].read().decode('utf-8'))
     except Exception as e:
         st.error(f"Erreur lors du chargement des statistiques: {str(e)}")
         return None
 
-def plot_recommendations(recommendations, user_id, model_type):
+@spans.timed("chart: recommendations")
+def plot_recommendations(user_recs, model_type):
     """Crée un graphique des recommandations pour un utilisateur"""
-    if str(user_id) not in recommendations[model_type]:
+    if not user_recs.get(model_type):
         return None
         
-    user_recs = recommendations[model_type][str(user_id)]
-    df = pd.DataFrame(user_recs)
+    df = pd.DataFrame(user_recs[model_type])
     
     fig = px.bar(
         df,
@@ -126,10 +173,10 @@ def main():
         """)
     
     # Charger les données
-    recommendations = load_recommendations()
+    user_ids = load_user_ids()
     stats = load_stats()
     
-    if recommendations is None or stats is None:
+    if user_ids is None or stats is None:
         st.error("Impossible de charger les données. Veuillez réessayer plus tard.")
         return
         
@@ -185,7 +232,15 @@ def main():
     
     # Sélection de l'utilisateur
     st.header("🎯 Recommandations Personnalisées")
-    user_ids = sorted([int(uid) for uid in recommendations['user_user_cf'].keys()])
+    live = st.checkbox(
+        "⚡ Calculer les recommandations en direct",
+        help="Calcule les recommandations à la demande, y compris pour les nouveaux utilisateurs"
+    )
+    engine = load_cf_engine() if live else None
+    if engine is not None:
+        user_ids = sorted(engine.user_ids)
+    elif live:
+        st.warning("Calcul en direct indisponible, affichage des recommandations précalculées.")
     selected_user = st.selectbox(
         "Sélectionnez un utilisateur",
         user_ids,
@@ -193,43 +248,48 @@ def main():
     )
     
     # Afficher les recommandations
-    if selected_user:
+    if engine is not None:
+        with spans.span("cf.recommend"):
+            user_recs = engine.recommend(selected_user)
+    else:
+        user_recs = load_user_recommendations(selected_user) if selected_user is not None else None
+    if user_recs:
         tabs = st.tabs(["👥 User-User CF", "🔄 Item-Item CF", "🤝 Hybride"])
         
         with tabs[0]:
-            fig = plot_recommendations(recommendations, selected_user, 'user_user_cf')
+            fig = plot_recommendations(user_recs, 'user_user_cf')
             if fig:
-                st.plotly_chart(fig, use_container_width=True)
+                spans.plotly_chart(fig, use_container_width=True)
                 
                 # Afficher le tableau détaillé
                 st.subheader("Détails des recommandations")
-                recs_df = pd.DataFrame(recommendations['user_user_cf'][str(selected_user)])
+                recs_df = pd.DataFrame(user_recs['user_user_cf'])
                 st.dataframe(
                     recs_df.style.format({'score': '{:.3f}'}),
                     hide_index=True
                 )
                 
         with tabs[1]:
-            fig = plot_recommendations(recommendations, selected_user, 'item_item_cf')
+            fig = plot_recommendations(user_recs, 'item_item_cf')
             if fig:
-                st.plotly_chart(fig, use_container_width=True)
+                spans.plotly_chart(fig, use_container_width=True)
                 
                 # Afficher le tableau détaillé
                 st.subheader("Détails des recommandations")
-                recs_df = pd.DataFrame(recommendations['item_item_cf'][str(selected_user)])
+                recs_df = pd.DataFrame(user_recs['item_item_cf'])
                 st.dataframe(
                     recs_df.style.format({'score': '{:.3f}'}),
                     hide_index=True
                 )
                 
         with tabs[2]:
-            fig = plot_recommendations(recommendations, selected_user, 'hybrid')
+            fig = plot_recommendations(user_recs, 'hybrid')
             if fig:
-                st.plotly_chart(fig, use_container_width=True)
+                spans.plotly_chart(fig, use_container_width=True)
                 
                 # Afficher le tableau détaillé
                 st.subheader("Détails des recommandations")
-                recs_df = pd.DataFrame(recommendations['hybrid'][str(selected_user)])
+                recs_df = pd.DataFrame(user_recs['hybrid'])
                 st.dataframe(
                     recs_df.style.format({'score': '{:.3f}'}),
                     hide_index=True
@@ -242,3 +302,5 @@ def main():
 
 if __name__ == "__main__":
     main()
+    refresh.render_indicator()
+    spans.finish_rerun()
@@ -3,19 +3,20 @@ Page Streamlit pour le recommandeur basé sur le contenu
 """
 import streamlit as st
 import pandas as pd
-import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 import json
 import os
 import sys
 from datetime import datetime
-import tempfile
 
 # Ajouter le chemin racine au PYTHONPATH
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
 from AWS.s3.connect_s3 import S3Manager
+from loading import refresh
+from loading.datasets import FOOD_KEY, USER_PREFERENCES_KEY, load_content_based_data, load_content_engine
+from monitoring import spans
 
 # Configuration de la page
 st.set_page_config(
@@ -23,7 +24,9 @@ st.set_page_config(
     page_icon="📊",
     layout="wide"
 )
+spans.start_rerun(__file__)
 
+@spans.timed("load_model_stats")
 def load_model_stats():
     """Charge les statistiques du modèle depuis S3"""
     try:
@@ -32,11 +35,13 @@ def load_model_stats():
             Bucket=s3_manager.bucket_name,
             Key='AI/recommender/content_based/results/stats.json'
         )
+        spans.add_bytes(response['ContentLength'])
         return json.loads(response['Body'].read().decode('utf-8'))
     except Exception as e:
         st.error(f"Erreur lors du chargement des statistiques : {str(e)}")
         return None
 
+@spans.timed("load_example_recommendations")
 def load_example_recommendations():
     """Charge les recommandations d'exemple depuis S3"""
     try:
@@ -45,55 +50,56 @@ def load_example_recommendations():
             Bucket=s3_manager.bucket_name,
             Key='AI/recommender/content_based/results/recommendations.json'
         )
+        spans.add_bytes(response['ContentLength'])
         return json.loads(response['Body'].read().decode('utf-8'))
     except Exception as e:
         st.error(f"Erreur lors du chargement des recommandations : {str(e)}")
         return None
 
-# Fonction pour nettoyer les colonnes numériques
-def clean_numeric_column(df, column):
-    """Nettoie une colonne numérique en gérant les formats particuliers"""
-    def clean_value(x):
-        if pd.isna(x):
-            return np.nan
-        if isinstance(x, (int, float)):
-            return float(x)
-        # Convertir en string et nettoyer
-        x = str(x).replace(' ', '')
-        # Gérer le format avec deux points (1.082.4 -> 1082.4)
-        if x.count('.') > 1:
-            x = x.replace('.', '', x.count('.')-1)
-        try:
-            return float(x)
-        except:
-            return np.nan
+@spans.timed("section: interactive recommendations")
+def display_interactive_recommendations(user_preferences):
+    """Affiche les recommandations calculées à la demande pour un aliment ou un utilisateur"""
+    engine = load_content_engine()
+    if engine is None:
+        st.warning("Le moteur de recommandation n'est pas disponible.")
+        return
     
-    df[column] = df[column].apply(clean_value)
-    return df
-
-# Fonction pour charger les données depuis S3
-@st.cache_data
-def load_data_from_s3(file_path):
-    """Charge un fichier depuis S3 et retourne un DataFrame"""
-    s3 = S3Manager()
-    temp_file = tempfile.NamedTemporaryFile(suffix=os.path.basename(file_path))
-    try:
-        s3.download_file(file_path, temp_file.name)
-        df = pd.read_excel(temp_file.name)
-        temp_file.close()
-        
-        # Nettoyer les colonnes numériques si c'est le fichier food_processed
-        if "food_processed.xlsx" in file_path:
-            numeric_cols = ['Valeur calorique', 'Lipides', 'Glucides', 'Protein', 'Fibre alimentaire', 'Sucre', 'Sodium']
-            for col in numeric_cols:
-                if col in df.columns:
-                    df = clean_numeric_column(df, col)
-        
-        return df
-    except Exception as e:
-        st.error(f"Erreur lors du chargement du fichier {file_path}: {str(e)}")
-        return None
+    mode = st.radio(
+        "Rechercher à partir de",
+        ["Un aliment", "Un utilisateur"],
+        horizontal=True
+    )
+    k = st.slider("Nombre de recommandations", 1, 50, 10)
+    
+    if mode == "Un aliment":
+        food_names = dict(zip(engine.foods['id'], engine.foods['Aliment']))
+        food_id = st.selectbox(
+            "Sélectionner un aliment",
+            list(food_names),
+            format_func=lambda x: food_names[x]
+        )
+        recs = engine.similar_foods(food_id, k=k)
+    else:
+        if user_preferences is None:
+            st.info("Les préférences utilisateur ne sont pas disponibles.")
+            return
+        user_id = st.selectbox(
+            "Sélectionner un utilisateur",
+            sorted(user_preferences['user_id'].unique()),
+            format_func=lambda x: f"Utilisateur {x}",
+            key="interactive_user"
+        )
+        prefs = user_preferences[user_preferences['user_id'] == user_id]
+        profile = engine.type_profile(dict(zip(prefs['Type'], prefs['proportion_total_calories'])))
+        recs = engine.recommend(profile, k=k)
+    
+    recs['Similarité'] = recs['similarity'].apply(lambda x: f"{x:.2%}")
+    st.dataframe(
+        recs[['Aliment', 'Type', 'Similarité']],
+        use_container_width=True
+    )
 
+@spans.timed("chart: feature distributions")
 def plot_feature_distributions(food_features):
     """Crée des visualisations des distributions des caractéristiques"""
     numeric_cols = ['Valeur calorique', 'Lipides', 'Glucides', 'Protein', 'Fibre alimentaire', 'Sucre', 'Sodium']
@@ -119,6 +125,7 @@ def plot_feature_distributions(food_features):
     
     return fig
 
+@spans.timed("chart: food type distribution")
 def plot_food_type_distribution(food_features):
     """Crée un graphique de la distribution des types d'aliments"""
     type_counts = food_features['Type'].value_counts()
@@ -132,6 +139,7 @@ def plot_food_type_distribution(food_features):
     fig.update_layout(height=500)
     return fig
 
+@spans.timed("chart: feature correlations")
 def plot_feature_correlations(food_features):
     """Crée une heatmap des corrélations entre caractéristiques"""
     # Sélectionner uniquement les nutriments principaux
@@ -157,8 +165,8 @@ def main():
     st.title("📊 Recommandeur Basé sur le Contenu")
 
     # Charger les données depuis S3
-    food_features = load_data_from_s3("reference_data/food/food_processed.xlsx")
-    user_preferences = load_data_from_s3("transform/folder_4_windows_function/type_food/user_food_proportion_pandas.xlsx")
+    food_features = load_content_based_data(FOOD_KEY)
+    user_preferences = load_content_based_data(USER_PREFERENCES_KEY)
     
     if food_features is None:
         st.error("Impossible de charger les données des aliments depuis S3")
@@ -257,19 +265,19 @@ def main():
         ])
         
         with tab1:
-            st.plotly_chart(
+            spans.plotly_chart(
                 plot_feature_distributions(food_features),
                 use_container_width=True
             )
             
         with tab2:
-            st.plotly_chart(
+            spans.plotly_chart(
                 plot_food_type_distribution(food_features),
                 use_container_width=True
             )
             
         with tab3:
-            st.plotly_chart(
+            spans.plotly_chart(
                 plot_feature_correlations(food_features),
                 use_container_width=True
             )
@@ -301,6 +309,10 @@ def main():
             else:
                 st.info("Pas de recommandations disponibles pour cet utilisateur")
     
+    # Recommandations calculées à la demande
+    st.header("Recommandations Interactives")
+    display_interactive_recommendations(user_preferences)
+    
     # Section technique
     st.header("Détails Techniques")
     
@@ -338,3 +350,5 @@ def main():
 
 if __name__ == "__main__":
     main()
+    refresh.render_indicator()
+    spans.finish_rerun()
@@ -0,0 +1,136 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
+from analytics.micronutrients import MINERALS, VITAMINS, cluster_intake, user_day_intake
+from analytics.nutrient_matrix import FOOD_KEY, MATRIX_PREFIX
+from loading import refresh
+from loading.cache import cached
+from loading.datasets import MEALS_KEY, load_micronutrient_meals, load_micronutrient_user_clusters, load_nutrient_matrix
+from monitoring import spans
+
+st.set_page_config(page_title="Micronutrient Analysis", page_icon="🧪", layout="wide")
+spans.start_rerun(__file__)
+
+# Apports par utilisateur-jour, calculés une seule fois par période et
+# recalculés quand les repas ou la matrice des nutriments sont republiés
+@spans.timed("compute_intake")
+@cached("micronutrient_intake", sources=[MEALS_KEY, f"{MATRIX_PREFIX}/meta.json", FOOD_KEY])
+def compute_intake(start_date, end_date):
+    return user_day_intake(load_micronutrient_meals(), load_nutrient_matrix(), start_date, end_date)
+
+st.title("🧪 Analyse des Micronutriments")
+
+st.markdown("""
+Cette page présente les apports en vitamines et minéraux, calculés à partir des repas de chaque
+utilisateur et de la composition nutritionnelle des aliments.
+""")
+
+# Chargement des données
+meals = load_micronutrient_meals()
+matrix = load_nutrient_matrix()
+
+if meals is not None and matrix is not None:
+    # Sélection des micronutriments
+    families = {"Vitamines": VITAMINS, "Minéraux": MINERALS}
+    family = st.radio("Choisir la famille", list(families.keys()), horizontal=True)
+    available = [n for n in families[family] if n in matrix.nutrients]
+    units = dict(zip(matrix.nutrients, matrix.units))
+    
+    selected_nutrients = st.multiselect(
+        "Choisir les micronutriments à analyser",
+        available,
+        default=available[:4]
+    )
+    
+    # Période d'analyse
+    date_range = st.date_input(
+        "Sélectionner une période",
+        value=(meals["date"].min().date(), meals["date"].max().date()),
+        min_value=meals["date"].min().date(),
+        max_value=meals["date"].max().date()
+    )
+    
+    if selected_nutrients and len(date_range) == 2:
+        start_date, end_date = date_range
+        intake = compute_intake(start_date, end_date)
+        labels = {n: f"{n} ({units[n]})" for n in selected_nutrients}
+        
+        tab_user, tab_cluster = st.tabs(["👤 Par utilisateur", "🎯 Par cluster"])
+        
+        with tab_user:
+            users = sorted(intake["user_id"].unique())
+            selected_user = st.selectbox(
+                "Sélectionner un utilisateur",
+                users,
+                help="Choisissez un utilisateur pour voir ses apports"
+            )
+            with spans.span("filter: user"):
+                df_user = intake[intake["user_id"] == selected_user].sort_values("date")
+            
+            for nutrient in selected_nutrients:
+                with spans.span(f"chart: {nutrient}"):
+                    fig = go.Figure()
+                    fig.add_trace(go.Scatter(
+                        x=df_user["date"],
+                        y=df_user[nutrient],
+                        mode="lines+markers",
+                        name=nutrient,
+                        line=dict(width=2),
+                        marker=dict(size=6)
+                    ))
+                    fig.update_layout(
+                        title=f"Apport quotidien en {nutrient}",
+                        xaxis_title="Date",
+                        yaxis_title=labels[nutrient],
+                        showlegend=False,
+                        height=350
+                    )
+                    spans.plotly_chart(fig, use_container_width=True)
+            
+            st.subheader("Statistiques journalières")
+            user_stats = df_user[selected_nutrients].describe().round(2)
+            user_stats.index = ['Nombre', 'Moyenne', 'Écart-type', 'Min', '25%', '50%', '75%', 'Max']
+            user_stats.columns = [labels[n] for n in selected_nutrients]
+            st.dataframe(user_stats, use_container_width=True)
+        
+        with tab_cluster:
+            user_clusters = load_micronutrient_user_clusters()
+            if user_clusters is None:
+                st.warning("Les clusters d'utilisateurs ne sont pas disponibles.")
+            else:
+                with spans.span("chart: cluster intake"):
+                    cluster_means = cluster_intake(intake, user_clusters)[selected_nutrients]
+                    df_plot = cluster_means.reset_index().melt(
+                        id_vars="cluster", var_name="Micronutriment", value_name="Apport moyen"
+                    )
+                    fig_bar = px.bar(
+                        df_plot,
+                        x="Micronutriment",
+                        y="Apport moyen",
+                        color=df_plot["cluster"].astype(str),
+                        barmode="group",
+                        title="Apport quotidien moyen par cluster",
+                        labels={"color": "Cluster"}
+                    )
+                    spans.plotly_chart(fig_bar, use_container_width=True)
+                
+                display_df = cluster_means.round(2)
+                display_df.columns = [labels[n] for n in selected_nutrients]
+                st.dataframe(display_df, use_container_width=True)
+        
+        # Données brutes
+        with st.expander("Voir les données brutes"):
+            st.dataframe(
+                intake[["user_id", "date"] + selected_nutrients],
+                use_container_width=True
+            )
+else:
+    st.error("Impossible de charger les données. Veuillez vérifier que toutes les données nécessaires sont disponibles.")
+
+refresh.render_indicator()
+spans.finish_rerun()
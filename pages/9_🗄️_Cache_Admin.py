@@ -0,0 +1,155 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+import hmac
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
+from loading.arrow_store import get_store
+from loading.cache import POLICIES, get_manager
+from monitoring import spans
+
+st.set_page_config(page_title="Cache Admin", page_icon="🗄️", layout="wide")
+spans.start_rerun(__file__)
+
+# Les réglages agissent sur toutes les sessions et tous les processus : ils sont
+# réservés aux détenteurs du jeton CACHE_ADMIN_TOKEN (page en lecture seule sinon)
+ADMIN_TOKEN = os.getenv('CACHE_ADMIN_TOKEN')
+ADMIN_KEY = "_cache_admin"
+
+
+def is_admin():
+    """Vérifie le jeton d'administration saisi dans la barre latérale"""
+    if not ADMIN_TOKEN:
+        return False
+    if st.session_state.get(ADMIN_KEY):
+        return True
+    token = st.sidebar.text_input("🔑 Jeton d'administration", type="password")
+    if token and hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        st.session_state[ADMIN_KEY] = True
+        return True
+    if token:
+        st.sidebar.error("Jeton invalide.")
+    return False
+
+
+st.title("🗄️ Administration du Cache")
+
+st.markdown("""
+Les jeux de données et les modèles chargés par les pages sont conservés dans un cache commun à toutes
+les sessions, limité par un budget mémoire. Lorsque le budget est dépassé, les entrées les moins utiles
+sont évincées.
+""")
+
+admin = is_admin()
+manager = get_manager()
+stats = manager.stats()
+
+# Indicateurs globaux
+col1, col2, col3, col4, col5, col6 = st.columns(6)
+col1.metric("Mémoire utilisée", f"{stats['used_bytes'] / 2**20:.1f} Mo")
+col2.metric("Budget", f"{stats['budget_bytes'] / 2**20:.0f} Mo")
+col3.metric("Entrées", stats['entries'])
+col4.metric("Taux de succès", f"{stats['hit_ratio']:.1%}" if stats['hit_ratio'] is not None else "—")
+col5.metric("Évictions", stats['evictions'], help=f"{stats['evicted_bytes'] / 2**20:.1f} Mo évincés")
+col6.metric("Requêtes fusionnées", stats['coalesced'],
+            help=f"Chargements en cours : {len(manager.in_flight())}. Un chargement déjà en cours "
+                 "d'un jeu de données est partagé au lieu d'être relancé.")
+st.progress(min(stats['used_bytes'] / stats['budget_bytes'], 1.0) if stats['budget_bytes'] else 0.0)
+
+# Contenu du cache
+st.subheader("Contenu")
+entries = pd.DataFrame(manager.entries())
+
+if entries.empty:
+    st.info("Le cache est vide.")
+else:
+    entries = entries.sort_values('size_bytes', ascending=False)
+    display_df = pd.DataFrame({
+        "Jeu de données": entries['name'],
+        "Type": entries['resource'].map({True: "Modèle", False: "Données"}),
+        "Arguments": entries['args'],
+        "Taille (Mo)": (entries['size_bytes'] / 2**20).round(2),
+        "Hits": entries['hits'],
+        "Âge (s)": entries['age_seconds'],
+        "Inactif depuis (s)": entries['idle_seconds'],
+        "Chargement (s)": entries['load_seconds'],
+        "TTL (s)": entries['ttl_seconds']
+    })
+    st.dataframe(display_df, hide_index=True, use_container_width=True)
+
+    with spans.span("chart: cache sizes"):
+        sizes = entries.groupby('name', as_index=False)['size_bytes'].sum()
+        sizes['size_mb'] = sizes['size_bytes'] / 2**20
+        fig = px.bar(
+            sizes.sort_values('size_mb', ascending=False),
+            x='name',
+            y='size_mb',
+            title="Mémoire par jeu de données",
+            labels={'name': "Jeu de données", 'size_mb': "Taille (Mo)"}
+        )
+        spans.plotly_chart(fig, use_container_width=True)
+
+# Réglages
+st.subheader("Réglages")
+if not admin:
+    st.info("Page en lecture seule : les réglages sont réservés aux administrateurs "
+            "(jeton CACHE_ADMIN_TOKEN à saisir dans la barre latérale).")
+else:
+    col1, col2 = st.columns(2)
+
+    with col1:
+        policy = st.selectbox(
+            "Politique d'éviction",
+            list(POLICIES),
+            index=list(POLICIES).index(stats['policy']),
+            format_func=lambda p: {"lru": "LRU (moins récemment utilisé)", "cost": "Coût (temps de rechargement par octet)"}[p]
+        )
+        budget_mb = st.number_input(
+            "Budget mémoire (Mo)",
+            min_value=1,
+            value=int(stats['budget_bytes'] / 2**20),
+            step=64
+        )
+        if st.button("Appliquer"):
+            manager.resize(int(budget_mb * 2**20), policy)
+            st.rerun()
+
+    with col2:
+        names = sorted(entries['name'].unique()) if not entries.empty else []
+        to_clear = st.multiselect("Jeux de données à vider", names)
+        if st.button("Vider la sélection", disabled=not to_clear):
+            for name in to_clear:
+                manager.invalidate(name)
+            st.rerun()
+        if st.button("Vider tout le cache"):
+            manager.invalidate()
+            st.rerun()
+
+# Fichiers Arrow partagés entre les processus Streamlit
+store = get_store()
+if store is not None:
+    st.subheader("Partage entre processus")
+    st.markdown(f"""
+    Les jeux de données marqués comme partagés sont écrits une fois au format Arrow dans `{store.root}`,
+    puis projetés en mémoire par chaque processus : leurs pages sont communes à tous les processus.
+    """)
+    files = pd.DataFrame(store.entries())
+    if files.empty:
+        st.info("Aucun jeu de données partagé.")
+    else:
+        st.dataframe(pd.DataFrame({
+            "Jeu de données": files['name'],
+            "Clé": files['key'],
+            "Version": files['version'],
+            "Taille (Mo)": (files['size_bytes'] / 2**20).round(2),
+            "Lignes": files['rows'],
+            "Âge (s)": files['age_seconds']
+        }), hide_index=True, use_container_width=True)
+        if admin and st.button("Supprimer les fichiers partagés"):
+            store.invalidate()
+            manager.invalidate()
+            st.rerun()
+
+spans.finish_rerun()
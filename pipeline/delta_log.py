@@ -0,0 +1,411 @@
+"""
+Append-only delta log for meal records stored in S3.
+
+Layout under the table prefix:
+    _manifest/v0000000042.json   one immutable manifest per version
+    deltas/<uuid>.parquet        one small file per ingestion batch
+    base/<uuid>.parquet          large sorted files written by compaction
+
+A manifest lists the live files of its version; a reader picks the latest
+manifest and reads exactly those files, so it always sees a consistent
+snapshot. Manifests are created with a conditional put, so concurrent
+writers and the compaction job never overwrite each other's commits.
+
+Usage:
+    python -m pipeline.delta_log compact
+    python -m pipeline.delta_log compact --loop --interval 300
+"""
+import argparse
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+import duckdb
+import numpy as np
+import pandas as pd
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger("pipeline.delta_log")
+
+MEAL_RECORDS_PREFIX = "tables/meal_records"
+SORT_KEYS = ['date', 'user_id', 'meal_id']
+CACHE_DIR = os.path.join("cache", "delta_log")
+
+# Fichiers de base d'environ 4 M lignes, groupes de lignes de 256 k
+TARGET_FILE_ROWS = 4_000_000
+ROW_GROUP_ROWS = 256_000
+MIN_DELTAS_TO_COMPACT = 8
+RETAINED_VERSIONS = 10
+VACUUM_GRACE = timedelta(hours=1)
+
+
+class ConcurrentCommitError(Exception):
+    """Raised when another writer committed the manifest version first."""
+
+
+def _encode_bound(value):
+    """
+    Return the JSON form of a sort-key bound and its type.
+
+    Dates and timestamps are stored in ISO format and numbers as numbers,
+    so that bounds compare by value rather than as strings.
+    """
+    if value is None:
+        return None, None
+    if isinstance(value, (date, np.datetime64)):
+        return pd.Timestamp(value).isoformat(), 'timestamp'
+    if isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_)):
+        return (value.item() if isinstance(value, np.generic) else value), 'number'
+    return str(value), 'string'
+
+
+def _decode_bound(value, key_type):
+    """
+    Return a comparable form of a stored bound or of a query bound.
+
+    Args:
+        value: Bound as stored in a manifest, or start/end passed by a reader.
+        key_type (str): 'timestamp', 'number' or 'string'. None for entries
+            written before the type was recorded, whose bounds are strings
+            and are parsed as a number or a timestamp when possible.
+    """
+    if value is None:
+        return None
+    if key_type == 'timestamp':
+        return pd.Timestamp(value)
+    if key_type == 'number':
+        return float(value)
+    if key_type is None:
+        for parse in (float, pd.Timestamp):
+            try:
+                return parse(value)
+            except (TypeError, ValueError):
+                continue
+    return str(value)
+
+
+def _bounds(entry):
+    """Comparable (min, max) of a manifest file entry."""
+    key_type = entry.get('key_type')
+    return _decode_bound(entry['min'], key_type), _decode_bound(entry['max'], key_type)
+
+
+def _overlaps(entry, start, end):
+    """Whether a file entry may hold sort-key values between start and end."""
+    key_type = entry.get('key_type')
+    low, high = _bounds(entry)
+    if start is not None and high < _decode_bound(start, key_type):
+        return False
+    if end is not None and low > _decode_bound(end, key_type):
+        return False
+    return True
+
+
+class DeltaLog:
+    """Versioned table of base and delta Parquet files listed by S3 manifests."""
+
+    def __init__(self, s3, prefix=MEAL_RECORDS_PREFIX, sort_keys=SORT_KEYS, cache_dir=CACHE_DIR):
+        """
+        Args:
+            s3 (S3Manager): Connected S3 manager.
+            prefix (str): S3 prefix of the table.
+            sort_keys (list): Columns compacted files are sorted by. The first
+                one is tracked as min/max in the manifest for pruning.
+            cache_dir (str): Local cache of data files. Data files are never
+                modified once written, so cached copies never go stale.
+        """
+        self.s3 = s3
+        self.prefix = prefix.rstrip('/')
+        self.sort_keys = list(sort_keys)
+        self.cache_dir = cache_dir
+
+    def _manifest_key(self, version):
+        return f"{self.prefix}/_manifest/v{version:010d}.json"
+
+    def _versions(self):
+        """Map every committed version to its manifest key, from one listing."""
+        return {
+            int(os.path.basename(key)[1:-5]): key
+            for key in self.s3.list_files(f"{self.prefix}/_manifest/")
+            if key.endswith('.json')
+        }
+
+    def latest_version(self):
+        """
+        Return the latest committed version, -1 for an empty table.
+        """
+        return max(self._versions(), default=-1)
+
+    def manifest(self, version=None):
+        """
+        Load a manifest.
+
+        Args:
+            version (int, optional): Version to read, the latest by default.
+
+        Returns:
+            dict: 'version', 'base' and 'deltas' (lists of file entries with
+                'key', 'rows', 'bytes', 'min', 'max' and 'key_type').
+        """
+        if version is None:
+            version = self.latest_version()
+        if version < 0:
+            return {'version': -1, 'base': [], 'deltas': []}
+        response = self.s3.s3_client.get_object(Bucket=self.s3.bucket_name, Key=self._manifest_key(version))
+        return json.loads(response['Body'].read())
+
+    def _commit(self, manifest):
+        """Write the next manifest version, failing if it already exists."""
+        body = json.dumps(manifest, ensure_ascii=False, default=str).encode('utf-8')
+        try:
+            self.s3.s3_client.put_object(
+                Bucket=self.s3.bucket_name,
+                Key=self._manifest_key(manifest['version']),
+                Body=body,
+                ContentType='application/json',
+                IfNoneMatch='*'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                raise ConcurrentCommitError(f"Version {manifest['version']} already committed")
+            raise
+
+    def _write_file(self, con, query, key, row_group_rows=ROW_GROUP_ROWS):
+        """Write a query result as Parquet to the local cache, upload it and describe it."""
+        path = self._local(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        con.execute(
+            f"COPY ({query}) TO '{path}' "
+            f"(FORMAT PARQUET, COMPRESSION ZSTD, ROW_GROUP_SIZE {row_group_rows})"
+        )
+        if not self.s3.upload_file(path, key):
+            raise RuntimeError(f"Could not upload {key}")
+        first = self.sort_keys[0]
+        rows, low, high = con.execute(
+            f"SELECT COUNT(*), MIN({first}), MAX({first}) FROM read_parquet('{path}')"
+        ).fetchone()
+        (low, key_type), (high, _) = _encode_bound(low), _encode_bound(high)
+        return {'key': key, 'rows': rows, 'bytes': os.path.getsize(path),
+                'min': low, 'max': high, 'key_type': key_type}
+
+    def append(self, records, max_retries=5):
+        """
+        Add a batch of records as a new delta file.
+
+        Only the small delta file and a manifest are written; no existing
+        file is rewritten.
+
+        Args:
+            records (pd.DataFrame): Records to append.
+            max_retries (int): Commit attempts when other writers race.
+
+        Returns:
+            int: The committed version.
+        """
+        con = duckdb.connect()
+        con.register('records', records)
+        entry = self._write_file(con, "SELECT * FROM records", f"{self.prefix}/deltas/{uuid.uuid4().hex}.parquet")
+        for _ in range(max_retries):
+            manifest = self.manifest()
+            manifest['version'] += 1
+            manifest['deltas'] = manifest['deltas'] + [entry]
+            manifest['created_at'] = datetime.now().isoformat()
+            try:
+                self._commit(manifest)
+                return manifest['version']
+            except ConcurrentCommitError:
+                continue
+        raise ConcurrentCommitError(f"Could not commit {entry['key']} after {max_retries} attempts")
+
+    def _local(self, key):
+        return os.path.join(self.cache_dir, *key.split('/'))
+
+    def _fetch(self, key):
+        path = self._local(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Téléchargement dans un fichier temporaire puis renommage atomique
+            partial = f"{path}.{uuid.uuid4().hex}.part"
+            if not self.s3.download_file(key, partial):
+                raise RuntimeError(f"Could not download {key}")
+            os.replace(partial, path)
+        return path
+
+    def snapshot_files(self, version=None, start=None, end=None):
+        """
+        List the local paths of the files of a snapshot, downloading them if needed.
+
+        Args:
+            version (int, optional): Snapshot version, the latest by default.
+            start (optional): Skip files whose sort-key maximum is lower. Dates
+                may be given as ISO strings.
+            end (optional): Skip files whose sort-key minimum is higher.
+
+        Returns:
+            list: Local Parquet paths.
+        """
+        manifest = self.manifest(version)
+        entries = [
+            entry for entry in manifest['base'] + manifest['deltas']
+            if entry['rows'] and _overlaps(entry, start, end)
+        ]
+        return [self._fetch(entry['key']) for entry in entries]
+
+    def read(self, version=None, columns=None, start=None, end=None):
+        """
+        Read a consistent snapshot of base plus deltas.
+
+        Args:
+            version (int, optional): Snapshot version, the latest by default.
+            columns (list, optional): Columns to read, all by default.
+            start (str, optional): Lower bound on the first sort key.
+            end (str, optional): Upper bound on the first sort key.
+
+        Returns:
+            pd.DataFrame: The records of the snapshot.
+        """
+        files = self.snapshot_files(version, start, end)
+        if not files:
+            return pd.DataFrame(columns=columns)
+        first = self.sort_keys[0]
+        conditions = []
+        if start is not None:
+            conditions.append(f"{first} >= $start")
+        if end is not None:
+            conditions.append(f"{first} <= $end")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        select = ", ".join(columns) if columns else "*"
+        params = {name: value for name, value in (('start', start), ('end', end)) if value is not None}
+        return duckdb.connect().execute(
+            f"SELECT {select} FROM read_parquet($files, union_by_name = true) {where}",
+            {'files': files, **params}
+        ).df()
+
+    def compact(self, min_deltas=MIN_DELTAS_TO_COMPACT, target_file_rows=TARGET_FILE_ROWS,
+                row_group_rows=ROW_GROUP_ROWS):
+        """
+        Merge the deltas of the latest snapshot into sorted base files.
+
+        Base files whose key range overlaps the deltas are rewritten together
+        with them; the others are kept as they are. Deltas appended while the
+        compaction runs stay live in the committed manifest.
+
+        Args:
+            min_deltas (int): Do nothing below this number of deltas.
+            target_file_rows (int): Rows per compacted file.
+            row_group_rows (int): Rows per Parquet row group.
+
+        Returns:
+            int or None: The committed version, None if nothing was compacted.
+        """
+        manifest = self.manifest()
+        deltas = manifest['deltas']
+        if len(deltas) < min_deltas:
+            return None
+
+        ranges = [_bounds(entry) for entry in deltas if entry['rows']]
+        rewritten = []
+        if ranges:
+            low = min(bound for bound, _ in ranges)
+            high = max(bound for _, bound in ranges)
+            rewritten = [
+                entry for entry in manifest['base']
+                if entry['rows'] and not (_bounds(entry)[1] < low or _bounds(entry)[0] > high)
+            ]
+        kept = [entry for entry in manifest['base'] if entry not in rewritten]
+
+        con = duckdb.connect()
+        files = [self._fetch(entry['key']) for entry in rewritten + deltas if entry['rows']]
+        con.execute(
+            "CREATE TEMP TABLE merged AS SELECT * FROM read_parquet($files, union_by_name = true) "
+            f"ORDER BY {', '.join(self.sort_keys)}",
+            {'files': files}
+        )
+        total = con.execute("SELECT COUNT(*) FROM merged").fetchone()[0]
+        compacted = [
+            self._write_file(
+                con,
+                f"SELECT * FROM merged LIMIT {target_file_rows} OFFSET {offset}",
+                f"{self.prefix}/base/{uuid.uuid4().hex}.parquet",
+                row_group_rows
+            )
+            for offset in range(0, total, target_file_rows)
+        ]
+
+        merged_keys = {entry['key'] for entry in deltas}
+        while True:
+            latest = self.manifest()
+            if any(entry not in latest['base'] for entry in rewritten + kept):
+                raise ConcurrentCommitError("Base files changed during compaction")
+            latest['version'] += 1
+            latest['base'] = sorted(kept + compacted, key=lambda entry: (entry['rows'] > 0, _bounds(entry)[0]))
+            latest['deltas'] = [entry for entry in latest['deltas'] if entry['key'] not in merged_keys]
+            latest['created_at'] = datetime.now().isoformat()
+            try:
+                self._commit(latest)
+                break
+            except ConcurrentCommitError:
+                continue
+        logger.info(
+            f"Compacted {len(deltas)} deltas and {len(rewritten)} base files "
+            f"into {len(compacted)} files ({total} rows), version {latest['version']}"
+        )
+        self.vacuum()
+        return latest['version']
+
+    def vacuum(self, retained_versions=RETAINED_VERSIONS, grace=VACUUM_GRACE):
+        """
+        Delete data files and manifests no longer referenced by recent versions.
+
+        Files stay readable for the last retained_versions manifests so that
+        readers holding an older snapshot can finish. Unreferenced files newer
+        than the grace period are kept: they may belong to an append that has
+        not committed its manifest yet.
+
+        Args:
+            retained_versions (int): Number of latest manifests kept.
+            grace (timedelta): Minimum age of a deleted data file.
+        """
+        versions = self._versions()
+        latest = max(versions, default=-1)
+        oldest = max(latest - retained_versions + 1, 0)
+        live = set()
+        for version in range(oldest, latest + 1):
+            manifest = self.manifest(version)
+            live.update(entry['key'] for entry in manifest['base'] + manifest['deltas'])
+
+        cutoff = datetime.now(timezone.utc) - grace
+        paginator = self.s3.s3_client.get_paginator('list_objects_v2')
+        for folder in ('base', 'deltas'):
+            for page in paginator.paginate(Bucket=self.s3.bucket_name, Prefix=f"{self.prefix}/{folder}/"):
+                for obj in page.get('Contents', []):
+                    if obj['Key'] not in live and obj['LastModified'] < cutoff:
+                        self.s3.delete_file(obj['Key'])
+        for version, key in versions.items():
+            if version < oldest:
+                self.s3.delete_file(key)
+
+
+if __name__ == "__main__":
+    from AWS.s3.connect_s3 import S3Manager
+
+    parser = argparse.ArgumentParser(description="Meal records delta log")
+    parser.add_argument('command', choices=['compact', 'vacuum'])
+    parser.add_argument('--loop', action='store_true', help="Compact periodically in the background")
+    parser.add_argument('--interval', type=float, default=300.0)
+    parser.add_argument('--min-deltas', type=int, default=MIN_DELTAS_TO_COMPACT)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    log = DeltaLog(S3Manager())
+    while True:
+        if args.command == 'compact':
+            log.compact(args.min_deltas)
+        else:
+            log.vacuum()
+        if not args.loop:
+            break
+        time.sleep(args.interval)
@@ -0,0 +1,443 @@
+"""
+Incremental, date-partitioned runner for the folder_1 ... folder_6 transform stages.
+
+Raw meal records are expected as one or more Parquet files per day under
+raw/meal_records/date=YYYY-MM-DD/. Every stage writes one Parquet partition
+per day under transform/partitioned/<dataset>/date=YYYY-MM-DD/part.parquet,
+and a watermark records which raw files have been processed. The watermark
+also numbers the runs and keeps, per day, the run which last rewrote its
+partitions, so downstream jobs (analytics.clustering) can read only the days
+changed since their previous run.
+
+Usage:
+    python -m pipeline.incremental
+    python -m pipeline.incremental --full
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+from datetime import date, timedelta
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from analytics.meal_nutrients import add_macro_totals
+from analytics.nutrient_matrix import FOOD_KEY, clean_numeric, compile_nutrient_matrix
+from pipeline.parquet_layout import ENGINES, LAYOUTS, write_optimized
+
+logger = logging.getLogger("pipeline.incremental")
+
+RAW_PREFIX = "raw/meal_records"
+PARTITIONS_PREFIX = "transform/partitioned"
+WATERMARK_KEY = f"{PARTITIONS_PREFIX}/_watermark.json"
+USER_TYPE_TOTALS_KEY = f"{PARTITIONS_PREFIX}/user_type_totals.parquet"
+EXPORT_PREFIX = "transform/folder_6_parquet"
+WORK_DIR = os.path.join("cache", "pipeline")
+
+# Fenêtre glissante de 7 jours et écart maximal pris en compte par la variation
+ROLLING_DAYS = 7
+DEFAULT_LOOKBACK_DAYS = 30
+MAX_QUANTITY = 2000
+
+TOTAL_COLUMNS = ['total_calories', 'total_lipids', 'total_carbs', 'total_protein']
+FOOD_COLUMNS = {
+    'total_calories': 'Valeur calorique',
+    'total_lipids': 'Lipides',
+    'total_carbs': 'Glucides',
+    'total_protein': 'Protein'
+}
+
+# Jeux de données partitionnés par jour, dans l'ordre des étapes
+STAGES = [
+    'combined_meal_data',           # folder_1
+    'combined_meal_data_filtered',  # folder_2
+    'daily_totals',                 # folder_3
+    'user_daily_totals',
+    'user_type_daily_totals',
+    'daily_percentage_change',      # folders 4 and 5
+    'user_daily_percentage_change'
+]
+
+# Fichiers lus par les pages, reconstruits à partir des partitions (motifs de
+# pipeline.parquet_layout, qui donnent aussi l'ordre de tri de chaque fichier).
+# Chaque fichier est publié pour les deux sources proposées par les pages 1 à 3.
+EXPORTS = {
+    'daily_percentage_change':
+        "folder_5_percentage_change_filtered/daily_percentage_change_{engine}.parquet",
+    'user_daily_percentage_change':
+        "folder_5_percentage_change_filtered/user_daily_percentage_change_{engine}.parquet",
+    'user_food_proportion':
+        "folder_4_windows_function_filtered/user_food_proportion_{engine}.parquet"
+}
+EXPORT_ENGINE = 'duckdb'
+
+
+def export_key(dataset, engine=EXPORT_ENGINE):
+    """S3 key of the file read by the pages for an exported dataset and source."""
+    return f"{EXPORT_PREFIX}/{EXPORTS[dataset].format(engine=engine)}"
+
+
+_DATE_PATTERN = re.compile(r"date=(\d{4}-\d{2}-\d{2})/")
+
+
+def partition_key(dataset, day):
+    """S3 key of one daily partition of a dataset."""
+    return f"{PARTITIONS_PREFIX}/{dataset}/date={day}/part.parquet"
+
+
+def _sum_columns(prefix=''):
+    return ", ".join(f"SUM({prefix}{column}) AS {column}" for column in TOTAL_COLUMNS)
+
+
+def _window_columns(partition):
+    """Rolling averages over 7 calendar days and change since the previous active day."""
+    over = f"PARTITION BY {partition} ORDER BY date" if partition else "ORDER BY date"
+    rolling = ", ".join(
+        f"AVG({column}) OVER rolling AS rolling_avg_{column}" for column in TOTAL_COLUMNS
+    )
+    change = ", ".join(
+        f"CASE WHEN date - LAG(date) OVER ordered <= $lookback "
+        f"THEN ({column} - LAG({column}) OVER ordered) * 100.0 / NULLIF(LAG({column}) OVER ordered, 0) "
+        f"END AS percentage_change_{column}"
+        for column in TOTAL_COLUMNS
+    )
+    windows = (
+        f"WINDOW rolling AS ({over} RANGE BETWEEN INTERVAL {ROLLING_DAYS - 1} DAYS PRECEDING AND CURRENT ROW), "
+        f"ordered AS ({over})"
+    )
+    return rolling, change, windows
+
+
+class IncrementalPipeline:
+    """
+    Runs the transform stages with DuckDB over the days that changed.
+
+    A run processes the raw files not yet listed in the watermark. Stages 1-3
+    only read those days. The window stages re-read the daily aggregates of
+    the lookback window before the earliest changed day and rewrite the days
+    from it onwards, so late data also refreshes the later rolling values.
+    Per-user food-type proportions come from running (user, Type) totals that
+    each run corrects by the contributions of the days it replaces.
+    """
+
+    def __init__(self, s3, work_dir=WORK_DIR, lookback_days=DEFAULT_LOOKBACK_DAYS):
+        """
+        Args:
+            s3 (S3Manager): Connected S3 manager.
+            work_dir (str): Local mirror of the partitions.
+            lookback_days (int): Days read before the first changed day. Also
+                the largest gap over which a percentage change is computed.
+        """
+        if lookback_days < ROLLING_DAYS - 1:
+            raise ValueError(f"lookback_days must be at least {ROLLING_DAYS - 1}")
+        self.s3 = s3
+        self.work_dir = work_dir
+        self.lookback_days = lookback_days
+        self.con = duckdb.connect()
+
+    def _local(self, key):
+        return os.path.join(self.work_dir, *key.split('/'))
+
+    def _fetch(self, key):
+        """
+        Download a key into the local mirror unless the mirrored copy is current.
+
+        The ETag of every mirrored object is kept next to it, so a copy
+        rewritten by another run or machine is downloaded again.
+        """
+        path = self._local(key)
+        version = self.s3.object_version(key)
+        if version is None:
+            raise RuntimeError(f"Could not find {key}")
+        if not os.path.exists(path) or self._mirrored_etag(path) != version['etag']:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if not self.s3.download_file(key, path):
+                raise RuntimeError(f"Could not download {key}")
+            self._record_etag(path, version['etag'])
+        return path
+
+    @staticmethod
+    def _mirrored_etag(path):
+        try:
+            with open(path + '.etag', 'r', encoding='utf-8') as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    @staticmethod
+    def _record_etag(path, etag):
+        with open(path + '.etag', 'w', encoding='utf-8') as f:
+            f.write(etag)
+
+    def _publish(self, path, key):
+        if not self.s3.upload_with_overwrite(path, key):
+            raise RuntimeError(f"Could not upload {key}")
+        # Le fichier local est désormais la version publiée
+        version = self.s3.object_version(key)
+        if version is not None:
+            self._record_etag(path, version['etag'])
+
+    def _read_watermark(self):
+        if self.s3.file_exists(WATERMARK_KEY):
+            with open(self._fetch(WATERMARK_KEY), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {'watermark': None, 'dates': [], 'raw_files': []}
+
+    def _partitions(self, dataset, days):
+        return [self._fetch(partition_key(dataset, day)) for day in days]
+
+    def _write_partitions(self, dataset, query, days, params=None):
+        """Write one partition per day from a query with a 'date' column."""
+        self.con.execute(f"CREATE OR REPLACE TEMP TABLE stage AS {query}", params or {})
+        for day in days:
+            key = partition_key(dataset, day)
+            path = self._local(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.con.execute(
+                f"COPY (SELECT * FROM stage WHERE date = DATE '{day}' ORDER BY ALL) "
+                f"TO '{path}' (FORMAT PARQUET, COMPRESSION ZSTD)"
+            )
+            self._publish(path, key)
+
+    def _load_food(self):
+        catalog = pd.read_excel(self._fetch(FOOD_KEY))
+        self.matrix = compile_nutrient_matrix(catalog)
+        self.food_names = catalog['Aliment'].to_numpy()
+        food = catalog[['id', 'Aliment', 'Type', 'quantitee'] + list(FOOD_COLUMNS.values())].copy()
+        for column in ['quantitee'] + list(FOOD_COLUMNS.values()):
+            food[column] = clean_numeric(food[column])
+        self.con.register('food', food)
+
+    def run(self, full=False):
+        """
+        Process the raw files added since the last run.
+
+        Args:
+            full (bool): Ignore the watermark and rebuild every day.
+
+        Returns:
+            dict: The new watermark.
+        """
+        previous = self._read_watermark()
+        # Le numéro d'exécution continue après une reconstruction complète
+        run_number = previous.get('run', 0) + 1
+        state = {'watermark': None, 'dates': [], 'raw_files': []} if full else previous
+        raw_files = [key for key in self.s3.list_files(RAW_PREFIX + "/") if key.endswith('.parquet')]
+        processed = set(state['raw_files'])
+        changed_days = sorted({
+            _DATE_PATTERN.search(key).group(1)
+            for key in raw_files if key not in processed and _DATE_PATTERN.search(key)
+        })
+        if not changed_days:
+            logger.info("Nothing to process")
+            return state
+
+        known_days = set(state['dates'])
+        replaced_days = [day for day in changed_days if day in known_days]
+        all_days = sorted(known_days | set(changed_days))
+        logger.info(f"Processing {len(changed_days)} days ({len(replaced_days)} already processed)")
+
+        # Étapes 1 à 3 : uniquement les jours modifiés
+        day_files = [self._fetch(key) for key in raw_files if _DATE_PATTERN.search(key)
+                     and _DATE_PATTERN.search(key).group(1) in changed_days]
+        self._load_food()
+        self.con.execute(
+            "CREATE OR REPLACE TEMP TABLE raw AS "
+            "SELECT * EXCLUDE (date), CAST(date AS DATE) AS date "
+            "FROM read_parquet($files, union_by_name = true, hive_partitioning = false)",
+            {'files': day_files}
+        )
+        self._combine(changed_days)
+        self._write_partitions('combined_meal_data_filtered', f"""
+            SELECT *, CASE WHEN quantity > {MAX_QUANTITY} THEN 'excessive' ELSE 'normal' END AS quantity_status
+            FROM stage WHERE quantity > 0 AND total_calories IS NOT NULL
+        """, changed_days)
+        self.con.execute("CREATE OR REPLACE TEMP TABLE filtered AS SELECT * FROM stage")
+
+        self._write_partitions('daily_totals', f"""
+            SELECT date, {_sum_columns()}, COUNT(DISTINCT user_id) AS distinct_user_count
+            FROM filtered GROUP BY date
+        """, changed_days)
+        self._write_partitions('user_daily_totals', f"""
+            SELECT date, user_id, {_sum_columns()} FROM filtered GROUP BY date, user_id
+        """, changed_days)
+
+        # Totaux cumulés (utilisateur, Type) : retirer l'ancienne contribution des jours remplacés
+        # (lues avant que les partitions ne soient réécrites)
+        replaced = None
+        if replaced_days:
+            replaced = self.con.execute(
+                "SELECT user_id, Type, " + ", ".join(TOTAL_COLUMNS) + " FROM read_parquet($files)",
+                {'files': self._partitions('user_type_daily_totals', replaced_days)}
+            ).df()
+        self._write_partitions('user_type_daily_totals', f"""
+            SELECT m.date, m.user_id, f.Type, {_sum_columns('m.')}
+            FROM filtered m JOIN food f ON m.aliment_id = f.id
+            GROUP BY m.date, m.user_id, f.Type
+        """, changed_days)
+        self._update_proportions(replaced, full or state['watermark'] is None)
+
+        # Étapes 4 et 5 : fenêtre de rétrospection avant le premier jour modifié
+        first_day = date.fromisoformat(changed_days[0])
+        context_start = (first_day - timedelta(days=self.lookback_days)).isoformat()
+        context_days = [day for day in all_days if day >= context_start]
+        rewritten_days = [day for day in all_days if day >= changed_days[0]]
+        params = {'lookback': self.lookback_days, 'first_day': first_day}
+
+        rolling, change, windows = _window_columns(None)
+        self._write_partitions('daily_percentage_change', f"""
+            SELECT * FROM (
+                SELECT date, {', '.join(TOTAL_COLUMNS)}, distinct_user_count, dayname(date) AS weekday,
+                       {rolling}, {change}
+                FROM read_parquet({self._partitions('daily_totals', context_days)!r})
+                {windows}
+            ) WHERE date >= $first_day
+        """, rewritten_days, params)
+
+        rolling, change, windows = _window_columns('user_id')
+        self._write_partitions('user_daily_percentage_change', f"""
+            SELECT * FROM (
+                SELECT date, user_id, {', '.join(TOTAL_COLUMNS)},
+                       RANK() OVER (PARTITION BY date ORDER BY total_calories DESC) AS rank,
+                       {rolling}, {change}
+                FROM read_parquet({self._partitions('user_daily_totals', context_days)!r})
+                {windows}
+            ) WHERE date >= $first_day
+        """, rewritten_days, params)
+
+        self._export(all_days, rewritten_days, full or state['watermark'] is None)
+
+        state = {
+            'watermark': all_days[-1],
+            'dates': all_days,
+            'run': run_number,
+            'day_runs': {**state.get('day_runs', {}), **{day: run_number for day in changed_days}},
+            'raw_files': sorted(processed | set(raw_files))
+        }
+        path = self._local(WATERMARK_KEY)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        # Le watermark est écrit en dernier : une exécution interrompue sera rejouée
+        self._publish(path, WATERMARK_KEY)
+        return state
+
+    def _combine(self, days):
+        """
+        Stage 1: nutrient totals of the raw meal records of the changed days.
+
+        The totals come from the vectorized engine of analytics.meal_nutrients
+        on the compiled nutrient matrix rather than from a join against the
+        food table. Records whose food is not in the catalog are dropped.
+        """
+        records = self.con.execute(
+            "SELECT meal_record_id, user_id, meal_id, date, heure, aliment_id, quantity FROM raw"
+        ).df()
+        rows = self.matrix.rows(records['aliment_id'].to_numpy())
+        known = rows >= 0
+        records = records[known].reset_index(drop=True)
+        rows = rows[known]
+        records['Aliment'] = self.food_names[rows]
+        nutrients = list(FOOD_COLUMNS.values())
+        values = self.matrix.values[np.ix_(rows, self.matrix.columns(nutrients))]
+        for column, nutrient in enumerate(nutrients):
+            records[nutrient] = values[:, column]
+        add_macro_totals(records, self.matrix)
+        # NaN -> NULL, comme le produisait la jointure SQL (filtre de l'étape 2)
+        for column in nutrients + TOTAL_COLUMNS:
+            records[column] = records[column].astype(np.float64).astype('Float64')
+        self.con.register('records', records)
+        self._write_partitions('combined_meal_data', f"""
+            SELECT meal_record_id, user_id, meal_id, CAST(date AS DATE) AS date, heure, aliment_id, quantity,
+                   Aliment, {', '.join(f'"{nutrient}"' for nutrient in nutrients)}, {', '.join(FOOD_COLUMNS)}
+            FROM records
+        """, days)
+        self.con.unregister('records')
+
+    def _update_proportions(self, replaced, rebuild):
+        path = self._local(USER_TYPE_TOTALS_KEY)
+        sources = ["SELECT user_id, Type, " + ", ".join(TOTAL_COLUMNS) + " FROM stage"]
+        if not rebuild:
+            sources.append(f"SELECT * FROM read_parquet('{self._fetch(USER_TYPE_TOTALS_KEY)}')")
+            if replaced is not None:
+                self.con.register('replaced', replaced)
+                negated = ", ".join(f"-{column} AS {column}" for column in TOTAL_COLUMNS)
+                sources.append(f"SELECT user_id, Type, {negated} FROM replaced")
+        self.con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE user_type_totals AS
+            SELECT user_id, Type, {_sum_columns()}
+            FROM ({' UNION ALL '.join(sources)})
+            GROUP BY user_id, Type
+        """)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.con.execute(f"COPY (SELECT * FROM user_type_totals ORDER BY ALL) TO '{path}' (FORMAT PARQUET)")
+        self._publish(path, USER_TYPE_TOTALS_KEY)
+
+    def _export(self, days, rewritten_days, rebuild):
+        """
+        Update the single Parquet files read by the pages, in every flavour.
+
+        The dated exports keep their published rows before the first
+        rewritten day and append the rewritten partitions, so a run only
+        reads the days it changed. They are rebuilt from every partition on
+        a full run or when no previous export exists. Every file is written
+        with the sorted, row-group-sized layout of pipeline.parquet_layout.
+
+        Args:
+            days (list): Every processed day.
+            rewritten_days (list): Days whose partitions this run rewrote.
+            rebuild (bool): Rebuild the dated exports from every partition.
+        """
+        proportions = ", ".join(
+            f"{column} / NULLIF(SUM({column}) OVER (PARTITION BY user_id), 0) AS proportion_{column}"
+            for column in ['total_calories', 'total_lipids', 'total_protein', 'total_carbs']
+        )
+        queries = {
+            'daily_percentage_change': self._dated_export('daily_percentage_change', days, rewritten_days, rebuild),
+            'user_daily_percentage_change': self._dated_export('user_daily_percentage_change', days,
+                                                               rewritten_days, rebuild),
+            'user_food_proportion':
+                f"SELECT user_id, Type, total_calories, total_lipids, total_protein, total_carbs, {proportions} "
+                "FROM user_type_totals"
+        }
+        for dataset, query in queries.items():
+            key = export_key(dataset)
+            path = self._local(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            table = self.con.execute(
+                query, {'first_day': date.fromisoformat(rewritten_days[0])} if '$first_day' in query else {}
+            ).fetch_arrow_table()
+            # Fichier temporaire : la requête peut lire l'export précédent
+            write_optimized(table, f"{path}.part", LAYOUTS[EXPORTS[dataset]]['sort_by'])
+            os.replace(f"{path}.part", path)
+            self._publish(path, key)
+            for engine in ENGINES:
+                if engine != EXPORT_ENGINE:
+                    # Copie locale distincte : chaque fichier du miroir garde son ETag
+                    copy = self._local(export_key(dataset, engine))
+                    shutil.copyfile(path, copy)
+                    self._publish(copy, export_key(dataset, engine))
+
+    def _dated_export(self, dataset, days, rewritten_days, rebuild):
+        """Query of a dated export: previous rows before the rewritten days plus their partitions."""
+        key = export_key(dataset)
+        if rebuild or not self.s3.file_exists(key):
+            return f"SELECT * FROM read_parquet({self._partitions(dataset, days)!r})"
+        return (
+            f"SELECT * FROM read_parquet('{self._fetch(key)}') WHERE date < $first_day "
+            f"UNION ALL BY NAME SELECT * FROM read_parquet({self._partitions(dataset, rewritten_days)!r})"
+        )
+
+
+if __name__ == "__main__":
+    from AWS.s3.connect_s3 import S3Manager
+
+    parser = argparse.ArgumentParser(description="Incremental transform pipeline")
+    parser.add_argument('--full', action='store_true', help="Rebuild every day from the raw files")
+    parser.add_argument('--lookback-days', type=int, default=DEFAULT_LOOKBACK_DAYS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    IncrementalPipeline(S3Manager(), lookback_days=args.lookback_days).run(full=args.full)
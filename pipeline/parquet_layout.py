@@ -0,0 +1,287 @@
+"""
+Rewrite the folder_6 Parquet files with a layout suited to the pages' reads.
+
+Each dataset is sorted by its access keys, so row-group min/max statistics
+prune reads by user_id or date; row groups are sized for ranged reads;
+categorical columns are dictionary encoded and pages are compressed with
+zstd. A report compares size, decode time and bytes scanned by typical page
+queries before and after the rewrite.
+
+Usage:
+    python -m pipeline.parquet_layout --dry-run --report layout_report.json
+    python -m pipeline.parquet_layout --bloom
+"""
+import argparse
+import inspect
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+import numpy as np
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+logger = logging.getLogger("pipeline.parquet_layout")
+
+EXPORT_PREFIX = "transform/folder_6_parquet"
+
+# Clés d'accès de chaque jeu de données et requêtes typiques des pages
+LAYOUTS = {
+    "folder_4_windows_function_filtered/user_food_proportion_{engine}.parquet": {
+        'sort_by': ['user_id', 'Type'],
+        'queries': ['user', 'all']
+    },
+    "folder_5_percentage_change_filtered/user_daily_percentage_change_{engine}.parquet": {
+        'sort_by': ['user_id', 'date'],
+        'queries': ['user', 'recent_dates', 'all']
+    },
+    "folder_5_percentage_change_filtered/daily_percentage_change_{engine}.parquet": {
+        'sort_by': ['date'],
+        'queries': ['recent_dates', 'all']
+    }
+}
+ENGINES = ['duckdb', 'pandas']
+
+DICTIONARY_COLUMNS = ['Type', 'Aliment']
+BLOOM_COLUMNS = ['user_id']
+COMPRESSION = 'zstd'
+COMPRESSION_LEVEL = 3
+
+# Groupes de lignes d'environ 4 Mo non compressés, bornés en nombre de lignes
+TARGET_ROW_GROUP_BYTES = 4 * 1024 * 1024
+MIN_ROW_GROUP_ROWS = 8_192
+MAX_ROW_GROUP_ROWS = 1_048_576
+RECENT_DAYS = 30
+
+# Les versions de pyarrow antérieures aux filtres de Bloom n'ont pas cette option
+BLOOM_SUPPORTED = 'bloom_filter_options' in inspect.signature(pq.write_table).parameters
+
+
+def row_group_rows(table, target_bytes=TARGET_ROW_GROUP_BYTES):
+    """
+    Number of rows per row group giving roughly target_bytes of decoded data.
+
+    Args:
+        table (pa.Table): The data to write.
+        target_bytes (int): Target decoded size of a row group.
+
+    Returns:
+        int: Rows per row group.
+    """
+    if table.num_rows == 0:
+        return MIN_ROW_GROUP_ROWS
+    row_bytes = max(table.nbytes / table.num_rows, 1)
+    return int(np.clip(target_bytes // row_bytes, MIN_ROW_GROUP_ROWS, MAX_ROW_GROUP_ROWS))
+
+
+def write_optimized(table, path, sort_by, bloom=False):
+    """
+    Write a table sorted by its access keys with tuned Parquet settings.
+
+    Args:
+        table (pa.Table): The data to write.
+        path (str): Destination file.
+        sort_by (list): Columns to sort by, in order. Missing ones are skipped.
+        bloom (bool): Also write Bloom filters on user_id (needs a pyarrow
+            version supporting bloom_filter_options).
+
+    Returns:
+        dict: The settings used.
+    """
+    sort_by = [column for column in sort_by if column in table.column_names]
+    if sort_by:
+        table = table.take(pc.sort_indices(table, sort_keys=[(column, 'ascending') for column in sort_by]))
+    dictionary = [column for column in DICTIONARY_COLUMNS if column in table.column_names]
+    rows = row_group_rows(table)
+    options = dict(
+        compression=COMPRESSION,
+        compression_level=COMPRESSION_LEVEL,
+        # Dictionnaire partout où il reste compact, garanti pour Type/Aliment
+        use_dictionary=True,
+        write_statistics=True,
+        write_page_index=True,
+        sorting_columns=pq.SortingColumn.from_ordering(table.schema, [(column, 'ascending') for column in sort_by])
+        if sort_by else None
+    )
+    bloom_columns = [column for column in BLOOM_COLUMNS if bloom and column in table.column_names]
+    if bloom_columns and not BLOOM_SUPPORTED:
+        logger.warning("This pyarrow version cannot write Bloom filters, skipping them")
+        bloom_columns = []
+    if bloom_columns:
+        options['bloom_filter_options'] = {
+            column: {'ndv': max(len(pc.unique(table[column])), 1), 'fpp': 0.01} for column in bloom_columns
+        }
+    pq.write_table(table, path, row_group_size=rows, **options)
+    return {'sort_by': sort_by, 'row_group_rows': rows, 'dictionary': dictionary, 'bloom': bloom_columns}
+
+
+def typical_queries(table, names):
+    """
+    Build the filters of the typical page queries for a dataset.
+
+    Args:
+        table (pa.Table): The dataset.
+        names (list): Query names among 'user', 'recent_dates' and 'all'.
+
+    Returns:
+        dict: Maps query names to lists of (column, op, value) filters.
+    """
+    queries = {}
+    if 'user' in names and 'user_id' in table.column_names:
+        users = pc.unique(table['user_id']).sort()
+        queries['user'] = [('user_id', '==', users[len(users) // 2].as_py())]
+    if 'recent_dates' in names and 'date' in table.column_names:
+        last = pc.max(table['date']).as_py()
+        if hasattr(last, 'year'):
+            queries['recent_dates'] = [('date', '>=', last - timedelta(days=RECENT_DAYS))]
+    if 'all' in names:
+        queries['all'] = []
+    return queries
+
+
+def _may_match(statistics, op, value):
+    if statistics is None or not statistics.has_min_max:
+        return True
+    low, high = statistics.min, statistics.max
+    if op == '==':
+        return low <= value <= high
+    if op == '>=':
+        return high >= value
+    if op == '<=':
+        return low <= value
+    return True
+
+
+def scanned_bytes(path, filters):
+    """
+    Compressed bytes a reader pruning on row-group statistics has to read.
+
+    Args:
+        path (str): Parquet file.
+        filters (list): (column, op, value) conjunction.
+
+    Returns:
+        int: Sum of the compressed sizes of the row groups that may match.
+    """
+    metadata = pq.ParquetFile(path).metadata
+    names = [metadata.schema.column(i).name for i in range(metadata.num_columns)]
+    total = 0
+    for index in range(metadata.num_row_groups):
+        group = metadata.row_group(index)
+        if all(
+            _may_match(group.column(names.index(column)).statistics, op, value)
+            for column, op, value in filters if column in names
+        ):
+            total += sum(group.column(i).total_compressed_size for i in range(group.num_columns))
+    return total
+
+
+def describe(path, queries, repeats=3):
+    """
+    Measure a Parquet file: size, row groups, decode time and query cost.
+
+    Args:
+        path (str): Parquet file.
+        queries (dict): Output of typical_queries.
+        repeats (int): Timing repetitions, the best one is kept.
+
+    Returns:
+        dict: 'bytes', 'row_groups', 'decode_seconds' and, per query,
+            'scanned_bytes' and 'seconds'.
+    """
+    def best(function):
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    report = {
+        'bytes': os.path.getsize(path),
+        'row_groups': pq.ParquetFile(path).metadata.num_row_groups,
+        'decode_seconds': round(best(lambda: pq.read_table(path)), 4),
+        'queries': {}
+    }
+    for name, filters in queries.items():
+        report['queries'][name] = {
+            'scanned_bytes': scanned_bytes(path, filters),
+            'seconds': round(best(lambda: pq.read_table(path, filters=filters or None)), 4)
+        }
+    return report
+
+
+def optimize_file(source, destination, layout, bloom=False):
+    """
+    Rewrite one file and compare both layouts.
+
+    Args:
+        source (str): Current Parquet file.
+        destination (str): Rewritten file.
+        layout (dict): Entry of LAYOUTS.
+        bloom (bool): Write Bloom filters on user_id.
+
+    Returns:
+        dict: 'settings', 'before' and 'after' measurements.
+    """
+    table = pq.read_table(source)
+    queries = typical_queries(table, layout['queries'])
+    settings = write_optimized(table, destination, layout['sort_by'], bloom)
+    return {
+        'settings': settings,
+        'before': describe(source, queries),
+        'after': describe(destination, queries)
+    }
+
+
+def optimize_exports(s3, bloom=False, dry_run=False):
+    """
+    Rewrite every folder_6 dataset in place on S3.
+
+    Args:
+        s3 (S3Manager): Connected S3 manager.
+        bloom (bool): Write Bloom filters on user_id.
+        dry_run (bool): Only build the report, do not upload.
+
+    Returns:
+        dict: Report keyed by S3 key.
+    """
+    report = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for pattern, layout in LAYOUTS.items():
+            for engine in ENGINES:
+                key = f"{EXPORT_PREFIX}/{pattern.format(engine=engine)}"
+                source = os.path.join(temp_dir, "source.parquet")
+                destination = os.path.join(temp_dir, "optimized.parquet")
+                if not s3.file_exists(key) or not s3.download_file(key, source):
+                    logger.warning(f"Skipping missing {key}")
+                    continue
+                report[key] = optimize_file(source, destination, layout, bloom)
+                before, after = report[key]['before'], report[key]['after']
+                logger.info(f"{key}: {before['bytes']} -> {after['bytes']} bytes, "
+                            f"{before['row_groups']} -> {after['row_groups']} row groups")
+                if not dry_run and not s3.upload_with_overwrite(destination, key):
+                    raise RuntimeError(f"Could not upload {key}")
+    return report
+
+
+if __name__ == "__main__":
+    from AWS.s3.connect_s3 import S3Manager
+
+    parser = argparse.ArgumentParser(description="Optimize the layout of the folder_6 Parquet files")
+    parser.add_argument('--bloom', action='store_true', help="Write Bloom filters on user_id")
+    parser.add_argument('--dry-run', action='store_true', help="Only report, keep the files unchanged")
+    parser.add_argument('--report', default=None, help="Write the JSON report to this path")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    result = optimize_exports(S3Manager(), args.bloom, args.dry_run)
+    output = json.dumps(result, indent=2, default=str)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
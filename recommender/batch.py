@@ -0,0 +1,276 @@
+"""
+Batch generation of collaborative and content-based recommendations for all users.
+
+Usage:
+    python -m recommender.batch --workers 4 --chunk-size 5000
+
+Users are processed in chunks across a process pool. The engines' read-only
+arrays (ratings, similarities, food feature matrix) are placed once in shared
+memory and attached by every worker without copying. Each chunk is written as
+its own Parquet part and uploaded through S3Manager, followed by a manifest
+with the run statistics.
+
+The collaborative filtering lists of each chunk are also published as the
+per-user shards read by the Collaborative Filtering page (recommender.store);
+the index of the users is uploaded last, once every chunk succeeded, so the
+page switches to the new run in one step.
+"""
+import argparse
+import datetime
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from analytics.nutrient_matrix import FOOD_KEY, clean_numeric
+from recommender.collaborative import CollaborativeFilteringEngine
+from recommender.content_based import NUTRIENT_FEATURES, ContentBasedEngine
+from recommender.store import MODEL_TYPES, SHARDS_PREFIX, publish_sharded_recommendations, publish_user_index
+
+logger = logging.getLogger("recommender.batch")
+
+PROPORTIONS_KEY = "transform/folder_6_parquet/folder_4_windows_function_filtered/user_food_proportion_duckdb.parquet"
+BATCH_PREFIX = "AI/recommender/batch"
+
+# État des processus de travail, initialisé une fois par processus
+_worker = {}
+
+
+def _share_arrays(arrays):
+    """Copy arrays into new shared memory blocks; return the blocks and their specs."""
+    blocks, specs = [], {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+
+def _attach_arrays(specs):
+    """Read-only views on shared memory blocks created by _share_arrays."""
+    blocks, arrays = [], {}
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        blocks.append(block)
+        arrays[name] = array
+    return blocks, arrays
+
+
+def _init_worker(cf_specs, cf_meta, cb_specs, cb_meta, output_dir, upload_prefix, publish_prefix):
+    cf_blocks, cf_arrays = _attach_arrays(cf_specs)
+    _worker['blocks'] = cf_blocks
+    _worker['cf'] = CollaborativeFilteringEngine.from_state(cf_arrays, cf_meta)
+    _worker['cb'] = None
+    if cb_specs is not None:
+        cb_blocks, cb_arrays = _attach_arrays(cb_specs)
+        _worker['blocks'] += cb_blocks
+        _worker['cb'] = ContentBasedEngine.from_state(cb_arrays, cb_meta)
+    _worker['output_dir'] = output_dir
+    _worker['upload_prefix'] = upload_prefix
+    _worker['publish_prefix'] = publish_prefix
+    _worker['s3'] = None
+    if upload_prefix is not None or publish_prefix is not None:
+        from AWS.s3.connect_s3 import S3Manager
+        _worker['s3'] = S3Manager()
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilo-octets sous Linux, octets sous macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _process_chunk(chunk_id, user_ids, k):
+    start = time.perf_counter()
+    cf, cb = _worker['cf'], _worker['cb']
+    records, shards = [], {}
+    for user_id in user_ids:
+        shards[user_id] = cf.recommend(user_id, k=k)
+        for model_type, recs in shards[user_id].items():
+            for rank, rec in enumerate(recs, start=1):
+                records.append((user_id, model_type, rank, rec['type'], rec['type'], None, rec['score']))
+        if cb is not None:
+            foods = cb.recommend(cb.type_profile(cf.user_ratings(user_id)), k=k)
+            for rank, food in enumerate(foods.itertuples(index=False), start=1):
+                records.append((user_id, 'content_based', rank, str(food.id), food.Aliment, food.Type, food.similarity))
+
+    chunk = pd.DataFrame(records, columns=['user_id', 'model', 'rank', 'item', 'name', 'Type', 'score'])
+    file_name = f"part-{chunk_id:05d}.parquet"
+    local_path = os.path.join(_worker['output_dir'], file_name)
+    chunk.to_parquet(local_path, index=False)
+
+    s3_key = None
+    if _worker['s3'] is not None:
+        s3_key = f"{_worker['upload_prefix']}/{file_name}"
+        if not _worker['s3'].upload_with_overwrite(local_path, s3_key):
+            raise RuntimeError(f"Upload of {s3_key} failed")
+        os.remove(local_path)
+    # Index écrit par le processus principal, une fois tous les morceaux publiés
+    if _worker['publish_prefix'] is not None:
+        if not publish_sharded_recommendations(_worker['s3'], shards, _worker['publish_prefix'], index=False):
+            raise RuntimeError(f"Publication of the recommendations of chunk {chunk_id} failed")
+
+    return {
+        'chunk_id': chunk_id,
+        'pid': os.getpid(),
+        'users': len(user_ids),
+        'rows': len(chunk),
+        'seconds': time.perf_counter() - start,
+        'peak_rss_mb': _peak_rss_mb(),
+        'key': s3_key or local_path
+    }
+
+
+def run_batch(proportions, foods=None, workers=None, chunk_size=5000, k=10,
+              output_dir=None, s3=None, upload_prefix=None, publish_prefix=None):
+    """
+    Compute recommendations for every user and write them as chunked Parquet.
+
+    Args:
+        proportions (pd.DataFrame): user_food_proportion data.
+        foods (pd.DataFrame, optional): Food catalog for content-based
+            recommendations, skipped when None.
+        workers (int, optional): Number of worker processes, os.cpu_count() by default.
+        chunk_size (int): Number of users per chunk.
+        k (int): Number of recommendations per user and model.
+        output_dir (str, optional): Local directory of the parts.
+        s3 (S3Manager, optional): Manager used to upload the run manifest.
+        upload_prefix (str, optional): S3 prefix of the parts; parts stay local when None.
+        publish_prefix (str, optional): S3 prefix of the per-user shards served
+            by the Collaborative Filtering page (recommender.store.SHARDS_PREFIX),
+            not published when None.
+
+    Returns:
+        dict: Run statistics (users, seconds, users_per_second, per-worker
+            peak RSS and the list of parts).
+    """
+    start = time.perf_counter()
+    cf = CollaborativeFilteringEngine.from_proportions(proportions)
+    cf_state = cf.export_state()
+    # Chaque utilisateur n'est vu qu'une fois : inutile de garder ses similarités
+    cf_state['meta']['user_cache_size'] = 0
+    cb_state = ContentBasedEngine(foods, index='brute').export_state() if foods is not None else None
+    output_dir = output_dir or tempfile.mkdtemp(prefix="recommendations_")
+    os.makedirs(output_dir, exist_ok=True)
+
+    blocks, cf_specs = _share_arrays(cf_state['arrays'])
+    cb_specs = cb_meta = None
+    if cb_state is not None:
+        cb_blocks, cb_specs = _share_arrays(cb_state['arrays'])
+        blocks += cb_blocks
+        cb_meta = cb_state['meta']
+
+    user_ids = cf.user_ids
+    chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+    parts, peak_rss = [], {}
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(cf_specs, cf_state['meta'], cb_specs, cb_meta, output_dir, upload_prefix, publish_prefix)
+        ) as executor:
+            futures = [executor.submit(_process_chunk, i, chunk, k) for i, chunk in enumerate(chunks)]
+            done_users = 0
+            for future in as_completed(futures):
+                part = future.result()
+                parts.append(part)
+                done_users += part['users']
+                peak_rss[part['pid']] = max(peak_rss.get(part['pid'], 0), part['peak_rss_mb'])
+                elapsed = time.perf_counter() - start
+                logger.info(f"{done_users}/{len(user_ids)} users ({done_users / elapsed:.0f} users/s)")
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        'timestamp': datetime.datetime.now().isoformat(),
+        'users': len(user_ids),
+        'models': MODEL_TYPES + (['content_based'] if foods is not None else []),
+        'seconds': elapsed,
+        'users_per_second': len(user_ids) / elapsed if elapsed > 0 else None,
+        'peak_rss_mb_per_worker': {str(pid): rss for pid, rss in peak_rss.items()},
+        'parts': [part['key'] for part in sorted(parts, key=lambda p: p['chunk_id'])],
+        'published': publish_prefix
+    }
+    if publish_prefix is not None and not publish_user_index(s3, user_ids, publish_prefix):
+        raise RuntimeError(f"Upload of the user index under {publish_prefix} failed")
+    if s3 is not None and upload_prefix is not None:
+        s3.upload_json(stats, f"{upload_prefix}/_manifest.json")
+    return stats
+
+
+def _load_parquet(s3, s3_key):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_file = os.path.join(temp_dir, os.path.basename(s3_key))
+        if not s3.download_file(s3_key, temp_file):
+            raise RuntimeError(f"Download of {s3_key} failed")
+        return pd.read_parquet(temp_file)
+
+
+def _load_foods(path):
+    foods = pd.read_excel(path)
+    for column in NUTRIENT_FEATURES:
+        if column in foods.columns:
+            foods[column] = clean_numeric(foods[column])
+    return foods
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--proportions', help="Local user_food_proportion Parquet file (S3 by default)")
+    parser.add_argument('--foods', help="Local food_processed.xlsx (S3 by default)")
+    parser.add_argument('--no-content-based', action='store_true')
+    parser.add_argument('--output-dir', help="Write the parts locally instead of uploading them")
+    parser.add_argument('--no-publish', action='store_true',
+                        help="Do not publish the per-user shards served by the Collaborative Filtering page")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    s3 = upload_prefix = None
+    publish_prefix = None if args.no_publish else SHARDS_PREFIX
+    if (args.output_dir is None or args.proportions is None or publish_prefix is not None
+            or (args.foods is None and not args.no_content_based)):
+        from AWS.s3.connect_s3 import S3Manager
+        s3 = S3Manager()
+
+    proportions = pd.read_parquet(args.proportions) if args.proportions else _load_parquet(s3, PROPORTIONS_KEY)
+    foods = None
+    if not args.no_content_based:
+        if args.foods:
+            foods = _load_foods(args.foods)
+        else:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                temp_food = os.path.join(temp_dir, os.path.basename(FOOD_KEY))
+                s3.download_file(FOOD_KEY, temp_food)
+                foods = _load_foods(temp_food)
+
+    if args.output_dir is None:
+        upload_prefix = f"{BATCH_PREFIX}/{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+    stats = run_batch(
+        proportions, foods, workers=args.workers, chunk_size=args.chunk_size, k=args.k,
+        output_dir=args.output_dir, s3=s3, upload_prefix=upload_prefix, publish_prefix=publish_prefix
+    )
+    print(f"{stats['users']} users in {stats['seconds']:.1f} s ({stats['users_per_second']:.0f} users/s)")
+    for pid, rss in stats['peak_rss_mb_per_worker'].items():
+        print(f"worker {pid}: peak RSS {rss:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
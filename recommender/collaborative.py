@@ -0,0 +1,338 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from recommender.store import MODEL_TYPES
+
+RATING_SCALE = 5.0
+
+
+class CollaborativeFilteringEngine:
+    """
+    In-process user-user, item-item and hybrid collaborative filtering.
+
+    Preferences are held in a sparse user x food-Type matrix built from the
+    user_food_proportion data. Item-item cosine similarities come from the
+    item Gram matrix R^T R, which is updated incrementally when interactions
+    change; user-user similarities are computed on demand with one sparse
+    matrix-vector product and kept in a small LRU cache.
+    """
+
+    def __init__(self, user_ids, item_names, ratings, n_neighbors=50, user_cache_size=64):
+        """
+        Args:
+            user_ids (array-like): User id of each matrix row.
+            item_names (array-like): Food Type of each matrix column.
+            ratings (scipy.sparse matrix): User x item preference scores.
+            n_neighbors (int): Number of neighbours used by user-user CF.
+            user_cache_size (int): Number of user similarity vectors kept in cache.
+        """
+        self.user_ids = list(user_ids)
+        self.item_names = list(item_names)
+        self._user_rows = {user_id: row for row, user_id in enumerate(self.user_ids)}
+        self._item_cols = {item: col for col, item in enumerate(self.item_names)}
+        self.ratings = sp.csr_matrix(ratings, dtype=np.float32)
+        self.n_neighbors = n_neighbors
+        self.user_cache_size = user_cache_size
+        self._user_similarities = OrderedDict()
+        # L'instance est partagée entre les sessions Streamlit
+        self._lock = threading.RLock()
+
+        self._user_norms = self._row_norms(self.ratings)
+        self._gram = (self.ratings.T @ self.ratings).toarray().astype(np.float64)
+        self._refresh_item_similarities()
+
+    @classmethod
+    def from_proportions(cls, df, value_column='proportion_total_calories', **kwargs):
+        """
+        Build the engine from user_food_proportion data.
+
+        Args:
+            df (pd.DataFrame): Rows with 'user_id', 'Type' and value_column.
+            value_column (str): Proportion used as the implicit preference; it
+                is scaled to the 0-5 rating range used by the offline models.
+            **kwargs: Forwarded to the constructor.
+
+        Returns:
+            CollaborativeFilteringEngine: The engine.
+        """
+        user_codes, user_ids = _factorize(df['user_id'])
+        item_codes, item_names = _factorize(df['Type'])
+        values = df[value_column].to_numpy(dtype=np.float32) * RATING_SCALE
+        # Les doublons (utilisateur, type) sont additionnés par le format COO
+        ratings = sp.coo_matrix(
+            (values, (user_codes, item_codes)),
+            shape=(len(user_ids), len(item_names))
+        )
+        return cls(user_ids, item_names, ratings, **kwargs)
+
+    def export_state(self):
+        """
+        Arrays and metadata needed to rebuild the engine without recomputation.
+
+        Returns:
+            dict: 'arrays' (name -> np.ndarray, suitable for shared memory) and
+                'meta' (small picklable values).
+        """
+        return {
+            'arrays': {
+                'data': self.ratings.data,
+                'indices': self.ratings.indices,
+                'indptr': self.ratings.indptr,
+                'user_norms': self._user_norms,
+                'gram': self._gram,
+                'item_similarities': self.item_similarities
+            },
+            'meta': {
+                'user_ids': self.user_ids,
+                'item_names': self.item_names,
+                'shape': self.ratings.shape,
+                'n_neighbors': self.n_neighbors,
+                'user_cache_size': self.user_cache_size
+            }
+        }
+
+    @classmethod
+    def from_state(cls, arrays, meta):
+        """
+        Rebuild an engine from export_state output, wrapping the arrays without copying.
+
+        Args:
+            arrays (dict): The exported arrays, possibly views on shared memory.
+            meta (dict): The exported metadata.
+
+        Returns:
+            CollaborativeFilteringEngine: The engine.
+        """
+        engine = cls.__new__(cls)
+        engine.user_ids = list(meta['user_ids'])
+        engine.item_names = list(meta['item_names'])
+        engine._user_rows = {user_id: row for row, user_id in enumerate(engine.user_ids)}
+        engine._item_cols = {item: col for col, item in enumerate(engine.item_names)}
+        engine.ratings = sp.csr_matrix(
+            (arrays['data'], arrays['indices'], arrays['indptr']),
+            shape=meta['shape'], copy=False
+        )
+        engine.n_neighbors = meta['n_neighbors']
+        engine.user_cache_size = meta['user_cache_size']
+        engine._user_similarities = OrderedDict()
+        engine._lock = threading.RLock()
+        engine._user_norms = arrays['user_norms']
+        engine._gram = arrays['gram']
+        engine.item_similarities = arrays['item_similarities']
+        return engine
+
+    @staticmethod
+    def _row_norms(matrix):
+        return np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+
+    def _refresh_item_similarities(self):
+        item_norms = np.sqrt(np.clip(np.diag(self._gram), 0, None))
+        denom = np.outer(item_norms, item_norms)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.item_similarities = np.where(denom > 0, self._gram / denom, 0.0)
+        np.fill_diagonal(self.item_similarities, 0.0)
+
+    def user_similarities(self, user_id):
+        """
+        Cosine similarity between one user and every user.
+
+        Args:
+            user_id: The reference user.
+
+        Returns:
+            np.ndarray: float32 similarities, indexed like self.user_ids.
+        """
+        with self._lock:
+            row = self._user_rows[user_id]
+            cached = self._user_similarities.get(row)
+            if cached is not None:
+                self._user_similarities.move_to_end(row)
+                return cached
+
+            dots = np.asarray(self.ratings @ self.ratings[row].T.toarray()).ravel()
+            denom = self._user_norms * self._user_norms[row]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                similarities = np.where(denom > 0, dots / denom, 0.0).astype(np.float32)
+            similarities[row] = 0.0
+
+            self._user_similarities[row] = similarities
+            if len(self._user_similarities) > self.user_cache_size:
+                self._user_similarities.popitem(last=False)
+            return similarities
+
+    def user_ratings(self, user_id):
+        """
+        Current preference scores of one user.
+
+        Args:
+            user_id: The user.
+
+        Returns:
+            dict: {food Type: score} of the Types the user rated, empty for
+                unknown users.
+        """
+        with self._lock:
+            row = self._user_rows.get(user_id)
+            if row is None:
+                return {}
+            ratings = self.ratings[row]
+            return {self.item_names[col]: float(value) for col, value in zip(ratings.indices, ratings.data)}
+
+    def _top_k(self, scores, k):
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top], kind='stable')]
+
+    def _predict_user_user(self, row):
+        similarities = self.user_similarities(self.user_ids[row])
+        neighbors = self._top_k(similarities, self.n_neighbors)
+        weights = similarities[neighbors]
+        neighbor_ratings = self.ratings[neighbors]
+        numerator = np.asarray(neighbor_ratings.T @ weights).ravel()
+        rated = neighbor_ratings.copy()
+        rated.data = np.ones_like(rated.data)
+        denominator = np.asarray(rated.T @ np.abs(weights)).ravel()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(denominator > 0, numerator / denominator, 0.0)
+
+    def _predict_item_item(self, row):
+        user_ratings = self.ratings[row].toarray().ravel()
+        numerator = self.item_similarities @ user_ratings
+        denominator = np.abs(self.item_similarities) @ (user_ratings > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(denominator > 0, numerator / denominator, 0.0)
+
+    def predict(self, user_id, model_type='hybrid'):
+        """
+        Predicted score of every food Type for one user.
+
+        Args:
+            user_id: The user.
+            model_type (str): 'user_user_cf', 'item_item_cf' or 'hybrid'.
+
+        Returns:
+            np.ndarray: Scores indexed like self.item_names.
+        """
+        return self._predictions(self._user_rows[user_id], [model_type])[model_type]
+
+    def _predictions(self, row, model_types):
+        unknown = set(model_types) - set(MODEL_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown model type: {unknown.pop()}")
+        # Le modèle hybride réutilise les deux autres prédictions
+        user_user = item_item = None
+        if 'user_user_cf' in model_types or 'hybrid' in model_types:
+            user_user = self._predict_user_user(row)
+        if 'item_item_cf' in model_types or 'hybrid' in model_types:
+            item_item = self._predict_item_item(row)
+        predictions = {'user_user_cf': user_user, 'item_item_cf': item_item}
+        if 'hybrid' in model_types:
+            predictions['hybrid'] = (user_user + item_item) / 2
+        return predictions
+
+    def recommend(self, user_id, k=10, model_types=MODEL_TYPES):
+        """
+        Top-k food Types for one user, in the recommendations.json format.
+
+        Args:
+            user_id: The user.
+            k (int): Number of recommendations per model.
+            model_types (list): Models to evaluate.
+
+        Returns:
+            dict: {model_type: [{'type': ..., 'score': ...}, ...]}, empty lists
+                for unknown users.
+        """
+        with self._lock:
+            if user_id not in self._user_rows:
+                return {model_type: [] for model_type in model_types}
+            predictions = self._predictions(self._user_rows[user_id], model_types)
+            recommendations = {}
+            for model_type in model_types:
+                scores = predictions[model_type]
+                recommendations[model_type] = [
+                    {'type': self.item_names[col], 'score': float(scores[col])}
+                    for col in self._top_k(scores, k)
+                ]
+            return recommendations
+
+    def update(self, df, value_column='proportion_total_calories', snapshot=False):
+        """
+        Apply new or changed interactions without rebuilding the engine.
+
+        Values replace the current (user, Type) preferences. New users and new
+        food Types are appended. The item Gram matrix is updated with
+        R'^T R' = R^T R + R^T D + D^T R + D^T D, where D is the sparse change,
+        and only the cached user similarity vectors are patched.
+
+        Args:
+            df (pd.DataFrame): Rows with 'user_id', 'Type' and value_column.
+            value_column (str): Proportion used as the implicit preference.
+            snapshot (bool): df holds every interaction (a new version of the
+                proportions file): preferences absent from it are removed.
+        """
+        with self._lock:
+            df = df.drop_duplicates(['user_id', 'Type'], keep='last')
+            for user_id in df['user_id'].unique():
+                if user_id not in self._user_rows:
+                    self._user_rows[user_id] = len(self.user_ids)
+                    self.user_ids.append(user_id)
+            for item in df['Type'].unique():
+                if item not in self._item_cols:
+                    self._item_cols[item] = len(self.item_names)
+                    self.item_names.append(item)
+
+            n_users, n_items = len(self.user_ids), len(self.item_names)
+            old_users, old_items = self.ratings.shape
+            if (n_users, n_items) != (old_users, old_items):
+                self.ratings.resize((n_users, n_items))
+                self._user_norms = np.pad(self._user_norms, (0, n_users - old_users))
+                self._gram = np.pad(self._gram, ((0, n_items - old_items), (0, n_items - old_items)))
+                for row, similarities in self._user_similarities.items():
+                    self._user_similarities[row] = np.pad(similarities, (0, n_users - old_users))
+
+            rows = df['user_id'].map(self._user_rows).to_numpy(dtype=np.int64)
+            cols = df['Type'].map(self._item_cols).to_numpy(dtype=np.int64)
+            values = df[value_column].to_numpy(dtype=np.float32) * RATING_SCALE
+            if snapshot:
+                # Les préférences absentes de la nouvelle version passent à zéro
+                existing = self.ratings.tocoo()
+                removed = ~np.isin(
+                    existing.row.astype(np.int64) * n_items + existing.col,
+                    rows * n_items + cols
+                )
+                rows = np.concatenate([rows, existing.row[removed].astype(np.int64)])
+                cols = np.concatenate([cols, existing.col[removed].astype(np.int64)])
+                values = np.concatenate([values, np.zeros(removed.sum(), dtype=np.float32)])
+            current = np.asarray(self.ratings[rows, cols]).ravel()
+            delta = sp.csr_matrix((values - current, (rows, cols)), shape=(n_users, n_items))
+
+            self._gram += (
+                (self.ratings.T @ delta) + (delta.T @ self.ratings) + (delta.T @ delta)
+            ).toarray()
+            self.ratings = (self.ratings + delta).tocsr()
+            self.ratings.eliminate_zeros()
+            self._refresh_item_similarities()
+
+            changed = np.unique(rows)
+            self._user_norms[changed] = self._row_norms(self.ratings[changed])
+            for row in changed:
+                self._user_similarities.pop(row, None)
+            if self._user_similarities and len(changed):
+                changed_ratings = self.ratings[changed]
+                for row, similarities in self._user_similarities.items():
+                    dots = (changed_ratings @ self.ratings[row].T).toarray().ravel()
+                    denom = self._user_norms[changed] * self._user_norms[row]
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        similarities[changed] = np.where(denom > 0, dots / denom, 0.0)
+
+
+def _factorize(values):
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes, uniques.tolist()
@@ -0,0 +1,232 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+NUTRIENT_FEATURES = ['Valeur calorique', 'Lipides', 'Glucides', 'Protein', 'Fibre alimentaire', 'Sucre', 'Sodium']
+
+# Au-delà de ce nombre de dimensions un KD-tree n'élague plus efficacement
+KD_TREE_MAX_DIMS = 24
+
+
+class RandomProjectionLSH:
+    """
+    Approximate cosine nearest-neighbour index with random hyperplane hashing.
+
+    Each of n_tables tables hashes a vector to the sign pattern of n_bits
+    random projections; candidates are the union of the query's buckets and
+    are re-ranked exactly.
+    """
+
+    def __init__(self, features, n_tables=8, n_bits=12, seed=0):
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((n_tables, features.shape[1], n_bits)).astype(np.float32)
+        self._weights = (1 << np.arange(n_bits)).astype(np.int64)
+        self.tables = []
+        for planes in self.planes:
+            codes = ((features @ planes) > 0) @ self._weights
+            order = np.argsort(codes, kind='stable')
+            sorted_codes = codes[order]
+            self.tables.append((sorted_codes, order))
+
+    def candidates(self, query):
+        found = []
+        for planes, (sorted_codes, order) in zip(self.planes, self.tables):
+            code = ((query @ planes) > 0) @ self._weights
+            lo, hi = np.searchsorted(sorted_codes, [code, code + 1])
+            found.append(order[lo:hi])
+        return np.unique(np.concatenate(found))
+
+
+class ContentBasedEngine:
+    """
+    Top-k similar foods for any food or user profile.
+
+    The food catalog is compiled into a row-normalized float32 feature matrix
+    (standardized nutrients plus a one-hot encoding of the Type), so cosine
+    similarity is a dot product. Large catalogs are served from a KD-tree over
+    the unit vectors (Euclidean and cosine neighbours coincide on the sphere)
+    or, for high-dimensional features, a random-projection LSH index; small
+    catalogs and failed approximate lookups use exact brute force.
+    """
+
+    def __init__(self, food_df, features=NUTRIENT_FEATURES, type_weight=1.0,
+                 index='auto', brute_force_threshold=50_000):
+        """
+        Args:
+            food_df (pd.DataFrame): Catalog with 'id', 'Aliment', 'Type' and the
+                numeric feature columns already cleaned.
+            features (list): Nutrient columns used as features.
+            type_weight (float): Weight of the one-hot Type block, 0 to ignore it.
+            index (str): 'auto', 'brute', 'kdtree' or 'lsh'.
+            brute_force_threshold (int): Catalog size below which 'auto' uses
+                brute force.
+        """
+        self.foods = food_df[['id', 'Aliment', 'Type']].reset_index(drop=True)
+        self._rows = pd.Series(np.arange(len(self.foods)), index=self.foods['id'])
+
+        values = food_df[list(features)].to_numpy(dtype=np.float32)
+        values = np.where(np.isfinite(values), values, np.nanmean(values, axis=0))
+        std = values.std(axis=0)
+        values = (values - values.mean(axis=0)) / np.where(std > 0, std, 1)
+
+        blocks = [values]
+        self.types = None
+        if type_weight and 'Type' in food_df.columns:
+            type_codes, self.types = pd.factorize(food_df['Type'].fillna(''), sort=True)
+            one_hot = np.zeros((len(food_df), len(self.types)), dtype=np.float32)
+            one_hot[np.arange(len(food_df)), type_codes] = type_weight
+            blocks.append(one_hot)
+            self._type_codes = type_codes
+
+        self.matrix = _normalize(np.hstack(blocks).astype(np.float32))
+        self._type_centroids = self._centroids() if self.types is not None else None
+
+        if index == 'auto':
+            if len(self.matrix) < brute_force_threshold:
+                index = 'brute'
+            elif self.matrix.shape[1] <= KD_TREE_MAX_DIMS:
+                index = 'kdtree'
+            else:
+                index = 'lsh'
+        self.index_type = index
+        self._kdtree = cKDTree(self.matrix) if index == 'kdtree' else None
+        self._lsh = RandomProjectionLSH(self.matrix) if index == 'lsh' else None
+        self._lock = threading.Lock()
+
+    def export_state(self):
+        """
+        Arrays and metadata needed to rebuild an exact (brute-force) engine.
+
+        Returns:
+            dict: 'arrays' (name -> np.ndarray, suitable for shared memory) and
+                'meta' (small picklable values).
+        """
+        arrays = {'matrix': self.matrix}
+        if self.types is not None:
+            arrays['type_codes'] = self._type_codes
+            arrays['type_centroids'] = self._type_centroids
+        return {
+            'arrays': arrays,
+            'meta': {'foods': self.foods, 'types': self.types}
+        }
+
+    @classmethod
+    def from_state(cls, arrays, meta):
+        """
+        Rebuild a brute-force engine from export_state output without copying.
+
+        Args:
+            arrays (dict): The exported arrays, possibly views on shared memory.
+            meta (dict): The exported metadata.
+
+        Returns:
+            ContentBasedEngine: The engine.
+        """
+        engine = cls.__new__(cls)
+        engine.foods = meta['foods']
+        engine._rows = pd.Series(np.arange(len(engine.foods)), index=engine.foods['id'])
+        engine.types = meta['types']
+        engine.matrix = arrays['matrix']
+        engine._type_codes = arrays.get('type_codes')
+        engine._type_centroids = arrays.get('type_centroids')
+        engine.index_type = 'brute'
+        engine._kdtree = engine._lsh = None
+        engine._lock = threading.Lock()
+        return engine
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def _centroids(self):
+        counts = np.bincount(self._type_codes, minlength=len(self.types)).astype(np.float32)
+        centroids = np.zeros((len(self.types), self.matrix.shape[1]), dtype=np.float32)
+        np.add.at(centroids, self._type_codes, self.matrix)
+        return centroids / np.where(counts > 0, counts, 1)[:, None]
+
+    def food_vector(self, food_id):
+        """Normalized feature vector of one food."""
+        return self.matrix[self._rows[food_id]]
+
+    def type_profile(self, type_weights):
+        """
+        Build a user profile from the user's food-Type preferences.
+
+        Args:
+            type_weights (dict): Maps a food Type to its weight, e.g. the user's
+                proportion_total_calories per Type.
+
+        Returns:
+            np.ndarray: Normalized profile vector, weighted mean of the Type
+                centroids.
+        """
+        if self.types is None:
+            raise ValueError("Type profiles require the Type features")
+        weights = np.zeros(len(self.types), dtype=np.float32)
+        positions = self.types.get_indexer(list(type_weights.keys()))
+        values = np.fromiter(type_weights.values(), dtype=np.float32, count=len(type_weights))
+        weights[positions[positions >= 0]] = values[positions >= 0]
+        return _normalize(weights @ self._type_centroids)
+
+    def _brute_force(self, query, k, exclude):
+        scores = self.matrix @ query
+        if exclude is not None:
+            scores[exclude] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return top, scores[top]
+
+    def _search(self, query, k, exclude):
+        n_excluded = 0 if exclude is None else len(np.atleast_1d(exclude))
+        if self._kdtree is not None:
+            distances, rows = self._kdtree.query(query, k=min(k + n_excluded, len(self)))
+            rows, distances = np.atleast_1d(rows), np.atleast_1d(distances)
+            # Sur la sphère unité : cos = 1 - d^2 / 2
+            scores = 1 - distances ** 2 / 2
+        elif self._lsh is not None:
+            rows = self._lsh.candidates(query)
+            if len(rows) < k + n_excluded:
+                return self._brute_force(query, k, exclude)
+            scores = self.matrix[rows] @ query
+        else:
+            return self._brute_force(query, k, exclude)
+
+        if exclude is not None:
+            keep = ~np.isin(rows, exclude)
+            rows, scores = rows[keep], scores[keep]
+        order = np.argsort(-scores, kind='stable')[:k]
+        return rows[order], scores[order]
+
+    def recommend(self, query, k=10, exclude_ids=None):
+        """
+        Foods most similar to a profile vector.
+
+        Args:
+            query (np.ndarray): Profile in the engine's feature space (see
+                food_vector and type_profile).
+            k (int): Number of foods returned.
+            exclude_ids (list, optional): Food ids to leave out.
+
+        Returns:
+            pd.DataFrame: 'id', 'Aliment', 'Type' and 'similarity', best first.
+        """
+        query = _normalize(np.asarray(query, dtype=np.float32))
+        exclude = None
+        if exclude_ids is not None and len(exclude_ids):
+            exclude = self._rows.reindex(exclude_ids).dropna().to_numpy(dtype=np.int64)
+        with self._lock:
+            rows, scores = self._search(query, k, exclude)
+        result = self.foods.iloc[rows].reset_index(drop=True)
+        result['similarity'] = scores.astype(np.float64)
+        return result
+
+    def similar_foods(self, food_id, k=10):
+        """The k foods closest to a given food, the food itself excluded."""
+        return self.recommend(self.food_vector(food_id), k=k, exclude_ids=[food_id])
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
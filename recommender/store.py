@@ -0,0 +1,145 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from monitoring.spans import span
+
+logger = logging.getLogger("recommender.store")
+
+RESULTS_PREFIX = "AI/recommender/collaborative_filtering/results"
+MONOLITHIC_KEY = f"{RESULTS_PREFIX}/recommendations.json"
+SHARDS_PREFIX = f"{RESULTS_PREFIX}/users"
+USER_INDEX_KEY = f"{SHARDS_PREFIX}/index.json"
+
+MODEL_TYPES = ['user_user_cf', 'item_item_cf', 'hybrid']
+
+
+def user_shard_key(user_id, prefix=SHARDS_PREFIX):
+    """S3 key of the shard holding one user's recommendations."""
+    return f"{prefix}/{user_id}.json"
+
+
+def shard_recommendations(recommendations):
+    """
+    Regroup a monolithic {model_type: {user_id: [...]}} payload by user.
+
+    Args:
+        recommendations (dict): The content of recommendations.json.
+
+    Returns:
+        dict: Maps each user id (str) to {model_type: list of recommendations}.
+    """
+    shards = {}
+    for model_type in MODEL_TYPES:
+        for user_id, recs in recommendations.get(model_type, {}).items():
+            shards.setdefault(str(user_id), {m: [] for m in MODEL_TYPES})[model_type] = recs
+    return shards
+
+
+def publish_sharded_recommendations(s3, recommendations, prefix=SHARDS_PREFIX, max_workers=16, index=True):
+    """
+    Upload one JSON object per user plus an index of the available user ids.
+
+    The index is written last, so readers never see a user whose shard is not
+    yet uploaded.
+
+    Args:
+        s3 (S3Manager): Connected S3 manager.
+        recommendations (dict): Either a monolithic {model_type: {user_id: [...]}}
+            payload or already sharded {user_id: {model_type: [...]}} data.
+        prefix (str): S3 prefix of the shards.
+        max_workers (int): Number of concurrent uploads.
+        index (bool): Upload the index after the shards. False when the shards
+            are published in several batches (e.g. one per chunk of the batch
+            job): publish_user_index is then called once they are all uploaded.
+
+    Returns:
+        bool: True if every shard and the index were uploaded, False otherwise.
+    """
+    if any(model_type in recommendations for model_type in MODEL_TYPES):
+        shards = shard_recommendations(recommendations)
+    else:
+        shards = {str(user_id): recs for user_id, recs in recommendations.items()}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        uploaded = list(executor.map(
+            lambda item: s3.upload_json(item[1], user_shard_key(item[0], prefix)),
+            shards.items()
+        ))
+    if not all(uploaded):
+        logger.error(f"Failed to upload {uploaded.count(False)} recommendation shards")
+        return False
+    return publish_user_index(s3, shards, prefix) if index else True
+
+
+def publish_user_index(s3, user_ids, prefix=SHARDS_PREFIX):
+    """
+    Upload the index of the users that have a recommendation shard.
+
+    Args:
+        s3 (S3Manager): Connected S3 manager.
+        user_ids (iterable): Ids of the users whose shards are uploaded.
+        prefix (str): S3 prefix of the shards.
+
+    Returns:
+        bool: True if the index was uploaded, False otherwise.
+    """
+    return s3.upload_json({'user_ids': sorted(int(user_id) for user_id in user_ids)}, f"{prefix}/index.json")
+
+
+def _get_json(s3, s3_key):
+    with span("s3.get_object", key=s3_key) as request:
+        response = s3.s3_client.get_object(Bucket=s3.bucket_name, Key=s3_key)
+        body = response['Body'].read()
+        request.add_bytes(len(body))
+    return json.loads(body.decode('utf-8'))
+
+
+def load_user_ids(s3, prefix=SHARDS_PREFIX):
+    """
+    Fetch the list of users that have a recommendation shard.
+
+    Args:
+        s3 (S3Manager): Connected S3 manager.
+        prefix (str): S3 prefix of the shards.
+
+    Returns:
+        list or None: Sorted user ids, None if no sharded store is published.
+    """
+    try:
+        return _get_json(s3, f"{prefix}/index.json")['user_ids']
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+
+
+def load_user_recommendations(s3, user_id, prefix=SHARDS_PREFIX):
+    """
+    Fetch and decode only one user's user_user_cf, item_item_cf and hybrid lists.
+
+    Args:
+        s3 (S3Manager): Connected S3 manager.
+        user_id: The user whose recommendations are requested.
+        prefix (str): S3 prefix of the shards.
+
+    Returns:
+        dict or None: {model_type: list of recommendations}, None if the user
+            has no shard.
+    """
+    try:
+        return _get_json(s3, user_shard_key(user_id, prefix))
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+
+
+if __name__ == "__main__":
+    from AWS.s3.connect_s3 import S3Manager
+
+    # Découpe le fichier monolithique existant en un objet par utilisateur
+    s3_manager = S3Manager()
+    publish_sharded_recommendations(s3_manager, _get_json(s3_manager, MONOLITHIC_KEY))
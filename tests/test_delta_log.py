@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+from AWS.s3.connect_s3 import S3Manager
+from pipeline.delta_log import DeltaLog
+
+
+@pytest.fixture
+def log(tmp_path, monkeypatch):
+    monkeypatch.setenv('S3_LOCAL_ROOT', str(tmp_path / "s3"))
+    return DeltaLog(S3Manager(), cache_dir=str(tmp_path / "cache"))
+
+
+def _records(days, user_id=1):
+    return pd.DataFrame({
+        'date': pd.to_datetime(days),
+        'user_id': user_id,
+        'meal_id': range(len(days))
+    })
+
+
+def test_read_range_ending_on_file_minimum(log):
+    log.append(_records(['2024-01-01', '2024-01-02']))
+    log.append(_records(['2024-01-05', '2024-01-06']))
+
+    result = log.read(start='2024-01-04', end='2024-01-05')
+
+    assert result['date'].tolist() == [pd.Timestamp('2024-01-05')]
+
+
+def test_compaction_keeps_boundary_day(log):
+    log.append(_records(['2024-01-01', '2024-01-05']))
+    log.append(_records(['2024-01-05', '2024-01-09'], user_id=2))
+    log.compact(min_deltas=2)
+
+    result = log.read(start='2024-01-05', end='2024-01-05')
+
+    assert sorted(result['user_id']) == [1, 2]
+
+
+def test_numeric_sort_key_compares_by_value(tmp_path, monkeypatch):
+    monkeypatch.setenv('S3_LOCAL_ROOT', str(tmp_path / "s3"))
+    log = DeltaLog(S3Manager(), sort_keys=['user_id'], cache_dir=str(tmp_path / "cache"))
+    log.append(pd.DataFrame({'user_id': [9, 10]}))
+    log.append(pd.DataFrame({'user_id': [100, 120]}))
+
+    assert len(log.snapshot_files(start=11, end=99)) == 0
+    assert log.read(start=10, end=10)['user_id'].tolist() == [10]
+
+
+def test_vacuum_deletes_old_manifests(log):
+    for day in range(1, 6):
+        log.append(_records([f'2024-01-0{day}']))
+
+    log.vacuum(retained_versions=2)
+
+    assert sorted(log._versions()) == [3, 4]
+    assert len(log.read()) == 5
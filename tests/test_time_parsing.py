@@ -0,0 +1,31 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from analytics.time_parsing import parse_heure
+
+
+def test_hh_mm_ss_and_hh_mm():
+    heure = pd.Series(['08:30:15', '8:05:00', '12:45', '7:10'])
+
+    assert parse_heure(heure).tolist() == [30615, 29100, 45900, 25800]
+
+
+def test_malformed_and_non_ascii_values_are_minus_one():
+    heure = pd.Series(['08h30', 'é', '25:00:00', '08:30:00:00', None, ''])
+
+    assert parse_heure(heure).tolist() == [-1] * 6
+
+
+def test_datetime_column_uses_time_of_day():
+    heure = pd.Series(pd.to_datetime(['2024-01-05 08:30:15', None]))
+
+    assert parse_heure(heure).tolist() == [30615, -1]
+
+
+def test_time_objects_and_hours():
+    times = pd.Series([datetime.time(9, 15), datetime.time(23, 59, 59, 500)], dtype=object)
+
+    assert parse_heure(times).tolist() == [33300, 86399]
+    assert parse_heure(pd.Series([7.5, np.nan, 30])).tolist() == [27000, -1, -1]